@@ -6,15 +6,18 @@ import os
 import json
 import logging
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Dict, List, Optional, Tuple
 import numpy as np
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, has_request_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 import redis
+import msgpack
+import orjson
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import cv2
 import pytesseract
 from PIL import Image
@@ -27,17 +30,47 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
 import joblib
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from transformers import pipeline
 try:
     import google.cloud.vision as vision
 except Exception:  # pragma: no cover
     vision = None
 from fuzzywuzzy import fuzz, process
-import schedule
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - Arrow responses are optional
+    pa = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd encoding is optional, gzip always works
+    zstandard = None
+from goal_simulation import simulate_goal
+from spending_insights import SpendingAnalytics, analyze_spending_batch
+import gzip
 import threading
 import time
 import hashlib
+import functools
+import socket
+import uuid
+import io
+import fcntl
+import queue
+import select
+import atexit
+import inspect
+import contextlib
+import multiprocessing
+import tempfile
+from collections import OrderedDict, defaultdict, deque
 from datetime import date
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+# Process pools start workers from a forkserver that preloads only the numpy
+# kernels, not this module (whose import starts threads and connections)
+multiprocessing.set_forkserver_preload(['goal_simulation', 'spending_insights'])
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -50,8 +83,203 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# ========================
+# Redis
+# ========================
+
+class LatencyHistogram:
+    """Log-bucketed latency counts per command, from 50us to ~13s"""
+
+    BOUNDS = 50e-6 * 2 ** np.arange(19)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = defaultdict(lambda: np.zeros(len(self.BOUNDS) + 1, dtype=np.int64))
+        self.totals = defaultdict(float)
+
+    def observe(self, command: str, seconds: float):
+        bucket = int(np.searchsorted(self.BOUNDS, seconds))
+        with self._lock:
+            self.counts[command][bucket] += 1
+            self.totals[command] += seconds
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = {c: v.copy() for c, v in self.counts.items()}
+            totals = dict(self.totals)
+        result = {}
+        for command, buckets in sorted(counts.items()):
+            calls = int(buckets.sum())
+            cumulative = np.cumsum(buckets) / calls
+            upper = np.append(self.BOUNDS, np.inf)
+            result[command] = {
+                'calls': calls,
+                'mean_ms': round(totals[command] / calls * 1000, 3),
+                **{f"p{q}_ms": round(float(upper[np.searchsorted(cumulative, q / 100)]) * 1000, 3)
+                   for q in (50, 90, 99)}
+            }
+        return result
+
+redis_latency = LatencyHistogram()
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            redis_latency.observe('PIPELINE', time.perf_counter() - started)
+
+class InstrumentedRedis(redis.Redis):
+    """redis.Redis that records every command's round trip in redis_latency"""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            redis_latency.observe(str(args[0]).upper(), time.perf_counter() - started)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+class RedisLayer:
+    """Per-process Redis connection pool plus batched and scripted helpers.
+
+    The pool is created lazily and again after a fork (gunicorn workers
+    must not share sockets with the master), so `client` can be imported
+    at module load and used from any worker. get_many/set_many batch keys
+    into one MGET or pipeline round trip; incr applies a counter and its
+    TTL atomically in Lua.
+    """
+
+    INCR_SCRIPT = """
+        if KEYS[2] and not redis.call('set', KEYS[2], 1, 'nx', 'px', ARGV[3]) then
+            return false
+        end
+        local value = redis.call('incrby', KEYS[1], ARGV[1])
+        if tonumber(ARGV[2]) > 0 and (value == tonumber(ARGV[1]) or redis.call('pttl', KEYS[1]) < 0) then
+            redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return value
+    """
+
+    HINCR_SCRIPT = """
+        local values = {}
+        for i = 1, #ARGV - 1, 2 do
+            values[#values + 1] = redis.call('hincrbyfloat', KEYS[1], ARGV[i], ARGV[i + 1])
+        end
+        if tonumber(ARGV[#ARGV]) > 0 then
+            redis.call('pexpire', KEYS[1], ARGV[#ARGV])
+        end
+        return values
+    """
+
+    def __init__(self, url: str, max_connections: int = 50, socket_timeout: float = 5.0,
+                 health_check_interval: int = 30, pool_factory=None):
+        self.url = url
+        self.max_connections = max_connections
+        self.socket_timeout = socket_timeout
+        self.health_check_interval = health_check_interval
+        self.pool_factory = pool_factory
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _make_pool(self) -> redis.ConnectionPool:
+        if self.pool_factory is not None:
+            return self.pool_factory()
+        return redis.ConnectionPool.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            socket_timeout=self.socket_timeout,
+            socket_keepalive=True,
+            health_check_interval=self.health_check_interval
+        )
+
+    @property
+    def client(self) -> InstrumentedRedis:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._client = InstrumentedRedis(connection_pool=self._make_pool())
+                    self._incr = self._client.register_script(self.INCR_SCRIPT)
+                    self._hincr = self._client.register_script(self.HINCR_SCRIPT)
+                    self._pid = os.getpid()
+        return self._client
+
+    def reset(self):
+        """Forget the inherited pool (without closing the parent's sockets)"""
+        self._pid = None
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[bytes]]:
+        if not keys:
+            return {}
+        return dict(zip(keys, self.client.mget(keys)))
+
+    def set_many(self, mapping: Dict[str, bytes], ttl: Optional[float] = None):
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, px=int(ttl * 1000) if ttl else None)
+        pipe.execute()
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None,
+             once: Optional[str] = None, once_ttl: float = 3600, client=None) -> Optional[int]:
+        """INCRBY, setting the TTL when the key is created (or has none).
+
+        With `once`, only the first caller to claim that marker key (kept for
+        `once_ttl` seconds) applies the increment; the others get None. The
+        script runs on `client` when given, else on this layer's pool.
+        """
+        scripts_client = self.client  # Creates the pool and scripts on first use in this process
+        value = self._incr(keys=[key] + ([once] if once else []),
+                           args=[amount, int((ttl or 0) * 1000), int(once_ttl * 1000)],
+                           client=client or scripts_client)
+        return None if value is None else int(value)
+
+    def hincr(self, key: str, amounts: Dict[str, float], ttl: Optional[float] = None,
+              client=None) -> Dict[str, float]:
+        """Add to several hash fields and refresh the TTL in one atomic step"""
+        scripts_client = self.client  # Creates the pool and scripts on first use in this process
+        args = [v for field, amount in amounts.items() for v in (field, amount)]
+        values = self._hincr(keys=[key], args=args + [int((ttl or 0) * 1000)],
+                             client=client or scripts_client)
+        return {field: float(v) for field, v in zip(amounts, values)}
+
+    def stats(self) -> Dict:
+        pool = self.client.connection_pool
+        return {
+            'pid': os.getpid(),
+            'pool': {
+                'max_connections': pool.max_connections,
+                'created': getattr(pool, '_created_connections', None),
+                'in_use': len(getattr(pool, '_in_use_connections', ())),
+                'idle': len(getattr(pool, '_available_connections', ()))
+            },
+            'commands': redis_latency.snapshot()
+        }
+
+class _RedisProxy:
+    """Module-level handle that always resolves to the current process's client"""
+
+    def __init__(self, layer: RedisLayer):
+        self._layer = layer
+
+    def __getattr__(self, name):
+        return getattr(self._layer.client, name)
+
+    def register_script(self, script: str) -> redis.commands.core.Script:
+        # Bind the script to the proxy, not to whichever client exists at import time
+        return redis.commands.core.Script(self, script)
+
+redis_layer = RedisLayer(
+    os.getenv('REDIS_URL', 'redis://localhost:6379'),
+    max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+)
+os.register_at_fork(after_in_child=redis_layer.reset)
+
 # Initialize services
-redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'))
+redis_client = _RedisProxy(redis_layer)
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
 # Initialize Google Vision client if available
@@ -135,12 +363,770 @@ class MLModels:
 
 ml_models = MLModels()
 
+# ========================
+# Caching
+# ========================
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used key.
+
+    With ttl set, entries also expire that many seconds after being put.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                expires_at, value = self._data[key]
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+def _pack_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)  # UUIDs and anything else psycopg2 hands back
+
+def pack(value) -> bytes:
+    return msgpack.packb(value, default=_pack_default, use_bin_type=True)
+
+def unpack(payload: bytes):
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+class CacheInvalidationBus:
+    """Redis pub/sub fan-out of invalidations to every process's local tier"""
+
+    def __init__(self, redis_conn, channel: str = 'cache:invalidate'):
+        self.redis = redis_conn
+        self.channel = channel
+        self.caches = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def publish(self, cache: str, keys=(), tags=()):
+        try:
+            self.redis.publish(self.channel, pack({'cache': cache, 'keys': list(keys), 'tags': list(tags)}))
+        except redis.RedisError as e:
+            logger.warning(f"Cache invalidation publish failed: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='cache-bus', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything published while we were disconnected is lost
+                for cache in self.caches.values():
+                    cache.local.clear()
+                backoff = 1.0
+                for message in pubsub.listen():
+                    event = unpack(message['data'])
+                    cache = self.caches.get(event['cache'])
+                    if cache is not None:
+                        cache.drop_local(event['keys'], event['tags'])
+            except Exception as e:
+                logger.warning(f"Cache invalidation bus disconnected: {e}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+class TieredCache:
+    """Read-through cache: bounded in-process LRU/TTL tier, then Redis, then the loader.
+
+    Values are msgpack-encoded with their expiry and recompute time. Reads
+    refresh probabilistically ahead of expiry (XFetch: the chance grows as
+    expiry nears and with how long the value took to compute). A Redis lock
+    lets a single caller recompute a key while the others serve the
+    previous value or wait briefly. Keys can carry tags; invalidating a tag
+    or key removes it from Redis and, over CacheInvalidationBus, from every
+    process's local tier.
+    """
+
+    def __init__(self, name: str, redis_conn=None, bus: Optional[CacheInvalidationBus] = None,
+                 ttl: float = 300, local_ttl: Optional[float] = 30, local_size: int = 10_000,
+                 beta: float = 1.0, lock_ttl: float = 30, lock_wait: float = 5):
+        self.name = name
+        self.redis = redis_conn
+        self.bus = bus
+        self.ttl = ttl
+        self.beta = beta
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self.local = LRUCache(local_size, ttl=min(local_ttl or ttl, ttl))
+        self.metrics = defaultdict(int)
+        self._local_tags = defaultdict(set)
+        self._generation = defaultdict(int)
+        if bus is not None:
+            bus.caches[name] = self
+
+    def _key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _early(self, entry: Dict, now: float) -> bool:
+        return now - entry['d'] * self.beta * np.log(np.random.random()) >= entry['e']
+
+    def _read(self, key: str, now: float) -> Tuple[Optional[Dict], bool]:
+        """(entry, fresh) from the local tier, then Redis"""
+        entry = self.local.get(key)
+        if entry is not None and not self._early(entry, now):
+            self.metrics['local_hits'] += 1
+            return entry, True
+        if self.redis is not None:
+            if self.bus is not None:
+                self.bus.start()
+            try:
+                payload = self.redis.get(self._key(key))
+            except redis.RedisError as e:
+                self.metrics['errors'] += 1
+                logger.warning(f"Cache {self.name} read failed: {e}")
+                payload = None
+            if payload is not None:
+                remote = unpack(payload)
+                if remote['e'] > now and not self._early(remote, now):
+                    self.metrics['redis_hits'] += 1
+                    self.local.put(key, remote)
+                    return remote, True
+                entry = remote if entry is None or remote['e'] > entry['e'] else entry
+        return (entry if entry is not None and entry['e'] > now else None), False
+
+    def _lock(self, key: str) -> bool:
+        if self.redis is None:
+            return True
+        try:
+            return bool(self.redis.set(self._key(key) + ':lock', os.getpid(), nx=True,
+                                       px=int(self.lock_ttl * 1000)))
+        except redis.RedisError:
+            return True
+
+    def _unlock(self, key: str):
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self._key(key) + ':lock')
+        except redis.RedisError:
+            pass
+
+    def _store(self, key: str, value, delta: float, ttl: Optional[float], tags, generation: int):
+        ttl = ttl or self.ttl
+        payload = pack({'v': value, 'e': time.time() + ttl, 'd': delta})
+        if self._generation[key] != generation:
+            # Invalidated while computing: don't cache the old result, but let the next reader compute
+            self._unlock(key)
+            return
+        self.local.put(key, unpack(payload))
+        for tag in tags:
+            self._local_tags[tag].add(key)
+        if self.redis is None:
+            return
+        redis_key = self._key(key)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.set(redis_key, payload, px=int(ttl * 1000))
+            for tag in tags:
+                pipe.sadd(f"cache:{self.name}:tag:{tag}", key)
+                pipe.expire(f"cache:{self.name}:tag:{tag}", int(ttl) + 60)
+            pipe.delete(redis_key + ':lock')
+            pipe.execute()
+        except redis.RedisError as e:
+            self.metrics['errors'] += 1
+            logger.warning(f"Cache {self.name} write failed: {e}")
+
+    def _plan(self, key: str):
+        """Decide how to serve a read: ('hit', value), ('stale', value), ('compute', None) or ('wait', None)"""
+        now = time.time()
+        entry, fresh = self._read(key, now)
+        if fresh:
+            return 'hit', entry['v']
+        if self._lock(key):
+            if entry is not None:
+                self.metrics['early_refreshes'] += 1
+            return 'compute', None
+        if entry is not None:
+            self.metrics['stale_hits'] += 1
+            return 'stale', entry['v']
+        return 'wait', None
+
+    def get_or_compute(self, key: str, loader, ttl: Optional[float] = None, tags=(), cache_if=None):
+        deadline = time.time() + self.lock_wait
+        while True:
+            action, value = self._plan(key)
+            if action in ('hit', 'stale'):
+                return value
+            if action == 'compute' or time.time() >= deadline:
+                break
+            self.metrics['lock_waits'] += 1
+            time.sleep(0.05)
+        generation, started = self._generation[key], time.time()
+        return self._compute(key, loader(), ttl, tags, cache_if, generation, started)
+
+    async def aget_or_compute(self, key: str, loader, ttl: Optional[float] = None, tags=(), cache_if=None):
+        deadline = time.time() + self.lock_wait
+        while True:
+            action, value = self._plan(key)
+            if action in ('hit', 'stale'):
+                return value
+            if action == 'compute' or time.time() >= deadline:
+                break
+            self.metrics['lock_waits'] += 1
+            await asyncio.sleep(0.05)
+        generation, started = self._generation[key], time.time()
+        return self._compute(key, await loader(), ttl, tags, cache_if, generation, started)
+
+    def _compute(self, key, value, ttl, tags, cache_if, generation, started):
+        self.metrics['misses'] += 1
+        if cache_if is None or cache_if(value):
+            self._store(key, value, time.time() - started, ttl, tags, generation)
+        else:
+            self._unlock(key)
+        # Hand callers the same shapes a cache hit would
+        return unpack(pack(value))
+
+    def drop_local(self, keys=(), tags=()):
+        for key in keys:
+            self._generation[key] += 1
+            self.local.delete(key)
+        for tag in tags:
+            for key in self._local_tags.pop(tag, ()):
+                self._generation[key] += 1
+                self.local.delete(key)
+
+    def invalidate(self, *keys: str):
+        keys = [str(k) for k in keys]
+        self.drop_local(keys)
+        if self.redis is not None:
+            try:
+                self.redis.delete(*[self._key(k) for k in keys])
+            except redis.RedisError as e:
+                logger.warning(f"Cache {self.name} invalidation failed: {e}")
+            if self.bus is not None:
+                self.bus.publish(self.name, keys=keys)
+
+    def invalidate_tags(self, *tags: str):
+        self.drop_local(tags=tags)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                for tag in tags:
+                    pipe.smembers(f"cache:{self.name}:tag:{tag}")
+                    pipe.delete(f"cache:{self.name}:tag:{tag}")
+                members = pipe.execute()[::2]
+                keys = {m.decode() if isinstance(m, bytes) else m for group in members for m in group}
+                if keys:
+                    self.redis.delete(*[self._key(k) for k in keys])
+            except redis.RedisError as e:
+                logger.warning(f"Cache {self.name} tag invalidation failed: {e}")
+            if self.bus is not None:
+                self.bus.publish(self.name, tags=tags)
+
+    def stats(self) -> Dict:
+        metrics = dict(self.metrics)
+        hits = metrics.get('local_hits', 0) + metrics.get('redis_hits', 0) + metrics.get('stale_hits', 0)
+        total = hits + metrics.get('misses', 0)
+        return {**metrics, 'hit_ratio': round(hits / total, 4) if total else None,
+                'local_size': len(self.local)}
+
+def _default_cache_key(fn, args, kwargs) -> str:
+    if args and hasattr(args[0], fn.__name__):
+        args = args[1:]  # methods: leave self out of the key
+    digest = hashlib.sha256(pack([list(args), kwargs])).hexdigest()[:32]
+    return f"{fn.__qualname__}:{digest}"
+
+def cached(cache: TieredCache, key=None, ttl: Optional[float] = None, tags=None, cache_if=None):
+    """Cache a function's (or coroutine's) results in `cache`.
+
+    key(*args, **kwargs) and tags(*args, **kwargs) get the call's arguments;
+    cache_if(result) can veto caching a result (errors, placeholders).
+    """
+    def decorator(fn):
+        def cache_args(args, kwargs):
+            cache_key = key(*args, **kwargs) if key else _default_cache_key(fn, args, kwargs)
+            return str(cache_key), (tags(*args, **kwargs) if tags else ())
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                cache_key, cache_tags = cache_args(args, kwargs)
+                return await cache.aget_or_compute(cache_key, lambda: fn(*args, **kwargs),
+                                                   ttl, cache_tags, cache_if)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                cache_key, cache_tags = cache_args(args, kwargs)
+                return cache.get_or_compute(cache_key, lambda: fn(*args, **kwargs),
+                                            ttl, cache_tags, cache_if)
+        wrapper.cache = cache
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+def cached_route(cache: TieredCache, ttl: Optional[float] = None, vary=('Accept',), tags=None):
+    """Cache successful responses of a Flask view by path, query string, body and `vary` headers"""
+    def decorator(view):
+        def cache_key():
+            parts = [request.path, sorted(request.args.items(multi=True)),
+                     [request.headers.get(h, '') for h in vary],
+                     hashlib.sha256(request.get_data()).hexdigest()]
+            return hashlib.sha256(pack(parts)).hexdigest()[:32]
+
+        def to_entry(response):
+            response = app.make_response(response)
+            return {'body': response.get_data(), 'status': response.status_code,
+                    'mimetype': response.mimetype, 'headers': dict(response.headers)}
+
+        def from_entry(entry):
+            response = app.response_class(entry['body'], status=entry['status'],
+                                          mimetype=entry['mimetype'])
+            for header, value in entry['headers'].items():
+                if header.lower() not in ('content-length', 'content-type'):
+                    response.headers[header] = value
+            return response
+
+        ok = lambda entry: entry['status'] == 200
+
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(*args, **kwargs):
+                async def load():
+                    return to_entry(await view(*args, **kwargs))
+                return from_entry(await cache.aget_or_compute(
+                    cache_key(), load, ttl, tags() if tags else (), ok))
+        else:
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return from_entry(cache.get_or_compute(
+                    cache_key(), lambda: to_entry(view(*args, **kwargs)), ttl,
+                    tags() if tags else (), ok))
+        return wrapper
+    return decorator
+
+cache_bus = CacheInvalidationBus(redis_client)
+CACHES = {
+    name: TieredCache(name, redis_client, cache_bus, ttl=ttl, local_ttl=local_ttl)
+    for name, ttl, local_ttl in (
+        ('receipts', 3600, 300),
+        ('group_profile', 3600, 60),
+        ('recommendations', 300, 30),
+        ('market_sentiment', 600, 60),
+        ('spending_insights', 300, 30)
+    )
+}
+# Pure function of the name: local tier only, never worth a network round trip
+CACHES['merchant_category'] = TieredCache('merchant_category', ttl=86400, local_size=50_000)
+
+# ========================
+# Response Serialisation
+# ========================
+
+MIMETYPE_MSGPACK = 'application/msgpack'
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def json_dumps(value) -> bytes:
+    """orjson with NumPy arrays/scalars, Decimal, datetime and UUID handled natively or by _pack_default"""
+    return orjson.dumps(value, default=_pack_default, option=JSON_OPTIONS)
+
+response_encode_latency = LatencyHistogram()
+
+class FastJSONProvider(JSONProvider):
+    """app.json backed by orjson, so jsonify() and request.json skip the stdlib encoder.
+
+    jsonify() also answers in msgpack when the client prefers it in Accept.
+    Keys keep insertion order (the default provider sorted them) and
+    datetimes are ISO 8601 rather than HTTP dates.
+    """
+
+    mimetype = 'application/json'
+
+    def dumps(self, obj, **kwargs) -> str:
+        return json_dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = self.mimetype
+        if has_request_context() and request.accept_mimetypes:
+            mimetype = request.accept_mimetypes.best_match(
+                [self.mimetype, MIMETYPE_MSGPACK], default=self.mimetype)
+
+        started = time.perf_counter()
+        body = pack(obj) if mimetype == MIMETYPE_MSGPACK else json_dumps(obj)
+        endpoint = request.endpoint if has_request_context() else None
+        response_encode_latency.observe(f"{endpoint or '-'} {mimetype}", time.perf_counter() - started)
+
+        response = self._app.response_class(body, mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
+
+class ResponseCompressor:
+    """after_request hook: zstd or gzip bodies of at least min_size bytes, as the client accepts"""
+
+    def __init__(self, min_size: int = 1024, gzip_level: int = 5, zstd_level: int = 3):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+
+    def encodings(self) -> List[str]:
+        return (['zstd'] if zstandard else []) + ['gzip']
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'zstd':
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(body)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def __call__(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings())
+        if not encoding or (response.content_length or 0) < self.min_size:
+            return response
+
+        body = self.compress(response.get_data(), encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+app.json = FastJSONProvider(app)
+response_compressor = ResponseCompressor(min_size=int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', 1024)))
+app.after_request(response_compressor)
+
+# ========================
+# Receipt Archive
+# ========================
+
+class ReceiptArchive:
+    """Stores every receipt image once in S3, keyed by the SHA-256 of the upload.
+
+    archive() returns the key straight away and uploads on a background
+    thread pool; a concurrent or repeated upload of the same image is a
+    no-op. Lossless formats (PNG, BMP, TIFF) are re-encoded as lossless
+    WebP, while JPEG and WebP are kept byte for byte so that re-OCR sees
+    exactly what the user sent. Images above multipart_threshold go up in
+    parallel multipart chunks.
+    """
+
+    LOSSLESS_FORMATS = {'PNG', 'BMP', 'TIFF', 'PPM'}
+    CONTENT_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp', 'PNG': 'image/png',
+                     'GIF': 'image/gif', 'HEIF': 'image/heif', 'MPO': 'image/jpeg'}
+
+    def __init__(self, s3, bucket: Optional[str], prefix: str = 'receipts/', workers: int = 4,
+                 multipart_threshold: int = 8 * 1024 * 1024, multipart_chunksize: int = 8 * 1024 * 1024):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.workers = workers
+        self.transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                              multipart_chunksize=multipart_chunksize,
+                                              max_concurrency=workers)
+        self.known = LRUCache(maxsize=100_000)  # Keys confirmed to exist in the bucket
+        self.metrics = defaultdict(int)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.bucket)
+
+    def key_for(self, digest: str) -> str:
+        return f"{self.prefix}{digest[:2]}/{digest}"
+
+    def archive(self, image_data: bytes, digest: Optional[str] = None) -> Optional[str]:
+        """Queue the image for upload and return its key (None when archiving is off)"""
+        if not self.enabled:
+            return None
+        digest = digest or hashlib.sha256(image_data).hexdigest()
+        key = self.key_for(digest)
+        with self._lock:
+            if self.known.get(key) or key in self._inflight:
+                self.metrics['deduplicated'] += 1
+                return key
+            self._inflight[key] = self._pool().submit(self._upload, key, image_data)
+        return key
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                thread_name_prefix='receipt-archive')
+            self._inflight = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def encode(self, image_data: bytes) -> Tuple[bytes, str, str]:
+        """(body, content type, original format); lossless formats become lossless WebP"""
+        try:
+            original = Image.open(io.BytesIO(image_data)).format or 'unknown'
+        except Exception:
+            return image_data, 'application/octet-stream', 'unknown'
+        if original in self.LOSSLESS_FORMATS:
+            img = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_UNCHANGED)
+            if img is not None:
+                ok, webp = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, 101])  # >100: lossless
+                if ok and len(webp) < len(image_data):
+                    return webp.tobytes(), 'image/webp', original
+        return image_data, self.CONTENT_TYPES.get(original, 'application/octet-stream'), original
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            # Without s3:ListBucket a missing key is a 403; uploading again is harmless
+            if e.response.get('Error', {}).get('Code') in ('403', '404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def _upload(self, key: str, image_data: bytes) -> str:
+        try:
+            if self.exists(key):
+                self.metrics['deduplicated'] += 1
+            else:
+                body, content_type, original = self.encode(image_data)
+                self.s3.upload_fileobj(
+                    io.BytesIO(body), self.bucket, key,
+                    ExtraArgs={'ContentType': content_type,
+                               'Metadata': {'sha256': key.rsplit('/', 1)[-1],
+                                            'original-format': original,
+                                            'original-bytes': str(len(image_data))}},
+                    Config=self.transfer_config
+                )
+                self.metrics['uploaded'] += 1
+                self.metrics['bytes_received'] += len(image_data)
+                self.metrics['bytes_stored'] += len(body)
+            self.known.put(key, True)
+            return key
+        except Exception as e:
+            self.metrics['failed'] += 1
+            logger.error(f"Receipt archive upload failed for {key}: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def load(self, key: str) -> bytes:
+        """The archived image bytes (WebP for images that arrived in a lossless format)"""
+        return self.s3.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def flush(self, timeout: Optional[float] = None):
+        """Wait for queued uploads, e.g. before a worker exits"""
+        with self._lock:
+            pending = list(self._inflight.values())
+        for future in pending:
+            try:
+                future.result(timeout)
+            except Exception:
+                pass  # Already logged
+
+    def stats(self) -> Dict:
+        return {**self.metrics, 'pending': len(self._inflight), 'bucket': self.bucket}
+
+receipt_archive = ReceiptArchive(
+    s3_client,
+    os.getenv('RECEIPT_ARCHIVE_BUCKET') or os.getenv('AWS_S3_BUCKET'),
+    prefix=os.getenv('RECEIPT_ARCHIVE_PREFIX', 'receipts/'),
+    workers=int(os.getenv('RECEIPT_ARCHIVE_WORKERS', 4))
+)
+atexit.register(receipt_archive.flush, 30)
+
+# ========================
+# OCR Store
+# ========================
+
+class OcrStore:
+    """Raw OCR output (text, word boxes, confidences) per image hash and engine version.
+
+    Parsing changes far more often than OCR does, so receipts can be
+    re-parsed from here at parser speed without fetching or decoding the
+    image. Words are stored column-wise in msgpack, in the same shape as
+    pytesseract's image_to_data dict. Lookups and writes degrade to misses
+    when Postgres is unavailable.
+    """
+
+    COLUMNS = 'image_hash, engine, method, text, words, confidence'
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+
+    @staticmethod
+    def decode(row) -> Dict:
+        return {'image_hash': row['image_hash'], 'engine': row['engine'], 'method': row['method'],
+                'text': row['text'], 'words': unpack(bytes(row['words'])),
+                'confidence': float(row['confidence'])}
+
+    def get(self, image_hash: str, engine: str) -> Optional[Dict]:
+        if not self.enabled:
+            return None
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute(f"SELECT {self.COLUMNS} FROM receipt_ocr_outputs "
+                            "WHERE image_hash = %s AND engine = %s", (image_hash, engine))
+                row = cur.fetchone()
+                return self.decode(row) if row else None
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            logger.warning(f"OCR store lookup failed: {e}")
+            return None
+
+    def get_many(self, image_hashes: List[str], engine: Optional[str] = None) -> Dict[str, Dict]:
+        """image hash -> OCR output (the most recent engine version unless one is given)"""
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT DISTINCT ON (image_hash) {self.COLUMNS}
+                FROM receipt_ocr_outputs
+                WHERE image_hash = ANY(%s) AND (%s::text IS NULL OR engine = %s)
+                ORDER BY image_hash, created_at DESC
+            """, (list(image_hashes), engine, engine))
+            return {row['image_hash']: self.decode(row) for row in cur.fetchall()}
+        finally:
+            conn.close()
+
+    def put(self, ocr: Dict):
+        if not self.enabled:
+            return
+        try:
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    INSERT INTO receipt_ocr_outputs
+                        (image_hash, engine, method, text, words, word_count, confidence)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (image_hash, engine) DO NOTHING
+                """, (ocr['image_hash'], ocr['engine'], ocr['method'], ocr['text'],
+                      psycopg2.Binary(pack(ocr['words'])), len(ocr['words'].get('text', [])),
+                      ocr['confidence']))
+                conn.commit()
+            finally:
+                conn.close()
+        except psycopg2.Error as e:
+            logger.warning(f"OCR store write failed: {e}")
+
+    def stream(self, engine: Optional[str] = None, chunk_rows: int = 5000):
+        """Lists of OCR outputs, latest engine version per image, read through a server-side cursor"""
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(name='receipt_ocr_outputs_stream')
+            cur.itersize = chunk_rows
+            cur.execute(f"""
+                SELECT DISTINCT ON (image_hash) {self.COLUMNS}
+                FROM receipt_ocr_outputs
+                WHERE %s::text IS NULL OR engine = %s
+                ORDER BY image_hash, created_at DESC
+            """, (engine, engine))
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                yield [self.decode(row) for row in rows]
+            cur.close()
+        finally:
+            conn.close()
+
+ocr_store = OcrStore(enabled=bool(os.getenv('DATABASE_URL')))
+
 # ========================
 # Receipt OCR & Processing
 # ========================
 
+def words_to_text(words: Dict) -> str:
+    """Text lines from OCR words, split where Tesseract's (block, paragraph, line) changes"""
+    lines, current = [], None
+    for i, word in enumerate(words['text']):
+        line = (words['block_num'][i], words['par_num'][i], words['line_num'][i])
+        if line != current:
+            lines.append([])
+            current = line
+        lines[-1].append(word)
+    return '\n'.join(' '.join(line) for line in lines)
+
+PRICE_TOKEN = re.compile(r'^[$€£]?(-?\d{1,6}[.,]\d{2})(-?)[A-Z]?$')
+QUANTITY_PREFIX = re.compile(r'^(\d{1,3})\s*(?:@|x|X)\s')
+# Summary rows, matched as whole words at the start of the label (in this order), so
+# item names such as MULTIPACK or CASHEWS are not mistaken for tip or tender lines
+TOTAL_LABELS = tuple((field, re.compile(rf'\s*(?:{pattern})\b')) for field, pattern in (
+    ('subtotal', r'sub\s*-?\s*total'),
+    ('tax', r'(?:(?:sales|state|local|total)\s+)?tax(?:es)?|hst|gst|vat'),
+    ('tip', r'tip|gratuity'),
+    ('total', r'(?:grand\s+|order\s+)?total(?!\s+(?:sav|disc))|amount\s+due|balance\s+due'),
+))
+# Tender and other summary rows anywhere in the label: never items, never totals
+NON_ITEM_LABELS = re.compile(r'\b(?:total|balance|change|cash|visa|mastercard|amex|debit|credit|'
+                             r'tender|you\s+saved|savings)\b')
+
 class ReceiptProcessor:
-    def __init__(self):
+    # OCR results below this confidence are sent to GPT-4 (unless the parse reconciles)
+    GPT4_THRESHOLD = 0.7
+
+    DATE_PATTERNS = [
+        r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
+        r'([A-Za-z]{3}\s+\d{1,2},?\s+\d{4})'
+    ]
+
+    def __init__(self, detect_region: bool = False, detect_size: int = 500, tile_height: int = 1600,
+                 tile_overlap: int = 80, tile_workers: Optional[int] = None,
+                 ocr_slots: Optional[int] = None, slot_dir: Optional[str] = None):
+        self.detect_region = detect_region
+        self.detect_size = detect_size  # Long side of the copy that region detection works on
+        # Images taller than 1.5 tiles are OCR'd in parallel strips (tile_height 0 disables)
+        self.tile_height = tile_height
+        self.tile_overlap = tile_overlap
+        self.tile_workers = tile_workers or os.cpu_count() or 1
+        # Tesseract processes running at once on this host, across requests, strips and workers
+        self.ocr_slots = ocr_slots or os.cpu_count() or 1
+        self.slot_dir = slot_dir or os.path.join(tempfile.gettempdir(), 'receipt-ocr-slots')
+        self._tile_executor = None
+        self._tile_pid = None
         self.merchant_patterns = {
             'restaurant': ['restaurant', 'cafe', 'coffee', 'pizza', 'burger', 'sushi', 'grill'],
             'grocery': ['market', 'grocery', 'foods', 'walmart', 'target', 'costco'],
@@ -156,18 +1142,35 @@ class ReceiptProcessor:
     
     async def process_receipt(self, image_data: bytes) -> Dict:
         """Process receipt image and extract structured data"""
+        image_hash = hashlib.sha256(image_data).hexdigest()
+        # Archived on every request, cache hit or not, so a failed upload is retried;
+        # and kept even when OCR fails, so it can be reprocessed later
+        image_key = receipt_archive.archive(image_data, image_hash)
+        result = dict(await self.extract_cached(image_data, image_hash))  # Not the cached object
+        result['image_hash'] = image_hash
+        result['image_key'] = image_key
+        return result
+
+    @cached(CACHES['receipts'], key=lambda self, image_data, digest: digest,
+            cache_if=lambda result: result.get('success', True) is not False)
+    async def extract_cached(self, image_data: bytes, digest: str) -> Dict:
+        """extract(), cached by image hash"""
+        return await self.extract(image_data, digest)
+
+    async def extract(self, image_data: bytes, digest: Optional[str] = None) -> Dict:
+        """OCR and parse one image"""
         try:
             # Try Google Vision first if available
             if GOOGLE_VISION_ENABLED:
-                result = await self.process_with_google_vision(image_data)
+                result = await self.process_with_google_vision(image_data, digest)
                 if result['success']:
                     return result
             
             # Fallback to Tesseract OCR
-            result = await self.process_with_tesseract(image_data)
+            result = await self.process_with_tesseract(image_data, digest)
             
             # Enhance with GPT-4 if needed
-            if result['confidence'] < 0.7:
+            if self.needs_gpt4(result):
                 result = await self.enhance_with_gpt4(result, image_data)
             
             return result
@@ -176,65 +1179,308 @@ class ReceiptProcessor:
             logger.error(f"Receipt processing error: {e}")
             return {'success': False, 'error': str(e)}
     
-    async def process_with_google_vision(self, image_data: bytes) -> Dict:
+    async def process_with_google_vision(self, image_data: bytes, digest: Optional[str] = None) -> Dict:
         """Use Google Cloud Vision API for OCR"""
         try:
             if not GOOGLE_VISION_ENABLED:
                 raise Exception("Google Vision disabled")
-            image = vision.Image(content=image_data)
-            response = vision_client.document_text_detection(image=image)
-            
-            if response.error.message:
-                raise Exception(response.error.message)
-            
-            text = response.full_text_annotation.text
-            
-            # Parse the extracted text
-            parsed_data = self.parse_receipt_text(text)
-            parsed_data['ocr_method'] = 'google_vision'
-            parsed_data['confidence'] = 0.9
-            parsed_data['success'] = True
-            
-            return parsed_data
+            return self.parse_ocr(self.run_ocr('google_vision', image_data, digest))
             
         except Exception as e:
             logger.error(f"Google Vision error: {e}")
             return {'success': False, 'error': str(e)}
     
-    async def process_with_tesseract(self, image_data: bytes) -> Dict:
+    async def process_with_tesseract(self, image_data: bytes, digest: Optional[str] = None) -> Dict:
         """Use Tesseract OCR for receipt processing"""
         try:
-            # Convert bytes to image
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            # Preprocess image
-            processed_img = self.preprocess_image(img)
-            
-            # Extract text using Tesseract
-            text = pytesseract.image_to_string(processed_img)
-            try:
-                data = pytesseract.image_to_data(processed_img, output_type=pytesseract.Output.DICT)
-                confidences = [int(conf) for conf in data.get('conf', []) if str(conf).isdigit() and int(conf) > 0]
-                avg_confidence = float(np.mean(confidences) / 100) if confidences else 0
-            except Exception:
-                avg_confidence = 0.7
-            
-            # Calculate confidence
-            
-            
-            # Parse extracted text
-            parsed_data = self.parse_receipt_text(text)
-            parsed_data['ocr_method'] = 'tesseract'
-            parsed_data['confidence'] = avg_confidence
-            parsed_data['success'] = True
-            
-            return parsed_data
+            return self.parse_ocr(self.run_ocr('tesseract', image_data, digest))
             
         except Exception as e:
             logger.error(f"Tesseract error: {e}")
             return {'success': False, 'error': str(e)}
     
+    @functools.cached_property
+    def ocr_engines(self) -> Dict[str, str]:
+        """Engine version strings for the OCR store; tesseract's covers preprocessing too"""
+        try:
+            tesseract = str(pytesseract.get_tesseract_version())
+        except Exception:
+            tesseract = 'unknown'
+        preprocess = hashlib.sha256(''.join(
+            [inspect.getsource(fn) for fn in (ReceiptProcessor.preprocess_image,
+                                              ReceiptProcessor.ocr_with_tesseract,
+                                              ReceiptProcessor.tesseract_pass,
+                                              ReceiptProcessor.detect_receipt_region,
+                                              ReceiptProcessor.crop_receipt,
+                                              ReceiptProcessor.find_tile_cuts,
+                                              ReceiptProcessor.image_to_data_tiled)]
+            + [str(self.detect_region), str(self.detect_size), str(self.tile_height),
+               str(self.tile_overlap), cv2.__version__]
+        ).encode()).hexdigest()[:8]
+        return {'tesseract': f"tesseract-{tesseract}-{preprocess}",
+                'google_vision': 'google_vision-document_text_detection'}
+    
+    def run_ocr(self, engine: str, image_data: bytes, digest: Optional[str] = None) -> Dict:
+        """Raw OCR output for the image, from the OCR store if this engine version has seen it"""
+        version = self.ocr_engines[engine]
+        digest = digest or hashlib.sha256(image_data).hexdigest()
+        ocr = ocr_store.get(digest, version)
+        if ocr is None:
+            extract = self.ocr_with_tesseract if engine == 'tesseract' else self.ocr_with_google_vision
+            ocr = {**extract(image_data), 'image_hash': digest, 'engine': version}
+            ocr_store.put(ocr)
+        return ocr
+    
+    def ocr_with_tesseract(self, image_data: bytes) -> Dict:
+        """Tesseract words with boxes and confidences, and the text rebuilt from them.
+
+        With detect_region, the receipt is cropped out of the photo first. A
+        wrong crop (a missed corner, text cut off) shows up as low confidence,
+        so below GPT4_THRESHOLD the uncropped photo is OCR'd too and the more
+        confident pass is kept.
+        """
+        # Convert bytes to image
+        nparr = np.frombuffer(image_data, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        
+        if not self.detect_region:
+            return self.tesseract_pass(img)
+        cropped, crop = self.crop_receipt(img)
+        ocr = self.tesseract_pass(cropped)
+        if crop['detected'] and ocr['confidence'] < self.GPT4_THRESHOLD:
+            full = self.tesseract_pass(img)
+            if full['confidence'] > ocr['confidence']:
+                return full
+        return ocr
+
+    def tesseract_pass(self, img) -> Dict:
+        """Preprocess and OCR one image (in strips when it is tall)"""
+        processed_img = self.preprocess_image(img)
+        
+        # Strips only pay off when they can run side by side
+        if self.tile_height and self.ocr_slots > 1 and processed_img.shape[0] > 1.5 * self.tile_height:
+            data = self.image_to_data_tiled(processed_img)
+        else:
+            with self.ocr_slot():
+                data = pytesseract.image_to_data(processed_img, output_type=pytesseract.Output.DICT)
+        keep = [i for i, text in enumerate(data['text']) if str(text).strip()]
+        words = {
+            'text': [str(data['text'][i]).strip() for i in keep],
+            **{field: [int(data[field][i]) for i in keep]
+               for field in ('left', 'top', 'width', 'height', 'block_num', 'par_num', 'line_num')},
+            'conf': [float(data['conf'][i]) for i in keep]
+        }
+        
+        confidences = [c for c in words['conf'] if c > 0]
+        return {
+            'method': 'tesseract',
+            'text': words_to_text(words),
+            'words': words,
+            'confidence': float(np.mean(confidences) / 100) if confidences else 0.0
+        }
+    
+    def find_tile_cuts(self, img) -> List[int]:
+        """Rows to split a tall binarised image at: about every tile_height, in the widest blank gap nearby"""
+        height = img.shape[0]
+        ink = np.count_nonzero(img < 128, axis=1)
+        blank = ink <= max(img.shape[1] // 500, 1)
+        window = self.tile_height // 4
+        cuts = []
+        target = self.tile_height
+        while target < height - self.tile_height // 2:
+            lo, hi = target - window, min(target + window, height)
+            edges = np.diff(np.concatenate(([0], blank[lo:hi].astype(np.int8), [0])))
+            starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            if len(starts):
+                widest = int(np.argmax(ends - starts))
+                cut = lo + (starts[widest] + ends[widest]) // 2
+            else:
+                cut = target  # No gap: the overlap has to cover the line we cut through
+            cuts.append(int(cut))
+            target = cut + self.tile_height
+        return cuts
+
+    @contextlib.contextmanager
+    def ocr_slot(self):
+        """Hold one of the host's ocr_slots (flock'd files in slot_dir) while Tesseract runs"""
+        os.makedirs(self.slot_dir, exist_ok=True)
+        while True:
+            for slot in range(self.ocr_slots):
+                f = open(os.path.join(self.slot_dir, f"slot-{slot}"), 'w')
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    f.close()
+                    continue
+                try:
+                    yield
+                finally:
+                    f.close()
+                return
+            time.sleep(0.01)
+
+    def _tile_pool(self) -> ThreadPoolExecutor:
+        # Tesseract runs as a subprocess, so threads are enough to use every core; ocr_slot
+        # keeps strips of concurrent receipts from running more Tesseracts than there are slots
+        if self._tile_pid != os.getpid():
+            self._tile_executor = ThreadPoolExecutor(max_workers=self.tile_workers,
+                                                     thread_name_prefix='ocr-tile')
+            self._tile_pid = os.getpid()
+        return self._tile_executor
+
+    def image_to_data_tiled(self, img) -> Dict:
+        """pytesseract.image_to_data for a tall image, OCR'd as overlapping strips in parallel.
+
+        Strips are cut at blank rows and padded by tile_overlap on each side.
+        Each word is kept only from the strip whose unpadded core contains
+        its vertical centre, so lines seen twice in an overlap come through
+        once. Boxes are shifted back to full-image coordinates, and block
+        numbers are offset per strip so that lines never merge across strips.
+        """
+        height = img.shape[0]
+        bounds = [0] + self.find_tile_cuts(img) + [height]
+        strips = [(max(core_top - self.tile_overlap, 0), min(core_bottom + self.tile_overlap, height),
+                   core_top, core_bottom)
+                  for core_top, core_bottom in zip(bounds[:-1], bounds[1:])]
+
+        def ocr_strip(strip):
+            top, bottom = strip[:2]
+            with self.ocr_slot():
+                return pytesseract.image_to_data(img[top:bottom], output_type=pytesseract.Output.DICT)
+
+        merged = defaultdict(list)
+        for index, ((top, _, core_top, core_bottom), data) in enumerate(
+                zip(strips, self._tile_pool().map(ocr_strip, strips))):
+            for i, text in enumerate(data['text']):
+                centre = top + int(data['top'][i]) + int(data['height'][i]) / 2
+                if not str(text).strip() or not core_top <= centre < core_bottom:
+                    continue
+                for field, values in data.items():
+                    merged[field].append(values[i])
+                merged['top'][-1] = int(merged['top'][-1]) + top
+                merged['block_num'][-1] = int(merged['block_num'][-1]) + 1000 * index
+        return dict(merged) if merged else {'text': []}
+
+    def ocr_with_google_vision(self, image_data: bytes) -> Dict:
+        """document_text_detection text plus word boxes (one 'line' per paragraph)"""
+        image = vision.Image(content=image_data)
+        response = vision_client.document_text_detection(image=image)
+        
+        if response.error.message:
+            raise Exception(response.error.message)
+        
+        words = defaultdict(list)
+        for page in response.full_text_annotation.pages:
+            for b, block in enumerate(page.blocks):
+                for p, paragraph in enumerate(block.paragraphs):
+                    for word in paragraph.words:
+                        xs = [v.x for v in word.bounding_box.vertices]
+                        ys = [v.y for v in word.bounding_box.vertices]
+                        words['text'].append(''.join(symbol.text for symbol in word.symbols))
+                        words['left'].append(min(xs))
+                        words['top'].append(min(ys))
+                        words['width'].append(max(xs) - min(xs))
+                        words['height'].append(max(ys) - min(ys))
+                        words['block_num'].append(b)
+                        words['par_num'].append(p)
+                        words['line_num'].append(0)
+                        words['conf'].append(round(word.confidence * 100, 2))
+        return {
+            'method': 'google_vision',
+            'text': response.full_text_annotation.text,
+            'words': dict(words),
+            'confidence': 0.9
+        }
+    
+    def parse_ocr(self, ocr: Dict) -> Dict:
+        """Structured receipt from raw OCR output; no image needed.
+
+        The layout parser is used when the output has word boxes and it
+        finds anything; plain text lines are the fallback.
+        """
+        parsed_data = None
+        if ocr.get('words', {}).get('text'):
+            parsed_data = self.parse_receipt_layout(ocr['words'])
+            if parsed_data is not None:
+                parsed_data['raw_text'] = ocr['text']
+        if parsed_data is None:
+            parsed_data = self.parse_receipt_text(ocr['text'])
+            parsed_data['parser'] = 'text'
+        parsed_data['ocr_method'] = ocr['method']
+        parsed_data['ocr_engine'] = ocr.get('engine')
+        parsed_data['confidence'] = ocr['confidence']
+        parsed_data['success'] = True
+        return parsed_data
+    
+    def detect_receipt_region(self, img) -> Optional[np.ndarray]:
+        """Corners (tl, tr, br, bl) of the receipt in full-resolution pixels, or None.
+
+        Works on a copy downscaled to detect_size. Paper is the bright
+        (Otsu) and unsaturated (which excludes hands) pixels, with Canny
+        edges as a fallback mask; the mask is closed to bridge the text.
+        The convex hull of the largest external contour is simplified to a
+        quadrilateral, or to its minimum-area rectangle if it will not
+        simplify (curled paper). Candidates under 10% of the frame, or
+        spanning it edge to edge (a bright table merged with the paper), are
+        rejected; a receipt running off one edge is kept. Paper filling
+        nearly all of the frame means there is nothing to crop.
+        """
+        h, w = img.shape[:2]
+        scale = self.detect_size / max(h, w)
+        small = cv2.resize(img, (max(int(w * scale), 1), max(int(h * scale), 1)),
+                           interpolation=cv2.INTER_AREA) if scale < 1 else img
+        scale = min(scale, 1.0)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        frame = gray.shape[0] * gray.shape[1]
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+
+        _, bright = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        paper = bright & np.where(cv2.cvtColor(small, cv2.COLOR_BGR2HSV)[..., 1] < 60, 255, 0).astype(np.uint8)
+        edges = cv2.dilate(cv2.Canny(gray, 50, 150), kernel)
+        for mask in (paper, edges):
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            if not contours:
+                continue
+            contour = max(contours, key=cv2.contourArea)
+            area = cv2.contourArea(contour) / frame
+            if area > 0.95:
+                return None  # Already just the receipt (a scan or a tight crop)
+            x, y, box_w, box_h = cv2.boundingRect(contour)
+            if area < 0.1 or (x <= 1 and x + box_w >= gray.shape[1] - 1) \
+                    or (y <= 1 and y + box_h >= gray.shape[0] - 1):
+                continue
+            hull = cv2.convexHull(contour)
+            for epsilon in (0.02, 0.04, 0.06):
+                quad = cv2.approxPolyDP(hull, epsilon * cv2.arcLength(hull, True), True)
+                if len(quad) == 4:
+                    break
+            else:
+                quad = cv2.boxPoints(cv2.minAreaRect(contour))
+            points = quad.reshape(4, 2).astype(np.float32) / scale
+            # Order corners: tl has the smallest x+y, br the largest; tr the smallest y-x
+            sums, diffs = points.sum(axis=1), np.diff(points, axis=1).ravel()
+            return np.array([points[np.argmin(sums)], points[np.argmin(diffs)],
+                             points[np.argmax(sums)], points[np.argmax(diffs)]], dtype=np.float32)
+        return None
+
+    def crop_receipt(self, img) -> Tuple[np.ndarray, Dict]:
+        """Perspective-corrected receipt, or the image unchanged when none is found"""
+        h, w = img.shape[:2]
+        corners = self.detect_receipt_region(img)
+        if corners is None:
+            return img, {'detected': False, 'pixels': h * w, 'cropped_pixels': h * w}
+        tl, tr, br, bl = corners
+        width = int(round(max(np.linalg.norm(tr - tl), np.linalg.norm(br - bl))))
+        height = int(round(max(np.linalg.norm(bl - tl), np.linalg.norm(br - tr))))
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                          dtype=np.float32)
+        warped = cv2.warpPerspective(img, cv2.getPerspectiveTransform(corners, target), (width, height),
+                                     flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return warped, {'detected': True, 'corners': corners.round(1).tolist(),
+                        'pixels': h * w, 'cropped_pixels': width * height}
+
     def preprocess_image(self, img):
         """Preprocess image for better OCR results"""
         # Convert to grayscale
@@ -332,14 +1578,8 @@ class ReceiptProcessor:
                     result['total'] = float(match.group(1))
         
         # Extract date
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-            r'([A-Za-z]{3}\s+\d{1,2},?\s+\d{4})'
-        ]
-        
         for line in lines:
-            for pattern in date_patterns:
+            for pattern in self.DATE_PATTERNS:
                 match = re.search(pattern, line)
                 if match:
                     result['date'] = match.group(1)
@@ -354,23 +1594,154 @@ class ReceiptProcessor:
         
         return result
     
-    def detect_merchant_category(self, merchant_name: str) -> str:
-        """Detect merchant category based on name"""
-        merchant_lower = merchant_name.lower()
-        
-        for category, keywords in self.merchant_patterns.items():
-            for keyword in keywords:
-                if keyword in merchant_lower:
-                    return category
-        
-        return 'other'
-    
-    async def enhance_with_gpt4(self, initial_result: Dict, image_data: bytes) -> Dict:
-        """Use GPT-4 Vision to enhance OCR results"""
-        try:
-            # Convert image to base64
-            import base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
+    def parse_receipt_layout(self, words: Dict) -> Optional[Dict]:
+        """Parse receipt words using their boxes rather than OCR's line order.
+
+        Words are grouped into rows by vertical centre (a new row starts
+        where the gap between sorted centres exceeds 0.6 median word heights).
+        The price column is the median right edge of each row's rightmost
+        price. A row's price is the one in that column, and its name is
+        every word to the left of it. Name-only rows carry over to a
+        following "2 @ 1.99" or price-only row. The result is `reconciled`
+        when the items, tax and tip add up to the printed total. Returns
+        None when no prices are found.
+        """
+        text = np.array(words['text'], dtype=object)
+        n = len(text)
+        if n == 0:
+            return None
+        left = np.asarray(words['left'], dtype=np.float64)
+        top = np.asarray(words['top'], dtype=np.float64)
+        width = np.asarray(words['width'], dtype=np.float64)
+        height = np.asarray(words['height'], dtype=np.float64)
+        line_height = max(float(np.median(height)), 1.0)
+
+        # Rows: cluster sorted vertical centres, then order each row left to right
+        centre = top + height / 2
+        order = np.argsort(centre, kind='stable')
+        row = np.empty(n, dtype=np.int64)
+        row[order] = np.concatenate(([0], np.cumsum(np.diff(centre[order]) > 0.6 * line_height)))
+        order = np.lexsort((left, row))
+        text, left, right, row = text[order], left[order], (left + width)[order], row[order]
+
+        prices = [PRICE_TOKEN.match(t) for t in text]
+        is_price = np.array([m is not None for m in prices])
+        amounts = np.array([(-1 if m.group(2) else 1) * float(m.group(1).replace(',', '.')) if m else 0.0
+                            for m in prices])
+        if not is_price.any():
+            return None
+
+        starts = np.flatnonzero(np.diff(row, prepend=-1))
+        ends = np.append(starts[1:], n)
+        last_price = np.maximum.reduceat(np.where(is_price, np.arange(n), -1), starts)
+        has_price = last_price >= 0
+        column = float(np.median(right[last_price[has_price]]))
+        # Price in the column per row (-1: none); amounts far left of it are unit prices or noise
+        row_price = np.where(has_price & (np.abs(right[np.maximum(last_price, 0)] - column)
+                                          <= 4 * line_height), last_price, -1)
+
+        result = {
+            'merchant_name': None,
+            'merchant_category': None,
+            'items': [],
+            'subtotal': 0,
+            'tax': 0,
+            'tip': 0,
+            'total': 0,
+            'date': None,
+            'parser': 'layout'
+        }
+        printed = {}
+        line_totals = []
+        pending_name = None
+        row_texts = []
+        for r, (lo, hi) in enumerate(zip(starts, ends)):
+            price_at = row_price[r]
+            label = ' '.join(text[lo:price_at if price_at >= 0 else hi])
+            row_texts.append(' '.join(text[lo:hi]))
+            label_lower = label.lower()
+
+            field = next((name for name, pattern in TOTAL_LABELS if pattern.match(label_lower)), None)
+            if field:
+                if price_at >= 0 or is_price[lo:hi].any():
+                    amount = amounts[price_at if price_at >= 0 else lo + np.flatnonzero(is_price[lo:hi])[-1]]
+                    printed.setdefault(field, round(float(amount), 2))
+                pending_name = None
+                continue
+            if NON_ITEM_LABELS.search(label_lower):
+                pending_name = None
+                continue
+
+            if price_at < 0:
+                # Item names wrapped onto their own row, priced on the next one
+                pending_name = label if re.search(r'[A-Za-z]{2}', label) else None
+                continue
+
+            quantity = 1
+            match = QUANTITY_PREFIX.match(label + ' ')
+            if match:
+                quantity = max(int(match.group(1)), 1)
+                label = label[match.end():].strip()
+                label = re.sub(r'^[$€£]?\d+[.,]\d{2}\s*', '', label)  # The unit price
+            if not re.search(r'[A-Za-z]{2}', label):
+                if not pending_name:
+                    continue
+                label = pending_name
+            pending_name = None
+
+            total = float(amounts[price_at])
+            line_totals.append(total)
+            result['items'].append({
+                'name': label.strip(),
+                'price': round(total / quantity, 2),
+                'quantity': quantity
+            })
+
+        for row_text in row_texts[:5]:
+            if len(row_text) > 3 and not any(char.isdigit() for char in row_text[:3]):
+                result['merchant_name'] = row_text.strip()
+                result['merchant_category'] = self.detect_merchant_category(row_text)
+                break
+        for row_text in row_texts:
+            match = next((m for m in (re.search(p, row_text) for p in self.DATE_PATTERNS) if m), None)
+            if match:
+                result['date'] = match.group(1)
+                break
+
+        items_total = round(sum(line_totals), 2)
+        result.update({field: printed.get(field, 0) for field in ('tax', 'tip')})
+        result['subtotal'] = printed.get('subtotal') or items_total
+        result['total'] = printed.get('total') or round(result['subtotal'] + result['tax'] + result['tip'], 2)
+        result['reconciled'] = bool(
+            result['items'] and 'total' in printed
+            and abs(items_total + result['tax'] + result['tip'] - printed['total']) < 0.015
+        )
+        if not result['items'] and not printed:
+            return None
+        return result
+
+    def needs_gpt4(self, result: Dict) -> bool:
+        """Low OCR confidence, unless the items already add up to the printed total"""
+        return result['confidence'] < self.GPT4_THRESHOLD and not result.get('reconciled')
+
+    @cached(CACHES['merchant_category'], key=lambda self, merchant_name: merchant_name.lower())
+    def detect_merchant_category(self, merchant_name: str) -> str:
+        """Detect merchant category based on name"""
+        merchant_lower = merchant_name.lower()
+        
+        for category, keywords in self.merchant_patterns.items():
+            for keyword in keywords:
+                if keyword in merchant_lower:
+                    return category
+        
+        return 'other'
+    
+    async def enhance_with_gpt4(self, initial_result: Dict, image_data: bytes) -> Dict:
+        """Use GPT-4 Vision to enhance OCR results"""
+        try:
+            # Convert image to base64
+            import base64
+            image_base64 = base64.b64encode(image_data).decode('utf-8')
             
             response = openai.ChatCompletion.create(
                 model="gpt-4-vision-preview",
@@ -412,336 +1783,3017 @@ class ReceiptProcessor:
             logger.error(f"GPT-4 enhancement error: {e}")
             return initial_result
 
-receipt_processor = ReceiptProcessor()
+    def pipeline_version(self) -> str:
+        """Changes whenever the local OCR path (code, patterns or Tesseract/OpenCV version) does"""
+        parts = [self.ocr_engines['tesseract']]  # Image handling, preprocessing and Tesseract
+        parts += [inspect.getsource(fn) for fn in (ReceiptProcessor.parse_ocr,
+                                                   ReceiptProcessor.parse_receipt_layout,
+                                                   ReceiptProcessor.parse_receipt_text)]
+        parts += [json.dumps(self.item_patterns), json.dumps(self.merchant_patterns),
+                  PRICE_TOKEN.pattern, json.dumps([[(field, pattern.pattern) for field, pattern in TOTAL_LABELS],
+                              NON_ITEM_LABELS.pattern])]
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()[:12]
+
+# Strips and concurrent receipts already run one Tesseract per core (ocr_slots); its OpenMP
+# threads on top would oversubscribe. pytesseract passes os.environ to every call
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+receipt_processor = ReceiptProcessor(
+    detect_region=os.getenv('RECEIPT_DETECT_REGION', '0') == '1',
+    tile_height=int(os.getenv('RECEIPT_TILE_HEIGHT', 1600)),
+    tile_overlap=int(os.getenv('RECEIPT_TILE_OVERLAP', 80)),
+    tile_workers=int(os.getenv('RECEIPT_TILE_WORKERS', 0)) or None,
+    ocr_slots=int(os.getenv('RECEIPT_OCR_SLOTS', 0)) or None
+)
 
 # ========================
-# Investment Analysis
+# Receipt Reprocessing
 # ========================
 
-class InvestmentAnalyzer:
-    def __init__(self):
+def reprocess_receipt_image(task: Dict) -> Dict:
+    """Tesseract OCR and parse of one archived image; runs in a pool worker"""
+    started = time.perf_counter()
+    result = asyncio.run(receipt_processor.process_with_tesseract(task['image'], task['digest']))
+    return {'key': task['key'], 'digest': task['digest'], 'result': result,
+            'seconds': time.perf_counter() - started}
+
+def _receipt_item_set(result: Dict) -> List[Tuple[str, float]]:
+    return sorted((re.sub(r'\W+', ' ', str(item.get('name') or '')).strip().lower(),
+                   round(float(item.get('price') or 0), 2))
+                  for item in result.get('items') or [])
+
+def diff_receipts(old: Dict, new: Dict) -> Dict:
+    """Field-by-field comparison of two parse results of the same receipt"""
+    old_items, new_items = _receipt_item_set(old), _receipt_item_set(new)
+    remaining = list(old_items)
+    matched = 0
+    for item in new_items:
+        if item in remaining:
+            remaining.remove(item)
+            matched += 1
+    item_f1 = (2 * matched / (len(old_items) + len(new_items))) if (old_items or new_items) else 1.0
+    old_total, new_total = float(old.get('total') or 0), float(new.get('total') or 0)
+    merchant_match = ((old.get('merchant_name') or '').strip().lower()
+                      == (new.get('merchant_name') or '').strip().lower())
+    total_match = abs(old_total - new_total) < 0.005
+    return {
+        'changed': not (merchant_match and total_match and item_f1 == 1.0
+                        and old.get('date') == new.get('date')),
+        'merchant_match': merchant_match,
+        'total_match': total_match,
+        'total_delta': round(new_total - old_total, 2),
+        'items_old': len(old_items),
+        'items_new': len(new_items),
+        'item_f1': round(item_f1, 4),
+        'confidence_delta': round(float(new.get('confidence') or 0) - float(old.get('confidence') or 0), 4)
+    }
+
+def reparse_receipt_batch(ocr_outputs: List[Dict]) -> Dict:
+    """Parse stored OCR outputs; runs in a pool worker"""
+    started = time.perf_counter()
+    results = [{**receipt_processor.parse_ocr(ocr), 'image_hash': ocr['image_hash']}
+                for ocr in ocr_outputs]
+    return {'results': results, 'seconds': time.perf_counter() - started}
+
+def summarise_receipt_diffs(diffs: List[Dict]) -> Dict:
+    if not diffs:
+        return {}
+    return {
+        'compared': len(diffs),
+        'changed': sum(d['changed'] for d in diffs),
+        'merchant_match_rate': round(float(np.mean([d['merchant_match'] for d in diffs])), 4),
+        'total_match_rate': round(float(np.mean([d['total_match'] for d in diffs])), 4),
+        'mean_item_f1': round(float(np.mean([d['item_f1'] for d in diffs])), 4),
+        'mean_confidence_delta': round(float(np.mean([d['confidence_delta'] for d in diffs])), 4)
+    }
+
+class S3ReceiptSource:
+    """Images in the receipt archive; the key's basename is the original upload's hash"""
+
+    def __init__(self, archive: ReceiptArchive, prefix: Optional[str] = None):
+        self.archive = archive
+        self.prefix = archive.prefix if prefix is None else prefix
+
+    def keys(self):
+        paginator = self.archive.s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.archive.bucket, Prefix=self.prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key']
+
+    def load(self, key: str) -> bytes:
+        return self.archive.load(key)
+
+    def digest(self, key: str, data: bytes) -> str:
+        return key.rsplit('/', 1)[-1]
+
+class DirectoryReceiptSource:
+    """Image files under a local directory (a bucket sync or a fixture corpus)"""
+
+    EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '')
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def keys(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1].lower() in self.EXTENSIONS:
+                    yield os.path.relpath(os.path.join(dirpath, filename), self.root)
+
+    def load(self, key: str) -> bytes:
+        with open(os.path.join(self.root, key), 'rb') as f:
+            return f.read()
+
+    def digest(self, key: str, data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+class ReceiptBackfill:
+    """Re-runs the local OCR pipeline over archived receipts and reports what changed.
+
+    Images are fetched `prefetch` ahead of processing by a thread pool and
+    OCR'd in a forkserver process pool (one worker per core by default). A result is
+    cached on disk under cache_dir/<pipeline version>/, so a rerun after an
+    interruption, or over an unchanged pipeline, skips OCR for those images.
+    New results are compared with a baseline (what bills.receipt_data
+    recorded at upload time, or a previous run's output) and summarised in
+    the returned report.
+    """
+
+    BASELINE_QUERY = """
+        SELECT receipt_data->>'image_hash' AS digest,
+               receipt_data - 'raw_text' AS result
+        FROM bills
+        WHERE receipt_data ? 'image_hash'
+    """
+
+    def __init__(self, processor: ReceiptProcessor, cache_dir: str = '.reocr-cache',
+                 workers: Optional[int] = None, fetchers: int = 8, prefetch: int = 32):
+        self.processor = processor
+        self.cache_dir = cache_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.fetchers = fetchers
+        self.prefetch = prefetch
+
+    def load_baselines(self, baseline: Optional[str]) -> Dict[str, Dict]:
+        """image hash -> earlier result, from 'db' (bills.receipt_data) or a previous run's JSONL"""
+        if not baseline:
+            return {}
+        if baseline == 'db':
+            conn = get_db_connection()
+            cur = conn.cursor()
+            try:
+                cur.execute(self.BASELINE_QUERY)
+                return {row['digest']: row['result'] for row in cur.fetchall()}
+            finally:
+                cur.close()
+                conn.close()
+        baselines = {}
+        with open(baseline) as f:
+            for line in f:
+                if line.strip():
+                    entry = orjson.loads(line)
+                    baselines[entry.get('image_hash') or entry.get('digest')] = entry['result']
+        return baselines
+
+    def _cache_path(self, version: str, digest: str) -> str:
+        return os.path.join(self.cache_dir, version, digest[:2], f"{digest}.json")
+
+    def _prefetched(self, source, keys):
+        """(key, bytes, fetch seconds) in key order, loading up to `prefetch` images ahead"""
+        def fetch(key):
+            started = time.perf_counter()
+            return source.load(key), time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=self.fetchers, thread_name_prefix='reocr-fetch') as pool:
+            window = deque()
+            for key in keys:
+                window.append((key, pool.submit(fetch, key)))
+                if len(window) >= self.prefetch:
+                    key, future = window.popleft()
+                    yield (key, *future.result())
+            while window:
+                key, future = window.popleft()
+                yield (key, *future.result())
+
+    def run(self, source, baseline: Optional[str] = None, limit: Optional[int] = None,
+            output: Optional[str] = None, force: bool = False) -> Dict:
+        version = self.processor.pipeline_version()
+        baselines = self.load_baselines(baseline)
+        keys = source.keys()
+        if limit:
+            keys = (key for _, key in zip(range(limit), keys))
+
+        report = defaultdict(int)
+        ocr_seconds, diffs, escalations = [], [], []
+        started = time.time()
+        out = open(output, 'w') if output else None
+        # Not fork: the prefetch threads (and boto3's) may hold locks the child would inherit.
+        # Forkserver workers import this module once each, without joining the scheduler
+        pool = ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context('forkserver')) if self.workers > 1 else None
+        pending = deque()
+
+        def finish(key: str, digest: str, result: Dict, cached: bool):
+            if not result.get('success', True):
+                report['failed'] += 1
+            else:
+                escalations.append(self.processor.needs_gpt4(result))
+            entry = {'key': key, 'image_hash': digest, 'cached': cached, 'result': result}
+            if digest in baselines:
+                entry['diff'] = diff_receipts(baselines[digest], result)
+                diffs.append(entry['diff'])
+            if out:
+                out.write(json_dumps(entry).decode() + '\n')
+
+        def collect(block: bool):
+            while pending and (block or pending[0].done() or len(pending) >= 2 * self.workers):
+                done = pending.popleft().result()
+                ocr_seconds.append(done['seconds'])
+                path = self._cache_path(version, done['digest'])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(json_dumps(done['result']))
+                os.replace(path + '.tmp', path)
+                report['processed'] += 1
+                finish(done['key'], done['digest'], done['result'], False)
+
         try:
-            self.sentiment_analyzer = pipeline("sentiment-analysis")
-        except Exception:
-            self.sentiment_analyzer = None
-        self.risk_profiles = {
-            'conservative': {
-                'stocks': 0.3,
-                'bonds': 0.5,
-                'cash': 0.2,
-                'risk_score': 2
-            },
-            'moderate': {
-                'stocks': 0.6,
-                'bonds': 0.3,
-                'cash': 0.1,
-                'risk_score': 5
-            },
-            'aggressive': {
-                'stocks': 0.8,
-                'bonds': 0.15,
-                'cash': 0.05,
-                'risk_score': 8
+            for key, data, fetch_seconds in self._prefetched(source, keys):
+                report['images'] += 1
+                report['bytes'] += len(data)
+                report['fetch_seconds'] += fetch_seconds
+                digest = source.digest(key, data)
+                path = self._cache_path(version, digest)
+                if not force and os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        finish(key, digest, orjson.loads(f.read()), True)
+                    report['cached'] += 1
+                    continue
+
+                task = {'key': key, 'digest': digest, 'image': data}
+                if pool is None:
+                    future = Future()
+                    future.set_result(reprocess_receipt_image(task))
+                else:
+                    future = pool.submit(reprocess_receipt_image, task)
+                pending.append(future)
+                collect(block=False)
+            collect(block=True)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if out:
+                out.close()
+
+        elapsed = time.time() - started
+        report = dict(report)
+        report.update(
+            pipeline_version=version,
+            seconds=round(elapsed, 3),
+            images_per_second=round(report.get('images', 0) / max(elapsed, 1e-9), 2),
+            mb_per_second=round(report.get('bytes', 0) / 1e6 / max(elapsed, 1e-9), 2),
+            fetch_seconds=round(report.get('fetch_seconds', 0), 3),
+            escalation_rate=round(float(np.mean(escalations)), 4) if escalations else None
+        )
+        if ocr_seconds:
+            report['ocr_ms'] = {f"p{q}": round(float(np.percentile(ocr_seconds, q)) * 1000, 1)
+                                for q in (50, 95, 99)}
+        report.update(summarise_receipt_diffs(diffs))
+        logger.info(f"Receipt backfill finished: {report}")
+        return report
+
+class ReceiptReparser:
+    """Structured results regenerated from stored OCR output, without OCR or image decoding"""
+
+    def __init__(self, processor: ReceiptProcessor, store: OcrStore, workers: Optional[int] = None,
+                 chunk_rows: int = 5000):
+        self.processor = processor
+        self.store = store
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_rows = chunk_rows
+
+    def reparse(self, image_hashes: List[str], engine: Optional[str] = None) -> Dict[str, Dict]:
+        outputs = self.store.get_many(image_hashes, engine)
+        return {digest: {**self.processor.parse_ocr(ocr), 'image_hash': digest}
+                for digest, ocr in outputs.items()}
+
+    def run(self, engine: Optional[str] = None, baseline: Optional[str] = None,
+            output: Optional[str] = None) -> Dict:
+        """Re-parse every stored OCR output (latest engine version per image) and diff against a baseline"""
+        baselines = receipt_backfill.load_baselines(baseline)
+        report = defaultdict(float)
+        diffs = []
+        started = time.time()
+        out = open(output, 'w') if output else None
+        # Forkserver, like ReceiptBackfill: this process holds a DB cursor and service threads
+        pool = ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context('forkserver')) if self.workers > 1 else None
+        pending = deque()
+
+        def collect(block: bool):
+            while pending and (block or len(pending) >= 2 * self.workers):
+                done = pending.popleft().result()
+                report['parse_seconds'] += done['seconds']
+                for result in done['results']:
+                    report['receipts'] += 1
+                    entry = {'image_hash': result['image_hash'], 'result': result}
+                    if result['image_hash'] in baselines:
+                        entry['diff'] = diff_receipts(baselines[result['image_hash']], result)
+                        diffs.append(entry['diff'])
+                    if out:
+                        out.write(json_dumps(entry).decode() + '\n')
+
+        try:
+            for chunk in self.store.stream(engine, self.chunk_rows):
+                if pool is None:
+                    future = Future()
+                    future.set_result(reparse_receipt_batch(chunk))
+                else:
+                    future = pool.submit(reparse_receipt_batch, chunk)
+                pending.append(future)
+                collect(block=False)
+            collect(block=True)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if out:
+                out.close()
+
+        elapsed = time.time() - started
+        report = {
+            'receipts': int(report['receipts']),
+            'seconds': round(elapsed, 3),
+            'receipts_per_second': round(report['receipts'] / max(elapsed, 1e-9), 1),
+            'parse_ms_per_receipt': round(report['parse_seconds'] * 1000 / max(report['receipts'], 1), 3),
+            **summarise_receipt_diffs(diffs)
+        }
+        logger.info(f"Receipt re-parse finished: {report}")
+        return report
+
+receipt_backfill = ReceiptBackfill(
+    receipt_processor,
+    cache_dir=os.getenv('REOCR_CACHE_DIR', '.reocr-cache'),
+    workers=int(os.getenv('REOCR_WORKERS', 0)) or None
+)
+receipt_reparser = ReceiptReparser(receipt_processor, ocr_store,
+                                   workers=int(os.getenv('REOCR_WORKERS', 0)) or None)
+
+# ========================
+# Market Data
+# ========================
+
+# Symbols quoted in market snapshots: the market overview plus every ticker
+# generate_recommendations can suggest, so recommendations always have prices
+MARKET_SYMBOLS = [
+    s.strip().upper() for s in os.getenv(
+        'MARKET_SYMBOLS',
+        'SPY,QQQ,VTI,BND,GLD,AAPL,GOOGL,MSFT,VOO,VIG,VXUS,ARKK,SOXX,ICLN,TIP'
+    ).split(',') if s.strip()
+]
+
+def _finite_or_none(value) -> Optional[float]:
+    """Coerce numpy/pandas scalars to a JSON-safe float"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if np.isfinite(value) else None
+
+HISTORY_COLUMNS = ['symbol', 'timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+def empty_history_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        'symbol': pd.Series(dtype=object),
+        'timestamp': pd.Series(dtype=np.int64),
+        'open': pd.Series(dtype=np.float64),
+        'high': pd.Series(dtype=np.float64),
+        'low': pd.Series(dtype=np.float64),
+        'close': pd.Series(dtype=np.float64),
+        'volume': pd.Series(dtype=np.float64),
+    })
+
+def normalise_history(symbol: str, hist: pd.DataFrame) -> pd.DataFrame:
+    """Convert a yfinance-style OHLCV frame into the long columnar layout"""
+    if hist is None or hist.empty or 'Close' not in hist:
+        return empty_history_frame()
+    hist = hist[hist['Close'].notna()]
+    index = pd.DatetimeIndex(hist.index)
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    return pd.DataFrame({
+        'symbol': symbol,
+        'timestamp': index.asi8 // 10**9,
+        'open': hist['Open'].to_numpy(dtype=np.float64),
+        'high': hist['High'].to_numpy(dtype=np.float64),
+        'low': hist['Low'].to_numpy(dtype=np.float64),
+        'close': hist['Close'].to_numpy(dtype=np.float64),
+        'volume': hist['Volume'].to_numpy(dtype=np.float64),
+    }, columns=HISTORY_COLUMNS)
+
+class YFinanceMarketDataSource:
+    """Quotes and OHLCV history from Yahoo Finance via yfinance"""
+    name = 'yfinance'
+
+    def fetch_history(self, symbol: str, period: str, interval: str) -> pd.DataFrame:
+        hist = yf.Ticker(symbol).history(period=period, interval=interval)
+        return normalise_history(symbol, hist)
+
+    def download_history(self, symbols: List[str], period: str, interval: str) -> pd.DataFrame:
+        """One bulk request for all symbols"""
+        raw = yf.download(symbols, period=period, interval=interval,
+                          group_by='ticker', auto_adjust=False,
+                          threads=False, progress=False)
+        if raw is None or raw.empty:
+            return empty_history_frame()
+        if not isinstance(raw.columns, pd.MultiIndex):
+            return normalise_history(symbols[0], raw)
+
+        present = set(raw.columns.get_level_values(0))
+        frames = [normalise_history(symbol, raw[symbol]) for symbol in symbols if symbol in present]
+        return pd.concat(frames, ignore_index=True) if frames else empty_history_frame()
+
+    def fetch_fundamentals(self, symbol: str) -> Dict:
+        info = yf.Ticker(symbol).info
+        return {
+            'pe_ratio': _finite_or_none(info.get('trailingPE', 0)),
+            'market_cap': info.get('marketCap', 0)
+        }
+
+# Rough calendar length of yfinance period strings, used by the fake source
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 30, '3mo': 91, '6mo': 182, 'ytd': 182,
+    '1y': 365, '2y': 730, '5y': 1826, '10y': 3652, 'max': 7305
+}
+INTERVAL_SECONDS = {
+    '1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800, '60m': 3600,
+    '90m': 5400, '1h': 3600, '1d': 86400, '5d': 432000, '1wk': 604800,
+    '1mo': 2592000, '3mo': 7776000
+}
+
+class FakeMarketDataSource:
+    """Deterministic offline market data for local development and tests.
+
+    ``latency`` simulates the network round trip of each remote call.
+    """
+    name = 'fake'
+
+    def __init__(self, latency: float = 0.0, seed: int = 0, max_bars: int = 100_000):
+        self.latency = latency
+        self.seed = seed
+        self.max_bars = max_bars
+        self.calls = 0
+
+    def _rng(self, symbol: str) -> np.random.Generator:
+        digest = hashlib.md5(f"{self.seed}:{symbol}".encode()).digest()
+        return np.random.default_rng(int.from_bytes(digest[:8], 'little'))
+
+    def _history(self, symbol: str, period: str, interval: str,
+                 end: Optional[int] = None) -> pd.DataFrame:
+        step = INTERVAL_SECONDS.get(interval, 86400)
+        bars = min(max(PERIOD_DAYS.get(period, 365) * 86400 // step, 1), self.max_bars)
+        end = end if end is not None else int(time.time()) // step * step
+        timestamps = end - step * np.arange(bars - 1, -1, -1, dtype=np.int64)
+
+        # Price is a fixed function of the bar index so overlapping requests agree
+        rng = self._rng(symbol)
+        base = np.log(rng.uniform(20, 500))
+        freqs = rng.uniform(0.001, 0.5, 8)
+        phases = rng.uniform(0, 2 * np.pi, 8)
+        amps = 0.004 / np.sqrt(freqs)
+        index = (timestamps // step).astype(np.float64)
+        log_close = base + np.sin(np.outer(index, freqs) + phases) @ amps
+        log_open = base + np.sin(np.outer(index - 1, freqs) + phases) @ amps
+        close, open_ = np.exp(log_close), np.exp(log_open)
+        spread = np.abs(log_close - log_open) * close * 0.5
+        return pd.DataFrame({
+            'symbol': symbol,
+            'timestamp': timestamps,
+            'open': open_,
+            'high': np.maximum(open_, close) + spread,
+            'low': np.minimum(open_, close) - spread,
+            'close': close,
+            'volume': np.round(rng.uniform(1e5, 5e7) * (1 + np.abs(log_close - log_open) * 20)),
+        }, columns=HISTORY_COLUMNS)
+
+    def fetch_history(self, symbol: str, period: str, interval: str) -> pd.DataFrame:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._history(symbol, period, interval)
+
+    def download_history(self, symbols: List[str], period: str, interval: str) -> pd.DataFrame:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        frames = [self._history(symbol, period, interval) for symbol in symbols]
+        return pd.concat(frames, ignore_index=True) if frames else empty_history_frame()
+
+    def fetch_fundamentals(self, symbol: str) -> Dict:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rng = self._rng(symbol)
+        return {
+            'pe_ratio': round(float(rng.uniform(8, 40)), 2),
+            'market_cap': int(rng.integers(10**9, 3 * 10**12))
+        }
+
+MARKET_DATA_SOURCES = {
+    'yfinance': YFinanceMarketDataSource,
+    'fake': FakeMarketDataSource,
+}
+
+class MarketDataClient:
+    """Fetches many symbols at once from a market data source.
+
+    History for all symbols is requested in one bulk download when the source
+    supports it, otherwise per symbol on a thread pool capped at
+    ``max_workers`` concurrent requests. Identical requests already in flight
+    in this process are shared rather than repeated. Results come back as a
+    single long frame with ``HISTORY_COLUMNS``.
+    """
+
+    def __init__(self, source, max_workers: int = 8, bulk: bool = True):
+        self.source = source
+        self.bulk = bulk and hasattr(source, 'download_history')
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='market-data')
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    def _shared(self, key: tuple, fn):
+        """Run fn once for concurrent callers asking for the same key"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def _fetch_one(self, symbol: str, period: str, interval: str) -> pd.DataFrame:
+        try:
+            return self.source.fetch_history(symbol, period, interval)
+        except Exception as e:
+            logger.warning(f"Failed to fetch history for {symbol}: {e}")
+            return empty_history_frame()
+
+    def _fetch_history(self, symbols: List[str], period: str, interval: str) -> pd.DataFrame:
+        if self.bulk and len(symbols) > 1:
+            try:
+                return self.source.download_history(symbols, period, interval)
+            except Exception as e:
+                logger.warning(f"Bulk history download failed, fetching per symbol: {e}")
+
+        frames = list(self.executor.map(
+            lambda symbol: self._fetch_one(symbol, period, interval), symbols
+        ))
+        frames = [f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else empty_history_frame()
+
+    def history(self, symbols: List[str], period: str = '1mo',
+                interval: str = '1d') -> pd.DataFrame:
+        """OHLCV bars for all symbols as one long frame"""
+        symbols = sorted(set(symbols))
+        if not symbols:
+            return empty_history_frame()
+        key = ('history', tuple(symbols), period, interval)
+        return self._shared(key, lambda: self._fetch_history(symbols, period, interval))
+
+    def fundamentals(self, symbols: List[str]) -> Dict[str, Dict]:
+        def _one(symbol):
+            try:
+                return symbol, self.source.fetch_fundamentals(symbol)
+            except Exception as e:
+                logger.warning(f"Failed to fetch fundamentals for {symbol}: {e}")
+                return symbol, {}
+
+        symbols = sorted(set(symbols))
+        key = ('fundamentals', tuple(symbols))
+        return self._shared(key, lambda: dict(self.executor.map(_one, symbols)))
+
+    def quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Latest quote per symbol derived from one month of daily bars"""
+        frame = self.history(symbols, period='1mo', interval='1d')
+        fundamentals = self.fundamentals(symbols)
+
+        quotes = {}
+        for symbol, bars in frame.groupby('symbol', sort=False):
+            close = bars['close'].to_numpy()
+            returns = np.diff(close) / close[:-1] if len(close) > 1 else np.array([])
+            quotes[symbol] = {
+                'current_price': _finite_or_none(close[-1]),
+                'day_change': _finite_or_none(returns[-1] * 100) if len(returns) else 0,
+                'volume': int(bars['volume'].iloc[-1]) if np.isfinite(bars['volume'].iloc[-1]) else 0,
+                'volatility': _finite_or_none(returns.std(ddof=1) * np.sqrt(252)) if len(returns) > 1 else None,
+                **fundamentals.get(symbol, {})
             }
+        return quotes
+
+class MarketDataCache:
+    """Shared market snapshot stored in Redis, served stale-while-revalidate.
+
+    The scheduler refreshes the snapshot in the background; request handlers
+    only ever read it. A stale or missing snapshot triggers an asynchronous
+    refresh (one per cluster, guarded by a Redis lock) and the current data is
+    returned immediately together with its freshness metadata.
+    """
+
+    def __init__(self, redis_conn, client: 'MarketDataClient', symbols: List[str],
+                 key: str = 'market:snapshot',
+                 fresh_ttl: int = 900, max_stale: int = 86400,
+                 lock_ttl: int = 120):
+        self.redis = redis_conn
+        self.client = client
+        self.symbols = symbols
+        self.key = key
+        self.lock_key = f"{key}:refresh_lock"
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.lock_ttl = lock_ttl
+
+    def refresh(self) -> Dict:
+        """Fetch quotes from the source and publish them to Redis"""
+        started = time.time()
+        quotes = self.client.quotes(self.symbols)
+        if not quotes:
+            raise RuntimeError(f"{self.client.source.name} returned no quotes")
+
+        snapshot = {
+            'fetched_at': time.time(),
+            'source': self.client.source.name,
+            'fetch_seconds': round(time.time() - started, 3),
+            'quotes': quotes
         }
-    
-    async def get_recommendations(self, group_id: str, amount: float) -> Dict:
-        """Get investment recommendations for a group"""
+        self.redis.setex(self.key, self.max_stale, json.dumps(snapshot))
+        logger.info(f"Market snapshot refreshed: {len(quotes)} symbols "
+                    f"from {self.client.source.name} in {snapshot['fetch_seconds']}s")
+        return snapshot
+
+    def refresh_async(self) -> bool:
+        """Start a background refresh unless one is already running somewhere"""
         try:
-            # Get group profile
-            group_profile = await self.get_group_profile(group_id)
-            
-            # Get market data
-            market_data = await self.get_market_data()
-            
-            # Generate recommendations
-            recommendations = self.generate_recommendations(
-                group_profile,
-                amount,
-                market_data
-            )
-            
-            # Add AI insights
-            recommendations['ai_insights'] = await self.generate_ai_insights(
-                group_profile,
-                recommendations,
-                market_data
-            )
-            
-            return recommendations
-            
+            if not self.redis.set(self.lock_key, os.getpid(), nx=True, ex=self.lock_ttl):
+                return False
         except Exception as e:
-            logger.error(f"Investment analysis error: {e}")
-            return {'error': str(e)}
-    
-    async def get_group_profile(self, group_id: str) -> Dict:
-        """Get group investment profile from database"""
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
+            logger.warning(f"Market snapshot lock unavailable: {e}")
+            return False
+
+        def _run():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Market snapshot refresh error: {e}")
+            finally:
+                try:
+                    self.redis.delete(self.lock_key)
+                except Exception:
+                    pass
+
+        threading.Thread(target=_run, daemon=True).start()
+        return True
+
+    def get_snapshot(self) -> Tuple[Dict[str, Dict], Dict]:
+        """Return (quotes, freshness) without ever waiting on the network"""
         try:
-            # Get group details
-            cur.execute("""
-                SELECT g.*, 
-                       COUNT(DISTINCT gm.user_id) as member_count,
-                       AVG(u.lifetime_invested) as avg_member_investment
-                FROM groups g
-                JOIN group_members gm ON g.id = gm.group_id
-                JOIN users u ON gm.user_id = u.id
-                WHERE g.id = %s
-                GROUP BY g.id
-            """, (group_id,))
-            
-            group = cur.fetchone()
-            
-            # Get investment history
-            cur.execute("""
-                SELECT symbol, type, SUM(shares) as total_shares, 
-                       AVG(average_cost) as avg_cost
-                FROM investments
-                WHERE group_id = %s
-                GROUP BY symbol, type
-            """, (group_id,))
-            
-            holdings = cur.fetchall()
-            
-            return {
-                'group': dict(group) if group else {},
-                'holdings': [dict(h) for h in holdings],
-                'risk_profile': group['investment_strategy'] if group else 'moderate'
+            raw = self.redis.get(self.key)
+        except Exception as e:
+            logger.warning(f"Market snapshot read error: {e}")
+            raw = None
+
+        if not raw:
+            self.refresh_async()
+            return {}, {
+                'status': 'missing',
+                'source': self.client.source.name,
+                'fetched_at': None,
+                'age_seconds': None,
+                'stale': True
             }
-            
-        finally:
-            cur.close()
-            conn.close()
-    
-    async def get_market_data(self) -> Dict:
-        """Fetch current market data"""
+
+        snapshot = json.loads(raw)
+        age = max(time.time() - snapshot['fetched_at'], 0)
+        stale = age > self.fresh_ttl
+        if stale:
+            self.refresh_async()
+
+        return snapshot['quotes'], {
+            'status': 'stale' if stale else 'fresh',
+            'source': snapshot.get('source'),
+            'fetched_at': datetime.utcfromtimestamp(snapshot['fetched_at']).isoformat() + 'Z',
+            'age_seconds': round(age, 1),
+            'stale': stale
+        }
+
+market_data_client = MarketDataClient(
+    MARKET_DATA_SOURCES[os.getenv('MARKET_DATA_SOURCE', 'yfinance')](),
+    max_workers=int(os.getenv('MARKET_DATA_MAX_WORKERS', 8))
+)
+
+market_data_cache = MarketDataCache(
+    redis_client,
+    market_data_client,
+    MARKET_SYMBOLS,
+    fresh_ttl=int(os.getenv('MARKET_DATA_FRESH_TTL', 900)),
+    max_stale=int(os.getenv('MARKET_DATA_MAX_STALE', 86400))
+)
+
+# ========================
+# Market History Store
+# ========================
+
+SYMBOL_PATTERN = re.compile(r'^[A-Z0-9.^=\-]{1,15}$')
+
+# How far back the first download for a series goes; yfinance caps intraday history
+BACKFILL_PERIODS = {
+    '1m': '5d', '2m': '1mo', '5m': '1mo', '15m': '1mo', '30m': '1mo', '90m': '1mo',
+    '60m': '2y', '1h': '2y'
+}
+TAIL_PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'max']
+
+class OHLCVStore:
+    """Append-only OHLCV series on local disk, one directory per interval/symbol.
+
+    Each column is a raw little-endian file (int64 timestamps, float64 values)
+    read back through np.memmap, so a range query is two binary searches and
+    a handful of zero-copy slices. Column files only ever grow; the number of
+    valid bars is published separately in a `length` file once the columns
+    are written, so a reader's map never extends past the end of a file.
+    """
+    COLUMNS = {
+        'timestamp': '<i8',
+        'open': '<f8',
+        'high': '<f8',
+        'low': '<f8',
+        'close': '<f8',
+        'volume': '<f8',
+    }
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _series_dir(self, symbol: str, interval: str) -> str:
+        if not SYMBOL_PATTERN.match(symbol) or interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Invalid series {symbol}/{interval}")
+        return os.path.join(self.root, interval, symbol)
+
+    def _length(self, series_dir: str) -> int:
+        try:
+            with open(os.path.join(series_dir, 'length'), 'rb') as f:
+                return int.from_bytes(f.read(8), 'little')
+        except FileNotFoundError:
+            pass
+
+        # Stores written before the length file: the shortest column is authoritative
+        lengths = []
+        for column, dtype in self.COLUMNS.items():
+            path = os.path.join(series_dir, f"{column}.bin")
+            if not os.path.exists(path):
+                return 0
+            lengths.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(lengths)
+
+    def _column(self, series_dir: str, column: str, length: int) -> np.ndarray:
+        return np.memmap(os.path.join(series_dir, f"{column}.bin"),
+                         dtype=self.COLUMNS[column], mode='r', shape=(length,))
+
+    def last_timestamp(self, symbol: str, interval: str) -> Optional[int]:
+        series_dir = self._series_dir(symbol, interval)
+        length = self._length(series_dir)
+        if not length:
+            return None
+        return int(self._column(series_dir, 'timestamp', length)[-1])
+
+    def read(self, symbol: str, interval: str, start: Optional[int] = None,
+             end: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """Bars with start <= timestamp <= end as read-only column arrays"""
+        series_dir = self._series_dir(symbol, interval)
+        length = self._length(series_dir)
+        if not length:
+            return {column: np.empty(0, dtype=dtype) for column, dtype in self.COLUMNS.items()}
+
+        timestamps = self._column(series_dir, 'timestamp', length)
+        lo = int(np.searchsorted(timestamps, start, 'left')) if start is not None else 0
+        hi = int(np.searchsorted(timestamps, end, 'right')) if end is not None else length
+        return {
+            column: self._column(series_dir, column, length)[lo:hi]
+            for column in self.COLUMNS
+        }
+
+    def _set_length(self, series_dir: str, length: int):
+        path = os.path.join(series_dir, 'length')
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(int(length).to_bytes(8, 'little'))
+        os.replace(f"{path}.tmp", path)
+
+    def write(self, symbol: str, interval: str, bars: pd.DataFrame) -> int:
+        """Merge bars into the series, replacing any stored bars they overlap.
+
+        The new bars become the tail: everything stored from the first new
+        timestamp onwards is replaced (the whole series if they start at or
+        before the first stored bar). Returns the number of bars written.
+        """
+        bars = bars.sort_values('timestamp').drop_duplicates('timestamp', keep='last')
+        if bars.empty:
+            return 0
+
+        series_dir = self._series_dir(symbol, interval)
+        os.makedirs(series_dir, exist_ok=True)
+        with open(os.path.join(series_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            length = self._length(series_dir)
+            keep = 0
+            if length:
+                timestamps = self._column(series_dir, 'timestamp', length)
+                keep = int(np.searchsorted(timestamps, bars['timestamp'].iloc[0], 'left'))
+                del timestamps
+
+            # Overwrite in place and never truncate, so concurrent readers'
+            # memory maps never point past the end of the file
+            for column, dtype in self.COLUMNS.items():
+                path = os.path.join(series_dir, f"{column}.bin")
+                with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                    f.seek(keep * np.dtype(dtype).itemsize)
+                    f.write(bars[column].to_numpy(dtype=dtype).tobytes())
+            self._set_length(series_dir, keep + len(bars))
+        return len(bars)
+
+    def synced_at(self, symbol: str, interval: str) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self._series_dir(symbol, interval), '.synced'))
+        except OSError:
+            return 0.0
+
+    def mark_synced(self, symbol: str, interval: str):
+        series_dir = self._series_dir(symbol, interval)
+        os.makedirs(series_dir, exist_ok=True)
+        with open(os.path.join(series_dir, '.synced'), 'w'):
+            pass
+
+class MarketHistoryService:
+    """Serves OHLCV history from the local store, downloading only missing tails"""
+
+    def __init__(self, store: OHLCVStore, client: 'MarketDataClient', sync_ttl: int = 900):
+        self.store = store
+        self.client = client
+        self.sync_ttl = sync_ttl
+
+    @staticmethod
+    def _tail_period(missing_seconds: float) -> str:
+        for period in TAIL_PERIODS:
+            if PERIOD_DAYS[period] * 86400 >= missing_seconds:
+                return period
+        return 'max'
+
+    @staticmethod
+    def period_start(period: str, now: Optional[float] = None) -> Optional[int]:
+        now = now or time.time()
+        if period == 'max':
+            return None
+        if period == 'ytd':
+            return int(datetime(datetime.utcfromtimestamp(now).year, 1, 1).timestamp())
+        return int(now - PERIOD_DAYS.get(period, 365) * 86400)
+
+    def sync(self, symbols: List[str], interval: str):
+        """Bring the stored series up to date with as few downloads as possible"""
+        now = time.time()
+        step = INTERVAL_SECONDS[interval]
+        ttl = min(self.sync_ttl, step)
+
+        batches = defaultdict(list)
+        for symbol in symbols:
+            if now - self.store.synced_at(symbol, interval) < ttl:
+                continue
+            last = self.store.last_timestamp(symbol, interval)
+            if last is None:
+                batches[BACKFILL_PERIODS.get(interval, 'max')].append(symbol)
+            else:
+                # Refetch from the last stored bar, which may have been partial
+                batches[self._tail_period(now - last + step)].append(symbol)
+
+        for period, batch in batches.items():
+            frame = self.client.history(batch, period=period, interval=interval)
+            # Symbols the source returned nothing for (e.g. a transient failure) stay due
+            for symbol, bars in frame.groupby('symbol', sort=False):
+                if self.store.write(symbol, interval, bars):
+                    self.store.mark_synced(symbol, interval)
+
+    def get(self, symbols: List[str], period: str, interval: str) -> Dict[str, Dict[str, np.ndarray]]:
+        try:
+            self.sync(symbols, interval)
+        except Exception as e:
+            logger.warning(f"History sync failed, serving stored bars: {e}")
+
+        start = self.period_start(period)
+        return {symbol: self.store.read(symbol, interval, start=start) for symbol in symbols}
+
+market_history_service = MarketHistoryService(
+    OHLCVStore(os.getenv('MARKET_STORE_DIR', 'data/market')),
+    market_data_client,
+    sync_ttl=int(os.getenv('MARKET_DATA_FRESH_TTL', 900))
+)
+
+# ========================
+# Market History Encoding
+# ========================
+
+HISTORY_FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+MIMETYPE_JSON = 'application/json'
+MIMETYPE_COLUMNAR = 'application/octet-stream'
+MIMETYPE_ARROW = 'application/vnd.apache.arrow.stream'
+HISTORY_FORMATS = {'json': MIMETYPE_JSON, 'binary': MIMETYPE_COLUMNAR, 'arrow': MIMETYPE_ARROW,
+                   'msgpack': MIMETYPE_MSGPACK}
+
+COLUMNAR_MAGIC = b'CCH1'
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of the points that keep the shape of y"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    widths = np.diff(bounds)
+    avg_x = np.append(np.add.reduceat(x[:n - 1], bounds[:-1]) / widths, x[-1])
+    avg_y = np.append(np.add.reduceat(y[:n - 1], bounds[:-1]) / widths, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+def aggregate_ohlc(bars: Dict[str, np.ndarray], points: int) -> Dict[str, np.ndarray]:
+    """Resample bars into `points` equal-count OHLC buckets"""
+    n = len(bars['timestamp'])
+    if points >= n or points < 1:
+        return bars
+    starts = np.linspace(0, n, points + 1).astype(np.int64)[:-1]
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'timestamp': bars['timestamp'][starts],
+        'open': bars['open'][starts],
+        'high': np.maximum.reduceat(bars['high'], starts),
+        'low': np.minimum.reduceat(bars['low'], starts),
+        'close': bars['close'][ends],
+        'volume': np.add.reduceat(bars['volume'], starts),
+    }
+
+def downsample_history(bars: Dict[str, np.ndarray], points: int,
+                       method: str = 'lttb') -> Dict[str, np.ndarray]:
+    if len(bars['timestamp']) <= points:
+        return bars
+    if method == 'ohlc':
+        return aggregate_ohlc(bars, points)
+    indices = lttb_indices(bars['timestamp'], bars['close'], points)
+    return {column: values[indices] for column, values in bars.items()}
+
+def encode_history_json(history: Dict[str, Dict[str, np.ndarray]], fields: List[str]) -> bytes:
+    return json_dumps({
+        symbol: {
+            'timestamps': bars['timestamp'],
+            **{field: bars[field] for field in fields}
+        }
+        for symbol, bars in history.items()
+    })
+
+def encode_history_msgpack(history: Dict[str, Dict[str, np.ndarray]], fields: List[str]) -> bytes:
+    """{symbol: {column: {dtype, data}}} with each column as raw little-endian bytes"""
+    payload = {}
+    for symbol, bars in history.items():
+        payload[symbol] = {}
+        for column in ['timestamp'] + fields:
+            values = np.ascontiguousarray(bars[column], dtype=OHLCVStore.COLUMNS[column])
+            payload[symbol][column] = {'dtype': values.dtype.str, 'data': values.tobytes()}
+    return msgpack.packb(payload, use_bin_type=True)
+
+def encode_history_columnar(history: Dict[str, Dict[str, np.ndarray]], fields: List[str]) -> bytes:
+    """Raw little-endian column buffers behind a small JSON header.
+
+    Layout: COLUMNAR_MAGIC, uint32 header length, header JSON padded to 8
+    bytes, then the buffers. The header lists every series with its length
+    and, per column, the dtype and byte offset from the start of the buffers.
+    """
+    series, buffers, offset = [], [], 0
+    for symbol, bars in history.items():
+        columns = {}
+        for column in ['timestamp'] + fields:
+            values = np.ascontiguousarray(bars[column], dtype=OHLCVStore.COLUMNS[column])
+            columns[column] = {'dtype': values.dtype.str, 'offset': offset}
+            buffers.append(values)
+            offset += values.nbytes
+        series.append({'symbol': symbol, 'length': len(bars['timestamp']), 'columns': columns})
+
+    header = json.dumps({'version': 1, 'series': series}).encode()
+    header += b' ' * (-(len(COLUMNAR_MAGIC) + 4 + len(header)) % 8)
+    return b''.join([COLUMNAR_MAGIC, np.uint32(len(header)).astype('<u4').tobytes(), header, *buffers])
+
+def encode_history_arrow(history: Dict[str, Dict[str, np.ndarray]], fields: List[str]) -> bytes:
+    """One long Arrow table (symbol, timestamp, fields...) as an IPC stream"""
+    symbols = list(history)
+    lengths = [len(history[s]['timestamp']) for s in symbols]
+    columns = {
+        'symbol': pa.DictionaryArray.from_arrays(
+            pa.array(np.repeat(np.arange(len(symbols), dtype=np.int32), lengths)),
+            pa.array(symbols, type=pa.string())
+        ),
+        'timestamp': pa.array(np.concatenate([history[s]['timestamp'] for s in symbols])
+                              if symbols else np.empty(0, np.int64)).cast(pa.timestamp('s', tz='UTC')),
+    }
+    for field in fields:
+        columns[field] = pa.array(np.concatenate([history[s][field] for s in symbols])
+                                  if symbols else np.empty(0, np.float64))
+    table = pa.table(columns)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+HISTORY_ENCODERS = {
+    MIMETYPE_JSON: encode_history_json,
+    MIMETYPE_COLUMNAR: encode_history_columnar,
+    MIMETYPE_ARROW: encode_history_arrow,
+    MIMETYPE_MSGPACK: encode_history_msgpack,
+}
+
+def negotiate_history_format() -> Optional[str]:
+    """Pick a response mimetype from ?format= or the Accept header"""
+    available = [MIMETYPE_JSON, MIMETYPE_COLUMNAR, MIMETYPE_MSGPACK] + ([MIMETYPE_ARROW] if pa else [])
+    requested = request.args.get('format')
+    if requested:
+        mimetype = HISTORY_FORMATS.get(requested)
+        return mimetype if mimetype in available else None
+    if not request.accept_mimetypes:
+        return MIMETYPE_JSON
+    return request.accept_mimetypes.best_match(available)
+
+# ========================
+# Risk Analytics
+# ========================
+
+RISK_FREE_RATE = float(os.getenv('RISK_FREE_RATE', 0.04))
+EQUITY_PREMIUM = float(os.getenv('EQUITY_PREMIUM', 0.05))
+
+def load_price_matrix(store: OHLCVStore, symbols: List[str], interval: str = '1d',
+                      start: Optional[int] = None) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Aligned close prices (T x N) for the symbols present in the store.
+
+    Gaps are forward-filled and rows before every symbol has a price are dropped.
+    """
+    series = {symbol: store.read(symbol, interval, start=start) for symbol in symbols}
+    present = [symbol for symbol in symbols if len(series[symbol]['timestamp'])]
+    if not present:
+        return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+
+    timestamps = np.unique(np.concatenate([series[s]['timestamp'] for s in present]))
+    prices = np.full((len(timestamps), len(present)), np.nan)
+    for j, symbol in enumerate(present):
+        rows = np.searchsorted(timestamps, series[symbol]['timestamp'])
+        prices[rows, j] = series[symbol]['close']
+
+    # Forward fill: index of the last valid row at or above each row
+    valid = ~np.isnan(prices)
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(timestamps))[:, None], 0), axis=0)
+    prices = prices[last_valid, np.arange(len(present))]
+    complete = np.flatnonzero(valid.cumsum(axis=0).min(axis=1) > 0)
+    if not len(complete):
+        return np.empty(0, dtype=np.int64), [], np.empty((0, 0))
+    first = complete[0]
+    return timestamps[first:], present, prices[first:]
+
+class RiskAnalytics:
+    """Return and risk statistics for a whole symbol universe.
+
+    Covariance is computed over a rolling window of log returns kept in a ring
+    buffer with running sums, so a new bar costs O(N^2) instead of a full
+    recompute. Trend and drawdowns come from a second ring of the last
+    ``history`` prices (the two years a refit loads), so a long-running process
+    and a fresh fit see the same span. Re-sending the latest bar (a
+    still-forming daily candle) replaces it rather than advancing the window.
+    """
+
+    def __init__(self, window: int = 63, benchmark: str = 'SPY', periods_per_year: int = 252,
+                 history: int = 504):
+        self.window = window
+        self.history = history
+        self.benchmark = benchmark
+        self.periods_per_year = periods_per_year
+        self.symbols: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.last_timestamp: Optional[int] = None
+
+    @property
+    def fitted(self) -> bool:
+        return self.last_timestamp is not None and self._count > 1
+
+    def fit(self, timestamps: np.ndarray, symbols: List[str], prices: np.ndarray):
+        """Initialise from a full price matrix in one vectorised pass"""
+        n = len(symbols)
+        self.symbols = list(symbols)
+        self.index = {symbol: j for j, symbol in enumerate(self.symbols)}
+        self._ring = np.zeros((self.window, n))
+        self._head = 0
+        self._count = 0
+        self._prices = np.zeros((self.history, n))
+        self._price_head = 0
+        self._price_count = 0
+        self._since_resum = 0
+        self._undo = None
+        self.last_timestamp = None
+        if not len(timestamps):
+            return
+
+        # Everything except the last bar in bulk, then the last bar through
+        # update() so it can still be replaced
+        head = prices[:-1]
+        if len(head):
+            returns = np.diff(np.log(head), axis=0)[-self.window:]
+            k = len(returns)
+            self._ring[:k] = returns
+            self._head = k % self.window
+            self._count = k
+            self._sum = returns.sum(axis=0)
+            self._outer = returns.T @ returns
+            kept = head[-self.history:]
+            self._prices[:len(kept)] = kept
+            self._price_head = len(kept) % self.history
+            self._price_count = len(kept)
+            self._last_prices = head[-1].copy()
+            self.last_timestamp = int(timestamps[-2])
+            self.update(int(timestamps[-1]), prices[-1])
+        else:
+            self._sum = np.zeros(n)
+            self._outer = np.zeros((n, n))
+            self._prices[0] = prices[0]
+            self._price_head = 1 % self.history
+            self._price_count = 1
+            self._last_prices = prices[0].copy()
+            self.last_timestamp = int(timestamps[0])
+
+    def _state(self):
+        return (self._ring[self._head].copy(), self._head, self._count, self._since_resum,
+                self._sum.copy(), self._outer.copy(), self._prices[self._price_head].copy(),
+                self._price_head, self._price_count, self._last_prices.copy(),
+                self.last_timestamp)
+
+    def _restore(self, state):
+        (row, self._head, self._count, self._since_resum, self._sum, self._outer,
+         price_row, self._price_head, self._price_count, self._last_prices,
+         self.last_timestamp) = state
+        self._ring[self._head] = row
+        self._prices[self._price_head] = price_row
+
+    def update(self, timestamp: int, prices: np.ndarray):
+        """Advance by one bar, or replace the latest bar if the timestamp repeats"""
+        prices = np.asarray(prices, dtype=np.float64)
+        if timestamp == self.last_timestamp and self._undo is not None:
+            self._restore(self._undo)
+        elif self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            raise ValueError(f"Bar {timestamp} is older than {self.last_timestamp}")
+        self._undo = self._state()
+
+        r = np.log(prices / self._last_prices)
+        evicted = self._ring[self._head] if self._count == self.window else np.zeros_like(r)
+        self._sum += r - evicted
+        self._outer += np.outer(r, r) - np.outer(evicted, evicted)
+        self._ring[self._head] = r
+        self._head = (self._head + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+
+        # Re-sum from the ring now and then so float error can't accumulate
+        self._since_resum += 1
+        if self._since_resum >= self.window:
+            window = self._ring[:self._count]
+            self._sum = window.sum(axis=0)
+            self._outer = window.T @ window
+            self._since_resum = 0
+
+        self._prices[self._price_head] = prices
+        self._price_head = (self._price_head + 1) % self.history
+        self._price_count = min(self._price_count + 1, self.history)
+        self._last_prices = prices
+        self.last_timestamp = timestamp
+
+    def _price_history(self) -> np.ndarray:
+        """Prices in the history ring, oldest first"""
+        if self._price_count < self.history:
+            return self._prices[:self._price_count]
+        return np.roll(self._prices, -self._price_head, axis=0)
+
+    def covariance(self) -> np.ndarray:
+        """Annualised covariance of log returns over the rolling window"""
+        w = self._count
+        if w < 2:
+            return np.zeros((len(self.symbols), len(self.symbols)))
+        return (self._outer - np.outer(self._sum, self._sum) / w) / (w - 1) * self.periods_per_year
+
+    def volatility(self) -> np.ndarray:
+        return np.sqrt(np.clip(np.diag(self.covariance()), 0, None))
+
+    def correlation(self) -> np.ndarray:
+        vol = self.volatility()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = self.covariance() / np.outer(vol, vol)
+        return np.nan_to_num(corr)
+
+    def beta(self) -> np.ndarray:
+        cov = self.covariance()
+        b = self.index.get(self.benchmark)
+        if b is None or cov[b, b] <= 0:
+            return np.ones(len(self.symbols))
+        return cov[:, b] / cov[b, b]
+
+    def drawdown(self) -> np.ndarray:
+        return self._last_prices / self._price_history().max(axis=0) - 1
+
+    def max_drawdown(self) -> np.ndarray:
+        history = self._price_history()
+        return (history / np.maximum.accumulate(history, axis=0) - 1).min(axis=0)
+
+    def expected_returns(self) -> np.ndarray:
+        """CAPM return from beta, blended with the (clipped) realised trend"""
+        capm = RISK_FREE_RATE + self.beta() * EQUITY_PREMIUM
+        n_returns = self._price_count - 1
+        if not n_returns:
+            return capm
+        first = self._price_history()[0]
+        realised = np.log(self._last_prices / first) / n_returns * self.periods_per_year
+        return 0.5 * capm + 0.5 * np.clip(realised, -0.1, 0.25)
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Per-symbol statistics in a JSON-friendly layout"""
+        if not self.fitted:
+            return {}
+        vol, beta = self.volatility(), self.beta()
+        expected, drawdown, max_drawdown = self.expected_returns(), self.drawdown(), self.max_drawdown()
+        return {
+            symbol: {
+                'volatility': round(float(vol[j]), 4),
+                'beta': round(float(beta[j]), 3),
+                'drawdown': round(float(drawdown[j]), 4),
+                'max_drawdown': round(float(max_drawdown[j]), 4),
+                'expected_return': round(float(expected[j]), 4)
+            }
+            for j, symbol in enumerate(self.symbols)
+        }
+
+    def portfolio(self, weights: Dict[str, float]) -> Optional[Dict[str, float]]:
+        """Expected return and volatility for {symbol: weight}, if all symbols are covered"""
+        if not self.fitted or not weights or any(s not in self.index for s in weights):
+            return None
+        w = np.zeros(len(self.symbols))
+        for symbol, weight in weights.items():
+            w[self.index[symbol]] += weight
+        return {
+            'expected_return': float(w @ self.expected_returns()),
+            'volatility': float(np.sqrt(max(w @ self.covariance() @ w, 0)))
+        }
+
+risk_analytics = RiskAnalytics(window=int(os.getenv('RISK_WINDOW', 63)))
+_risk_analytics_lock = threading.Lock()
+_risk_analytics_checked = 0.0
+
+def refresh_risk_analytics(max_age: float = 60) -> RiskAnalytics:
+    """Fold newly stored daily bars into risk_analytics (local disk only)"""
+    global _risk_analytics_checked
+    if time.time() - _risk_analytics_checked < max_age:
+        return risk_analytics
+
+    with _risk_analytics_lock:
+        _risk_analytics_checked = time.time()
+        timestamps, symbols, prices = load_price_matrix(
+            market_history_service.store, MARKET_SYMBOLS, '1d',
+            start=MarketHistoryService.period_start('2y')
+        )
+        if not len(timestamps):
+            return risk_analytics
+
+        last = risk_analytics.last_timestamp
+        if symbols != risk_analytics.symbols or last is None or last not in timestamps:
+            risk_analytics.fit(timestamps, symbols, prices)
+            return risk_analytics
+
+        try:
+            for i in range(int(np.searchsorted(timestamps, last)), len(timestamps)):
+                if timestamps[i] == last and np.array_equal(prices[i], risk_analytics._last_prices):
+                    continue
+                risk_analytics.update(int(timestamps[i]), prices[i])
+        except ValueError:
+            risk_analytics.fit(timestamps, symbols, prices)
+    return risk_analytics
+
+# ========================
+# Portfolio Optimisation
+# ========================
+
+DEFAULT_INVESTMENT_UNIVERSE = {
+    'VTI': {'name': 'Vanguard Total Stock Market ETF', 'type': 'etf', 'asset_class': 'stocks',
+            'reason': 'Broad market exposure with low fees'},
+    'VIG': {'name': 'Vanguard Dividend Appreciation ETF', 'type': 'etf', 'asset_class': 'stocks',
+            'reason': 'Stable dividend-paying companies'},
+    'VOO': {'name': 'Vanguard S&P 500 ETF', 'type': 'etf', 'asset_class': 'stocks',
+            'reason': 'Core large-cap exposure'},
+    'QQQ': {'name': 'Invesco QQQ Trust', 'type': 'etf', 'asset_class': 'stocks',
+            'reason': 'Technology sector growth'},
+    'VXUS': {'name': 'Vanguard International Stock ETF', 'type': 'etf', 'asset_class': 'stocks',
+             'reason': 'International diversification'},
+    'ARKK': {'name': 'ARK Innovation ETF', 'type': 'etf', 'asset_class': 'stocks',
+             'reason': 'Disruptive innovation exposure'},
+    'SOXX': {'name': 'iShares Semiconductor ETF', 'type': 'etf', 'asset_class': 'stocks',
+             'reason': 'High-growth semiconductor sector'},
+    'ICLN': {'name': 'iShares Global Clean Energy ETF', 'type': 'etf', 'asset_class': 'stocks',
+             'reason': 'Clean energy megatrend'},
+    'BND': {'name': 'Vanguard Total Bond Market ETF', 'type': 'etf', 'asset_class': 'bonds',
+            'reason': 'Diversified bond exposure'},
+    'TIP': {'name': 'iShares TIPS Bond ETF', 'type': 'etf', 'asset_class': 'bonds',
+            'reason': 'Inflation protection'},
+}
+
+DEFAULT_RISK_PROFILES = {
+    'conservative': {'max_volatility': 0.07, 'cash': 0.2, 'risk_score': 2},
+    'moderate': {'max_volatility': 0.12, 'cash': 0.1, 'risk_score': 5},
+    'aggressive': {'max_volatility': 0.20, 'cash': 0.05, 'risk_score': 8},
+}
+
+def load_json_config(env_var: str, default: Dict) -> Dict:
+    """Read a JSON config file named by env_var, falling back to default"""
+    path = os.getenv(env_var)
+    if not path:
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+class PortfolioOptimizer:
+    """Long-only mean-variance efficient frontier over a configurable universe.
+
+    The frontier is solved for a grid of risk-aversion levels in one batched
+    projected-gradient run whenever the risk analytics move to a new bar.
+    Allocating for a volatility budget is then a binary search and a linear
+    blend of the two neighbouring frontier portfolios, which stays feasible
+    because portfolio volatility is convex in the weights.
+    """
+
+    # Prior moments used until the analytics cover the whole universe; asset
+    # classes without their own entry (e.g. 'reits', 'commodities') get DEFAULT
+    PRIOR = {
+        'stocks': {'return': 0.08, 'volatility': 0.18},
+        'bonds': {'return': 0.04, 'volatility': 0.06},
+    }
+    DEFAULT_PRIOR = {'return': 0.06, 'volatility': 0.15}
+
+    def __init__(self, universe: Dict[str, Dict], max_weight: float = 0.4,
+                 points: int = 41, iterations: int = 400):
+        self.universe = universe
+        self.symbols = list(universe)
+        missing = [s for s in self.symbols if not universe[s].get('asset_class')]
+        if missing:
+            raise ValueError(f"Universe entries without an asset_class: {', '.join(missing)}")
+        self.asset_classes = np.array([universe[s]['asset_class'] for s in self.symbols])
+        unknown = sorted(set(self.asset_classes) - set(self.PRIOR))
+        if unknown:
+            logger.warning(f"No prior for asset classes {unknown}; using {self.DEFAULT_PRIOR}")
+        self.max_weight = max(max_weight, 1 / len(self.symbols))
+        self.risk_aversion = np.geomspace(0.5, 500, points)
+        self.iterations = iterations
+        self._frontier = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def prior_moments(self) -> Tuple[np.ndarray, np.ndarray]:
+        priors = [self.PRIOR.get(c, self.DEFAULT_PRIOR) for c in self.asset_classes]
+        mu = np.array([p['return'] for p in priors])
+        vol = np.array([p['volatility'] for p in priors])
+        same_class = self.asset_classes[:, None] == self.asset_classes[None, :]
+        corr = np.where(same_class, 0.8, 0.1)
+        np.fill_diagonal(corr, 1.0)
+        return mu, corr * np.outer(vol, vol)
+
+    def covered(self, analytics: RiskAnalytics) -> bool:
+        return analytics.fitted and all(s in analytics.index for s in self.symbols)
+
+    def moments(self, analytics: Optional[RiskAnalytics] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Annualised expected returns and covariance for the universe"""
+        analytics = analytics or risk_analytics
+        if not self.covered(analytics):
+            return self.prior_moments()
+        idx = [analytics.index[s] for s in self.symbols]
+        return analytics.expected_returns()[idx], analytics.covariance()[np.ix_(idx, idx)]
+
+    def _project(self, v: np.ndarray) -> np.ndarray:
+        """Row-wise Euclidean projection onto {0 <= w <= max_weight, sum(w) = 1}"""
+        lo = (v.min(axis=1) - self.max_weight)[:, None]
+        hi = v.max(axis=1)[:, None]
+        for _ in range(40):
+            tau = (lo + hi) / 2
+            over = np.clip(v - tau, 0, self.max_weight).sum(axis=1, keepdims=True) > 1
+            lo = np.where(over, tau, lo)
+            hi = np.where(over, hi, tau)
+        return np.clip(v - (lo + hi) / 2, 0, self.max_weight)
+
+    def solve(self, mu: np.ndarray, cov: np.ndarray) -> Dict[str, np.ndarray]:
+        """Efficient frontier sorted by volatility"""
+        lam = self.risk_aversion[:, None]
+        step = 1 / (lam * max(np.linalg.eigvalsh(cov).max(), 1e-8))
+        weights = self._project(np.full((len(lam), len(mu)), 1 / len(mu)))
+        for _ in range(self.iterations):
+            gradient = mu - lam * (weights @ cov)
+            weights = self._project(weights + step * gradient)
+
+        returns = weights @ mu
+        vols = np.sqrt(np.clip(np.einsum('kn,nm,km->k', weights, cov, weights), 0, None))
+        order = np.argsort(vols)
+        weights, returns, vols = weights[order], returns[order], vols[order]
+        # Drop dominated points so return rises with volatility along the frontier
+        efficient = returns >= np.maximum.accumulate(returns) - 1e-12
+        return {'weights': weights[efficient], 'returns': returns[efficient], 'volatility': vols[efficient]}
+
+    def frontier(self, analytics: Optional[RiskAnalytics] = None) -> Dict[str, np.ndarray]:
+        """Frontier for the current market snapshot, recomputed only when it changes"""
+        analytics = analytics or risk_analytics
+        covered = self.covered(analytics)
+        version = (analytics.last_timestamp, tuple(analytics.symbols)) if covered else None
+        if self._frontier is not None and version == self._version:
+            return self._frontier
+
+        with self._lock:
+            if self._frontier is None or version != self._version:
+                frontier = self.solve(*self.moments(analytics))
+                frontier['source'] = 'market' if covered else 'prior'
+                self._frontier, self._version = frontier, version
+        return self._frontier
+
+    def allocate_many(self, max_volatility: np.ndarray,
+                      frontier: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """Weights (G x N) of the best frontier portfolio within each volatility budget"""
+        frontier = frontier or self.frontier()
+        vols, weights = frontier['volatility'], frontier['weights']
+        targets = np.clip(np.asarray(max_volatility, dtype=np.float64), vols[0], vols[-1])
+        i = np.clip(np.searchsorted(vols, targets, 'right') - 1, 0, len(vols) - 1)
+        j = np.minimum(i + 1, len(vols) - 1)
+        span = vols[j] - vols[i]
+        t = np.divide(targets - vols[i], span, out=np.zeros_like(targets), where=span > 0)
+        return (1 - t)[:, None] * weights[i] + t[:, None] * weights[j]
+
+    def allocate(self, max_volatility: float) -> Dict[str, float]:
+        weights = self.allocate_many(np.array([max_volatility]))[0]
+        return dict(zip(self.symbols, weights))
+
+portfolio_optimizer = PortfolioOptimizer(
+    load_json_config('INVESTMENT_UNIVERSE_FILE', DEFAULT_INVESTMENT_UNIVERSE),
+    max_weight=float(os.getenv('PORTFOLIO_MAX_WEIGHT', 0.4))
+)
+
+# ========================
+# Sentiment
+# ========================
+
+class SentimentService:
+    """Batched, cached sentiment scoring of short texts.
+
+    Callers submit texts and get futures; a single worker thread drains the
+    queue into batches of up to max_batch_size, waiting at most max_wait
+    seconds to fill one, so concurrent requests share model invocations.
+    Scores (probability the text is positive) are cached by text hash.
+
+    The model loads lazily on the worker thread. SENTIMENT_BACKEND=onnx uses
+    an ONNX Runtime export through optimum, SENTIMENT_QUANTIZE=1 applies
+    dynamic int8 quantisation to the PyTorch model.
+    """
+
+    def __init__(self, model_name: str = 'distilbert-base-uncased-finetuned-sst-2-english',
+                 backend: str = 'pytorch', quantize: bool = False,
+                 max_batch_size: int = 32, max_wait: float = 0.01,
+                 cache_size: int = 10_000, infer_fn=None):
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.cache = LRUCache(cache_size)
+        self._infer = infer_fn
+        self._queue = queue.Queue()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.loaded = threading.Event()
+        self.error: Optional[str] = None
+        self.batches = 0
+        self.texts_scored = 0
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded.is_set() and self.error is None
+
+    @staticmethod
+    def text_key(text: str) -> str:
+        return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()
+
+    def _load_model(self):
+        if self.backend == 'onnx':
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            from transformers import AutoTokenizer
+            model = ORTModelForSequenceClassification.from_pretrained(self.model_name, export=True)
+            classifier = pipeline('sentiment-analysis', model=model,
+                                  tokenizer=AutoTokenizer.from_pretrained(self.model_name))
+        else:
+            classifier = pipeline('sentiment-analysis', model=self.model_name)
+            if self.quantize:
+                import torch
+                classifier.model = torch.quantization.quantize_dynamic(
+                    classifier.model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+
+        def infer(texts: List[str]) -> List[float]:
+            results = classifier(texts, batch_size=len(texts), truncation=True)
+            return [r['score'] if r['label'].upper().startswith('POS') else 1 - r['score']
+                    for r in results]
+        return infer
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name='sentiment-batcher')
+                self._thread.start()
+
+    def _run(self):
+        try:
+            if self._infer is None:
+                self._infer = self._load_model()
+        except Exception as e:
+            logger.warning(f"Sentiment model unavailable: {e}")
+            # The worker exits here, so fail whatever was queued while loading
+            with self._lock:
+                self.error = str(e)
+                pending, self._inflight = self._inflight, {}
+            for future in pending.values():
+                future.set_exception(RuntimeError(self.error))
+            return
+        finally:
+            self.loaded.set()
+
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            keys, texts = zip(*batch)
+            try:
+                scores = self._infer(list(texts))
+                outcome = [(key, score, None) for key, score in zip(keys, scores)]
+            except Exception as e:
+                logger.error(f"Sentiment inference error: {e}")
+                outcome = [(key, None, e) for key in keys]
+            self.batches += 1
+            self.texts_scored += len(batch)
+
+            for key, score, error in outcome:
+                if error is None:
+                    self.cache.put(key, float(score))
+                with self._lock:
+                    future = self._inflight.pop(key, None)
+                if future is not None:
+                    future.set_exception(error) if error else future.set_result(float(score))
+
+    def submit(self, text: str) -> Future:
+        key = self.text_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        self.start()
+        with self._lock:
+            if self.error is not None:
+                future = Future()
+                future.set_exception(RuntimeError(self.error))
+                return future
+            future = self._inflight.get(key)
+            if future is None:
+                future = Future()
+                self._inflight[key] = future
+                self._queue.put((key, text))
+        return future
+
+    def score(self, texts: List[str], timeout: Optional[float] = 30) -> List[float]:
+        futures = [self.submit(text) for text in texts]
+        return [future.result(timeout=timeout) for future in futures]
+
+sentiment_service = SentimentService(
+    model_name=os.getenv('SENTIMENT_MODEL', 'distilbert-base-uncased-finetuned-sst-2-english'),
+    backend=os.getenv('SENTIMENT_BACKEND', 'pytorch'),
+    quantize=os.getenv('SENTIMENT_QUANTIZE', '0') == '1',
+    max_batch_size=int(os.getenv('SENTIMENT_BATCH_SIZE', 32)),
+    cache_size=int(os.getenv('SENTIMENT_CACHE_SIZE', 10_000))
+)
+
+_headlines_cache = {'mtime': None, 'headlines': []}
+
+def load_headlines(path: Optional[str] = None) -> List[str]:
+    """Headlines from a local file: a JSON list of strings/{"title": ...} or one per line"""
+    path = path or os.getenv('NEWS_HEADLINES_FILE')
+    if not path or not os.path.exists(path):
+        return []
+    mtime = os.path.getmtime(path)
+    if _headlines_cache['mtime'] != mtime:
+        with open(path) as f:
+            raw = f.read()
+        try:
+            items = json.loads(raw)
+            headlines = [i['title'] if isinstance(i, dict) else str(i) for i in items]
+        except ValueError:
+            headlines = raw.splitlines()
+        _headlines_cache.update(mtime=mtime, headlines=[h.strip() for h in headlines if h.strip()])
+    return _headlines_cache['headlines']
+
+# ========================
+# Database Notifications
+# ========================
+
+class PostgresListener:
+    """Background LISTEN on Postgres channels, dispatching NOTIFY payloads.
+
+    Handlers are called as handler(payload) on the listener thread. After a
+    dropped connection the listener reconnects with backoff and calls each
+    on_reconnect hook, since notifications sent while disconnected are lost.
+    """
+
+    def __init__(self, dsn: Optional[str] = None, poll_timeout: float = 5.0,
+                 max_backoff: float = 60.0):
+        self.dsn = dsn
+        self.poll_timeout = poll_timeout
+        self.max_backoff = max_backoff
+        self.handlers = defaultdict(list)
+        self.reconnect_hooks = []
+        self.connected = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, channel: str, handler, on_reconnect=None):
+        self.handlers[channel].append(handler)
+        if on_reconnect:
+            self.reconnect_hooks.append(on_reconnect)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        backoff = 1.0
+        first = True
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn or os.getenv('DATABASE_URL'))
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    for channel in self.handlers:
+                        cur.execute(f'LISTEN "{channel}"')
+                if not first:
+                    for hook in self.reconnect_hooks:
+                        hook()
+                first = False
+                backoff = 1.0
+                self.connected.set()
+                self._listen(conn)
+            except Exception as e:
+                logger.warning(f"Postgres listener disconnected: {e}")
+            finally:
+                self.connected.clear()
+                if conn is not None:
+                    conn.close()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _listen(self, conn):
+        while True:
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                for handler in self.handlers.get(notify.channel, []):
+                    try:
+                        handler(notify.payload)
+                    except Exception as e:
+                        logger.error(f"Notification handler error on {notify.channel}: {e}")
+
+pg_listener = PostgresListener()
+
+# ========================
+# Group Profiles
+# ========================
+
+def invalidate_group(group_id: str):
+    """Drop every cached value derived from a group (profile, recommendations)"""
+    for name in ('group_profile', 'recommendations'):
+        CACHES[name].invalidate_tags(f"group:{group_id}")
+
+# group_stats triggers and updates to the profile columns of groups NOTIFY on
+# this channel (migrations 002, 008)
+pg_listener.subscribe('group_stats_changed', invalidate_group,
+                      on_reconnect=lambda: [CACHES[n].local.clear() for n in ('group_profile', 'recommendations')])
+
+# ========================
+# Investment Analysis
+# ========================
+
+class InvestmentAnalyzer:
+    def __init__(self):
+        self.sentiment_analyzer = sentiment_service
+        self.risk_profiles = load_json_config('RISK_PROFILES_FILE', DEFAULT_RISK_PROFILES)
+        self.min_position_weight = 0.02
+    
+    @cached(CACHES['recommendations'], key=lambda self, group_id, amount: f"{group_id}:{float(amount)}",
+            tags=lambda self, group_id, amount: [f"group:{group_id}"],
+            cache_if=lambda result: 'error' not in result)
+    async def get_recommendations(self, group_id: str, amount: float) -> Dict:
+        """Get investment recommendations for a group"""
+        try:
+            # Get group profile
+            group_profile = await self.get_group_profile(group_id)
+            
+            # Get market data
+            market_data = await self.get_market_data()
+            
+            # Generate recommendations
+            recommendations = self.generate_recommendations(
+                group_profile,
+                amount,
+                market_data
+            )
+            
+            # Add AI insights
+            recommendations['ai_insights'] = await self.generate_ai_insights(
+                group_profile,
+                recommendations,
+                market_data
+            )
+            recommendations['market_data'] = market_data.get('freshness')
+            
+            return recommendations
+            
+        except Exception as e:
+            logger.error(f"Investment analysis error: {e}")
+            return {'error': str(e)}
+    
+    @cached(CACHES['group_profile'], key=lambda self, group_id: str(group_id),
+            tags=lambda self, group_id: [f"group:{group_id}"])
+    async def get_group_profile(self, group_id: str) -> Dict:
+        """Get group investment profile"""
+        return self.load_group_profile(group_id)
+
+    GROUP_PROFILE_QUERY = """
+        SELECT g.id, g.name, g.investment_strategy, g.settings,
+               COALESCE(s.member_count, 0) AS member_count,
+               s.avg_member_investment,
+               COALESCE(s.holdings, '[]'::jsonb) AS holdings
+        FROM groups g
+        LEFT JOIN group_stats s ON s.group_id = g.id
+        WHERE g.id = %s
+    """
+
+    def load_group_profile(self, group_id: str) -> Dict:
+        """Group row and its materialised stats (group_stats) in one round trip"""
+        pg_listener.start()  # cached profiles are invalidated by group_stats_changed
+        conn = get_db_connection()
+        cur = conn.cursor()
+        
+        try:
+            cur.execute(self.GROUP_PROFILE_QUERY, (group_id,))
+            group = cur.fetchone()
+            group = dict(group) if group else {}
+            holdings = group.pop('holdings', [])
+            
+            return {
+                'group': group,
+                'holdings': holdings,
+                'risk_profile': group.get('investment_strategy') or 'moderate'
+            }
+            
+        finally:
+            cur.close()
+            conn.close()
+    
+    async def get_market_data(self) -> Dict:
+        """Get current market data from the shared snapshot cache"""
+        try:
+            market_data, freshness = market_data_cache.get_snapshot()
+            market_data = dict(market_data)
+            market_data['freshness'] = freshness
+            market_data['risk'] = refresh_risk_analytics().metrics()
+            
+            # Add market sentiment
+            market_data['sentiment'] = await self.get_market_sentiment()
+            
+            return market_data
+            
+        except Exception as e:
+            logger.error(f"Market data fetch error: {e}")
+            return {}
+    
+    @cached(CACHES['market_sentiment'], key=lambda self: 'headlines',
+            cache_if=lambda result: result.get('source') != 'default')
+    async def get_market_sentiment(self) -> Dict:
+        """Analyze market sentiment from news headlines"""
+        default = {
+            'overall': 'neutral',
+            'score': 0.6,
+            'fear_greed_index': 55,
+            'source': 'default'
+        }
+        headlines = load_headlines()
+        if not headlines:
+            return default
+        
+        # Never wait for the model to load; use the default until it is ready
+        self.sentiment_analyzer.start()
+        if not self.sentiment_analyzer.ready:
+            return default
+        
+        futures = [self.sentiment_analyzer.submit(h) for h in headlines]
+        scores = await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+        score = float(np.mean(scores))
+        
+        return {
+            'overall': 'bullish' if score > 0.6 else 'bearish' if score < 0.4 else 'neutral',
+            'score': round(score, 3),
+            'fear_greed_index': int(round(score * 100)),
+            'headline_count': len(headlines),
+            'source': 'headlines'
+        }
+    
+    def generate_recommendations(self, profile: Dict, amount: float, 
+                                market_data: Dict) -> Dict:
+        """Generate investment recommendations based on profile and market"""
+        
+        constraints = self.get_risk_constraints(profile)
+        invest_amount = amount * (1 - constraints['cash'])
+        
+        # Best efficient-frontier portfolio within the group's volatility budget
+        weights = portfolio_optimizer.allocate(constraints['max_volatility'])
+        weights = {s: w for s, w in weights.items() if w >= self.min_position_weight}
+        weight_total = sum(weights.values())
+        
+        recommendations = []
+        class_weights = {'stocks': 0.0, 'bonds': 0.0}
+        for symbol, weight in sorted(weights.items(), key=lambda kv: -kv[1]):
+            meta = portfolio_optimizer.universe[symbol]
+            share = weight / weight_total
+            class_weights[meta['asset_class']] = class_weights.get(meta['asset_class'], 0.0) + \
+                share * (1 - constraints['cash'])
+            recommendations.append({
+                'symbol': symbol,
+                'name': meta['name'],
+                'type': meta['type'],
+                'amount': round(invest_amount * share, 2),
+                'weight': round(share, 4),
+                'reason': meta['reason']
+            })
+        
+        allocation = {
+            **{k: round(v, 4) for k, v in class_weights.items()},
+            'cash': constraints['cash'],
+            'risk_score': constraints['risk_score'],
+            'target_volatility': constraints['max_volatility'],
+            'method': f"efficient_frontier:{portfolio_optimizer.frontier()['source']}"
+        }
+        
+        # Calculate expected returns
+        for rec in recommendations:
+            if rec['symbol'] in market_data and market_data[rec['symbol']].get('current_price'):
+                rec['current_price'] = market_data[rec['symbol']]['current_price']
+                rec['shares'] = rec['amount'] / rec['current_price']
+            rec['expected_return'] = self.calculate_expected_return(
+                rec['symbol'],
+                market_data
+            )
+            risk = market_data.get('risk', {}).get(rec['symbol'])
+            if risk:
+                rec['volatility'] = risk['volatility']
+                rec['beta'] = risk['beta']
+                rec['max_drawdown'] = risk['max_drawdown']
+        
+        return {
+            'recommendations': recommendations,
+            'total_amount': amount,
+            'allocation': allocation,
+            'expected_portfolio_return': self.calculate_portfolio_return(recommendations),
+            'expected_portfolio_volatility': self.calculate_portfolio_volatility(recommendations),
+            'risk_score': allocation['risk_score']
+        }
+    
+    def get_risk_constraints(self, profile: Dict) -> Dict:
+        """Risk constraints for a group: its profile, overridden by group settings"""
+        base = self.risk_profiles.get(profile.get('risk_profile'), self.risk_profiles['moderate'])
+        settings = (profile.get('group') or {}).get('settings') or {}
+        return {
+            'max_volatility': float(settings.get('max_volatility', base['max_volatility'])),
+            'cash': float(settings.get('cash_reserve', base['cash'])),
+            'risk_score': base['risk_score']
+        }
+    
+    def calculate_expected_return(self, symbol: str, market_data: Dict) -> float:
+        """Calculate expected return for a symbol"""
+        sentiment_score = market_data.get('sentiment', {}).get('score', 0.5)
+        sentiment_adjustment = (sentiment_score - 0.5) * 0.1
+        
+        # Beta/trend based estimate from the risk analytics engine
+        risk = market_data.get('risk', {}).get(symbol)
+        if risk:
+            return risk['expected_return'] + sentiment_adjustment
+        
+        if symbol in market_data:
+            base_return = 0.08  # 8% historical average
+            return base_return + sentiment_adjustment
+        
+        return 0.07  # Default 7% return
+    
+    def _portfolio_weights(self, recommendations: List[Dict]) -> Dict[str, float]:
+        total_amount = sum(rec['amount'] for rec in recommendations)
+        weights = defaultdict(float)
+        if total_amount:
+            for rec in recommendations:
+                weights[rec['symbol']] += rec['amount'] / total_amount
+        return dict(weights)
+    
+    def calculate_portfolio_return(self, recommendations: List[Dict]) -> float:
+        """Calculate weighted portfolio return"""
+        total_amount = sum(rec['amount'] for rec in recommendations)
+        if total_amount == 0:
+            return 0
+        
+        weighted_return = sum(
+            rec['amount'] * rec.get('expected_return', 0.07) / total_amount
+            for rec in recommendations
+        )
+        
+        return weighted_return
+    
+    def calculate_portfolio_volatility(self, recommendations: List[Dict]) -> Optional[float]:
+        """Annualised portfolio volatility from the rolling covariance matrix"""
+        stats = risk_analytics.portfolio(self._portfolio_weights(recommendations))
+        return round(stats['volatility'], 4) if stats else None
+    
+    async def generate_ai_insights(self, profile: Dict, 
+                                  recommendations: Dict,
+                                  market_data: Dict) -> List[str]:
+        """Generate AI-powered insights"""
+        insights = []
+        
+        # Portfolio balance insight
+        allocation = recommendations['allocation']
+        if allocation['stocks'] > 0.7:
+            insights.append(
+                "Your portfolio is heavily weighted toward stocks. "
+                "Consider rebalancing if market volatility increases."
+            )
+        elif allocation['bonds'] > 0.5:
+            insights.append(
+                "Conservative allocation detected. "
+                "You may want to increase equity exposure for long-term growth."
+            )
+        
+        # Market timing insight
+        sentiment = market_data.get('sentiment', {})
+        if sentiment.get('fear_greed_index', 50) < 30:
+            insights.append(
+                "Market fear is high - this could be a good buying opportunity "
+                "for long-term investors."
+            )
+        elif sentiment.get('fear_greed_index', 50) > 70:
+            insights.append(
+                "Market greed is elevated - consider taking some profits "
+                "or waiting for better entry points."
+            )
+        
+        # Diversification insight
+        if len(profile.get('holdings', [])) < 5:
+            insights.append(
+                "Your portfolio could benefit from more diversification. "
+                "Consider adding different asset classes or sectors."
+            )
+        
+        # Cost optimization
+        total_amount = recommendations['total_amount']
+        if total_amount < 1000:
+            insights.append(
+                "With smaller amounts, focus on low-cost index ETFs "
+                "to minimize fees impact on returns."
+            )
+        
+        return insights
+
+investment_analyzer = InvestmentAnalyzer()
+
+# ========================
+# Batch Recommendations
+# ========================
+
+class GroupRecommendationBatch:
+    """Suggested investments for every group in one pass.
+
+    Profiles and holdings are loaded with a single set-based query, groups
+    sharing a risk budget are allocated together against one market
+    snapshot, and the results are written back to ai_insights in bulk.
+    """
+
+    PROFILES_QUERY = """
+        SELECT g.id AS group_id,
+               g.investment_strategy,
+               COALESCE(g.investment_threshold, 100) AS amount,
+               (g.settings->>'max_volatility')::float AS max_volatility,
+               (g.settings->>'cash_reserve')::float AS cash_reserve,
+               COALESCE(m.member_count, 0) AS member_count,
+               COALESCE(h.holding_count, 0) AS holding_count
+        FROM groups g
+        LEFT JOIN (
+            SELECT gm.group_id, COUNT(DISTINCT gm.user_id) AS member_count
+            FROM group_members gm
+            WHERE gm.status = 'active'
+            GROUP BY gm.group_id
+        ) m ON m.group_id = g.id
+        LEFT JOIN (
+            SELECT group_id, COUNT(DISTINCT symbol) AS holding_count
+            FROM investments
+            WHERE sold_at IS NULL
+            GROUP BY group_id
+        ) h ON h.group_id = g.id
+    """
+
+    def __init__(self, analyzer: InvestmentAnalyzer, optimizer: PortfolioOptimizer,
+                 insight_ttl_hours: int = 24):
+        self.analyzer = analyzer
+        self.optimizer = optimizer
+        self.insight_ttl_hours = insight_ttl_hours
+
+    def load_profiles(self, cur) -> pd.DataFrame:
+        cur.execute(self.PROFILES_QUERY)
+        return pd.DataFrame(cur.fetchall(), columns=[
+            'group_id', 'investment_strategy', 'amount', 'max_volatility',
+            'cash_reserve', 'member_count', 'holding_count'
+        ])
+
+    def constraints(self, profiles: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-group volatility budget and cash reserve, settings overriding the profile"""
+        defaults = self.analyzer.risk_profiles['moderate']
+        strategy = profiles['investment_strategy']
+        profile_vol = strategy.map({k: v['max_volatility'] for k, v in self.analyzer.risk_profiles.items()})
+        profile_cash = strategy.map({k: v['cash'] for k, v in self.analyzer.risk_profiles.items()})
+        max_vol = profiles['max_volatility'].astype(float).fillna(profile_vol).fillna(defaults['max_volatility'])
+        cash = profiles['cash_reserve'].astype(float).fillna(profile_cash).fillna(defaults['cash'])
+        return max_vol.to_numpy(), cash.to_numpy()
+
+    def evaluate(self, profiles: pd.DataFrame, market_data: Dict) -> Dict[str, np.ndarray]:
+        """Weights, amounts and portfolio stats for all groups as arrays"""
+        max_vol, cash = self.constraints(profiles)
+        frontier = self.optimizer.frontier()
+
+        # One allocation per distinct budget, broadcast back to the groups
+        budgets, inverse = np.unique(max_vol, return_inverse=True)
+        weights = self.optimizer.allocate_many(budgets, frontier)
+        weights = np.where(weights >= self.analyzer.min_position_weight, weights, 0)
+        weights /= weights.sum(axis=1, keepdims=True)
+
+        mu = np.array([self.analyzer.calculate_expected_return(s, market_data)
+                       for s in self.optimizer.symbols])
+        cov = self.optimizer.moments()[1]
+        budget_return = weights @ mu
+        budget_vol = np.sqrt(np.clip(np.einsum('kn,nm,km->k', weights, cov, weights), 0, None))
+
+        invest = profiles['amount'].astype(float).to_numpy() * (1 - cash)
+        return {
+            'budget': inverse,
+            'weights': weights[inverse],
+            'amounts': np.round(weights[inverse] * invest[:, None], 2),
+            'expected_return': budget_return[inverse],
+            'volatility': budget_vol[inverse],
+            'max_volatility': max_vol,
+            'cash': cash
+        }
+
+    def build_insights(self, profiles: pd.DataFrame, evaluation: Dict[str, np.ndarray]) -> List[tuple]:
+        """ai_insights rows (group_id, type, title, insight, data, confidence, expires_at)"""
+        symbols = self.optimizer.symbols
+        expires_at = datetime.utcnow() + timedelta(hours=self.insight_ttl_hours)
+
+        # Groups with the same budget, amount and diversification flag get the
+        # same payload, so render each distinct combination once
+        keys = pd.DataFrame({
+            'budget': evaluation['budget'],
+            'amount': profiles['amount'].astype(float).to_numpy(),
+            'cash': evaluation['cash'],
+            'diversify': profiles['holding_count'].to_numpy() < 5
+        })
+        codes = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+        _, representatives = np.unique(codes, return_index=True)
+
+        texts, payloads = [], []
+        for g in representatives:
+            order = np.argsort(-evaluation['weights'][g])
+            positions = [{'symbol': symbols[j], 'amount': float(evaluation['amounts'][g, j]),
+                          'weight': round(float(evaluation['weights'][g, j]), 4)}
+                         for j in order if evaluation['amounts'][g, j] > 0]
+            top = ', '.join(f"${p['amount']:.0f} {p['symbol']}" for p in positions[:3])
+            texts.append(f"Suggested allocation: {top}.")
+            payloads.append(json.dumps({
+                'recommendations': positions,
+                'expected_return': round(float(evaluation['expected_return'][g]), 4),
+                'volatility': round(float(evaluation['volatility'][g]), 4),
+                'target_volatility': float(evaluation['max_volatility'][g]),
+                'cash': float(evaluation['cash'][g]),
+                'needs_diversification': bool(keys['diversify'].iat[g])
+            }))
+
+        return [
+            (group_id, 'investment_recommendation', 'Suggested investment',
+             texts[code], payloads[code], 0.75, expires_at)
+            for group_id, code in zip(profiles['group_id'].to_numpy(), codes)
+        ]
+
+    def write_insights(self, cur, rows: List[tuple], page_size: int = 1000):
+        execute_values(cur, """
+            INSERT INTO ai_insights
+                (group_id, type, title, insight, data, confidence_score, expires_at)
+            VALUES %s
+        """, rows, page_size=page_size)
+
+    def run(self, dry_run: bool = False) -> Dict:
+        started = time.time()
+        market_data = asyncio.run(self.analyzer.get_market_data())
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            profiles = self.load_profiles(cur)
+            loaded = time.time()
+            evaluation = self.evaluate(profiles, market_data)
+            rows = self.build_insights(profiles, evaluation)
+            evaluated = time.time()
+            if not dry_run:
+                self.write_insights(cur, rows)
+                conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+        stats = {
+            'groups': len(profiles),
+            'load_seconds': round(loaded - started, 3),
+            'evaluate_seconds': round(evaluated - loaded, 3),
+            'write_seconds': round(time.time() - evaluated, 3),
+            'market_data': market_data.get('freshness'),
+            'dry_run': dry_run
+        }
+        logger.info(f"Group recommendations generated: {stats}")
+        return stats
+
+group_recommendation_batch = GroupRecommendationBatch(investment_analyzer, portfolio_optimizer)
+
+# ========================
+# Goal Projection
+# ========================
+
+class GoalProjector:
+    """Probability of reaching savings goals under the recommended allocation"""
+
+    GOALS_QUERY = """
+        SELECT gl.id, gl.name, gl.target_amount, gl.current_amount,
+               gl.monthly_contribution, gl.target_date,
+               g.investment_strategy, g.settings
+        FROM goals gl
+        LEFT JOIN groups g ON g.id = gl.group_id
+        WHERE gl.status = 'active'
+          AND (gl.id = ANY(%s::uuid[]) OR gl.user_id = %s OR gl.group_id = %s)
+        ORDER BY gl.target_date NULLS LAST
+    """
+
+    def __init__(self, analyzer: InvestmentAnalyzer, optimizer: PortfolioOptimizer,
+                 max_paths: int = 100_000, max_months: int = 360, max_workers: Optional[int] = None):
+        self.analyzer = analyzer
+        self.optimizer = optimizer
+        self.max_paths = max_paths
+        self.max_months = max_months
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def load_goals(self, goal_ids: List[str], user_id: Optional[str],
+                   group_id: Optional[str]) -> List[Dict]:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.GOALS_QUERY, (goal_ids, user_id, group_id))
+            return [dict(row) for row in cur.fetchall()]
+        finally:
+            cur.close()
+            conn.close()
+
+    def goal_params(self, goal: Dict, paths: int, horizon_months: int) -> Dict:
+        constraints = self.analyzer.get_risk_constraints({
+            'risk_profile': goal.get('investment_strategy') or 'moderate',
+            'group': {'settings': goal.get('settings') or {}}
+        })
+        weights = self.optimizer.allocate_many(np.array([constraints['max_volatility']]))[0]
+        mu, cov = self.optimizer.moments()
+
+        months = horizon_months
+        if goal.get('target_date'):
+            target = goal['target_date']
+            now = datetime.now(target.tzinfo) if getattr(target, 'tzinfo', None) else datetime.utcnow()
+            months = (target.year - now.year) * 12 + target.month - now.month
+        months = int(min(max(months, 1), self.max_months))
+
+        goal_id = str(goal['id'])
+        return {
+            'goal_id': goal_id,
+            'name': goal.get('name'),
+            'target_amount': float(goal['target_amount']),
+            'current_amount': float(goal.get('current_amount') or 0),
+            'monthly_contribution': float(goal.get('monthly_contribution') or 0),
+            'months': months,
+            'paths': paths,
+            'cash': constraints['cash'],
+            'weights': weights.tolist(),
+            'mu': mu.tolist(),
+            'cov': cov.tolist(),
+            'risk_free_rate': RISK_FREE_RATE,
+            'seed': int(hashlib.md5(goal_id.encode()).hexdigest()[:8], 16)
+        }
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Forking a threaded worker (scheduler, bus, listener) can copy a held
+                # lock into the child; workers come from a clean forkserver instead
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('forkserver'))
+            return self._pool
+
+    def project(self, goals: List[Dict], paths: int = 10_000, horizon_months: int = 120) -> List[Dict]:
+        paths = int(min(max(paths, 100), self.max_paths))
+        params = [self.goal_params(goal, paths, horizon_months) for goal in goals]
+        if len(params) <= 1:
+            return [simulate_goal(p) for p in params]
+        return list(self._executor().map(simulate_goal, params))
+
+goal_projector = GoalProjector(investment_analyzer, portfolio_optimizer,
+                               max_workers=int(os.getenv('GOAL_PROJECTION_WORKERS', 0)) or None)
+
+# ========================
+# Spending Rollups
+# ========================
+
+class SpendingRollups:
+    """Per-user daily split payment totals from the spending_daily rollup.
+
+    The table is kept current by triggers on transactions and bills
+    (migrations 003, 009); backfill rebuilds it from raw transactions in date
+    chunks, for the initial load or to repair a range. Trigger writes hold a
+    shared advisory lock that backfill takes exclusively while it rebuilds a
+    chunk, so a payment committed meanwhile is counted exactly once.
+    """
+
+    BACKFILL_QUERY = """
+        INSERT INTO spending_daily (user_id, day, category, total, txn_count, sum_squares)
+        SELECT t.user_id, DATE(t.created_at), COALESCE(b.merchant_category, 'other'),
+               SUM(t.amount), COUNT(*), SUM(t.amount * t.amount)
+        FROM transactions t
+        LEFT JOIN bills b ON b.id = t.bill_id
+        WHERE t.type = 'split_payment'
+            AND t.user_id IS NOT NULL
+            AND t.created_at >= %(start)s::date
+            AND t.created_at < %(end)s::date
+            AND (%(user_id)s::uuid IS NULL OR t.user_id = %(user_id)s::uuid)
+        GROUP BY 1, 2, 3
+        ON CONFLICT (user_id, day, category) DO UPDATE SET
+            total = EXCLUDED.total,
+            txn_count = EXCLUDED.txn_count,
+            sum_squares = EXCLUDED.sum_squares,
+            updated_at = NOW()
+    """
+
+    SERIES_QUERY = """
+        SELECT day, category, total, txn_count
+        FROM spending_daily
+        WHERE user_id = %s
+            AND day > CURRENT_DATE - %s
+    """
+
+    def series(self, cur, user_id: str, days: int) -> Dict[str, np.ndarray]:
+        """Rollup rows for the last `days` days as column arrays"""
+        pg_listener.start()  # cached insights are invalidated by spending_changed
+        cur.execute(self.SERIES_QUERY, (user_id, int(days)))
+        rows = cur.fetchall()
+        return {
+            'day': np.array([r['day'] for r in rows], dtype='datetime64[D]'),
+            'category': np.array([r['category'] for r in rows], dtype=object),
+            'total': np.array([r['total'] for r in rows], dtype=np.float64),
+            'count': np.array([r['txn_count'] for r in rows], dtype=np.int64)
+        }
+
+    def backfill(self, since: Optional[date] = None, until: Optional[date] = None,
+                 user_id: Optional[str] = None, chunk_days: int = 31) -> Dict:
+        """Rebuild rollup rows for [since, until), one transaction per chunk"""
+        started = time.time()
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            if since is None:
+                cur.execute("""
+                    SELECT MIN(created_at)::date AS first FROM transactions
+                    WHERE type = 'split_payment'
+                """)
+                since = cur.fetchone()['first'] or date.today()
+            until = until or date.today() + timedelta(days=1)
+
+            chunks = rows = 0
+            start = since
+            while start < until:
+                end = min(start + timedelta(days=chunk_days), until)
+                params = {'start': start, 'end': end, 'user_id': user_id}
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('spending_daily'))")
+                cur.execute("""
+                    DELETE FROM spending_daily
+                    WHERE day >= %(start)s AND day < %(end)s
+                        AND (%(user_id)s::uuid IS NULL OR user_id = %(user_id)s::uuid)
+                """, params)
+                cur.execute(self.BACKFILL_QUERY, params)
+                rows += cur.rowcount
+                conn.commit()
+                chunks += 1
+                start = end
+        finally:
+            cur.close()
+            conn.close()
+
+        stats = {
+            'since': since.isoformat(),
+            'until': until.isoformat(),
+            'user_id': user_id,
+            'chunks': chunks,
+            'rows': rows,
+            'seconds': round(time.time() - started, 3)
+        }
+        logger.info(f"Spending rollups backfilled: {stats}")
+        return stats
+
+spending_rollups = SpendingRollups()
+
+def invalidate_spending(user_id: str):
+    """Drop a user's cached spending insights once their rollup rows change"""
+    CACHES['spending_insights'].invalidate_tags(f"user:{user_id}")
+
+# spending_rollup_apply NOTIFYs on this channel for every user it touches (migration 007)
+pg_listener.subscribe('spending_changed', invalidate_spending,
+                      on_reconnect=lambda: CACHES['spending_insights'].local.clear())
+
+# ========================
+# Spending Analytics
+# ========================
+
+spending_analytics = SpendingAnalytics()
+
+# ========================
+# Daily Insights
+# ========================
+
+class DailyInsightPipeline:
+    """Nightly spending insights for every user, streamed in bounded memory.
+
+    The spending_daily rollup is read in user_id order through a server-side
+    cursor, cut into batches at user boundaries and analysed in a process
+    pool. Results are written with COPY in submission order; each batch's
+    rows and the run checkpoint (last user id) commit together, so a failed
+    or interrupted run resumes after the last committed user. Memory is
+    bounded by chunk_rows x max_pending, whatever the number of users.
+
+    With shards > 1 each shard covers an equal slice of the user_id (UUID)
+    space and keeps its own checkpoint, so shards can run on different hosts.
+    Shards running side by side on one host share host_workers worker slots
+    (flock'd files in slot_dir), so they never start more analysis processes
+    than the host has cores.
+    """
+
+    NAME = 'daily_insights'
+
+    ROLLUP_QUERY = """
+        SELECT user_id::text, day - DATE '1970-01-01', category, total::float8, txn_count
+        FROM spending_daily
+        WHERE day > %(run_date)s::date - %(days)s
+            AND day <= %(run_date)s::date
+            AND (%(after)s::uuid IS NULL OR user_id > %(after)s::uuid)
+            AND (%(lower)s::uuid IS NULL OR user_id >= %(lower)s::uuid)
+            AND (%(upper)s::uuid IS NULL OR user_id < %(upper)s::uuid)
+        ORDER BY user_id
+    """
+
+    COPY_SQL = """
+        COPY ai_insights (user_id, type, title, insight, data, confidence_score,
+                          potential_savings, expires_at)
+        FROM STDIN
+    """
+
+    def __init__(self, analytics: SpendingAnalytics, period: int = 30,
+                 chunk_rows: int = 50_000, max_workers: Optional[int] = None,
+                 host_workers: Optional[int] = None, slot_dir: Optional[str] = None,
+                 insight_ttl_hours: int = 48, log_interval: float = 30):
+        self.analytics = analytics
+        self.period = period
+        self.chunk_rows = chunk_rows
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.host_workers = host_workers or os.cpu_count() or 1
+        self.slot_dir = slot_dir or os.path.join(tempfile.gettempdir(), 'daily-insights-workers')
+        self.insight_ttl_hours = insight_ttl_hours
+        self.log_interval = log_interval
+
+    @staticmethod
+    def shard_bounds(shard: int, shards: int) -> Tuple[Optional[str], Optional[str]]:
+        """[lower, upper) user_id bounds of one shard; None is unbounded"""
+        lower = (shard << 128) // shards
+        upper = ((shard + 1) << 128) // shards
+        return (str(uuid.UUID(int=lower)) if shard > 0 else None,
+                str(uuid.UUID(int=upper)) if shard < shards - 1 else None)
+
+    def claim_workers(self) -> List:
+        """Lock up to max_workers of this host's worker slots, waiting for at least one.
+
+        Each slot is an flock'd file; closing it (or the process exiting)
+        releases the slot.
+        """
+        os.makedirs(self.slot_dir, exist_ok=True)
+        held = []
+        for slot in range(self.host_workers):
+            if len(held) >= self.max_workers:
+                break
+            f = open(os.path.join(self.slot_dir, f"slot-{slot}"), 'w')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                held.append(f)
+            except BlockingIOError:
+                f.close()
+        if not held:
+            f = open(os.path.join(self.slot_dir, f"slot-{os.getpid() % self.host_workers}"), 'w')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            held.append(f)
+        return held
+
+    def run_name(self, shard: int = 0, shards: int = 1) -> str:
+        return self.NAME if shards == 1 else f"{self.NAME}:{shard}/{shards}"
+
+    def start_run(self, cur, name: str, run_date: date, restart: bool) -> Dict:
+        """Claim or resume today's run, returning its checkpoint row"""
+        if restart:
+            cur.execute("""
+                DELETE FROM ai_insights
+                WHERE data->>'pipeline' = %s AND data->>'run_date' = %s
+            """, (name, run_date.isoformat()))
+            cur.execute("DELETE FROM insight_pipeline_runs WHERE pipeline = %s AND run_date = %s",
+                        (name, run_date))
+        cur.execute("""
+            INSERT INTO insight_pipeline_runs (pipeline, run_date)
+            VALUES (%s, %s)
+            ON CONFLICT (pipeline, run_date) DO UPDATE SET
+                status = CASE WHEN insight_pipeline_runs.status = 'completed'
+                              THEN 'completed' ELSE 'running' END,
+                updated_at = NOW()
+            RETURNING status, last_user_id::text, users, insights
+        """, (name, run_date))
+        return dict(cur.fetchone())
+
+    def run(self, run_date: Optional[date] = None, restart: bool = False,
+            shard: int = 0, shards: int = 1) -> Dict:
+        run_date = run_date or date.today()
+        name = self.run_name(shard, shards)
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            checkpoint = self.start_run(cur, name, run_date, restart)
+            conn.commit()
+            if checkpoint['status'] == 'completed':
+                logger.info(f"Daily insights {name} for {run_date} already completed")
+                return {'pipeline': name, 'run_date': run_date.isoformat(),
+                        'status': 'completed', 'skipped': True}
+
+            metrics = {
+                'pipeline': name,
+                'run_date': run_date.isoformat(),
+                'resumed_after': checkpoint['last_user_id'],
+                'users': checkpoint['users'],
+                'insights': checkpoint['insights'],
+                'rows_read': 0,
+                'batches': 0,
+                'max_pending': 0
+            }
+            started = time.time()
+            try:
+                self._stream(cur, conn, name, run_date, checkpoint['last_user_id'],
+                             self.shard_bounds(shard, shards), metrics, started)
+            except Exception:
+                conn.rollback()
+                cur.execute("""
+                    UPDATE insight_pipeline_runs SET status = 'failed', updated_at = NOW()
+                    WHERE pipeline = %s AND run_date = %s
+                """, (name, run_date))
+                conn.commit()
+                raise
+
+            elapsed = time.time() - started
+            metrics.update(
+                status='completed',
+                seconds=round(elapsed, 3),
+                users_per_second=round((metrics['users'] - checkpoint['users']) / max(elapsed, 1e-9), 1)
+            )
+            cur.execute("""
+                UPDATE insight_pipeline_runs
+                SET status = 'completed', metrics = %s, updated_at = NOW(), completed_at = NOW()
+                WHERE pipeline = %s AND run_date = %s
+            """, (json.dumps(metrics), name, run_date))
+            conn.commit()
+            logger.info(f"Daily insights generated: {metrics}")
+            return metrics
+        finally:
+            cur.close()
+            conn.close()
+
+    def _stream(self, cur, conn, name: str, run_date: date, after: Optional[str],
+                bounds: Tuple[Optional[str], Optional[str]], metrics: Dict, started: float):
+        task_base = {
+            'pipeline': name,
+            'run_date': run_date.isoformat(),
+            'period': self.period,
+            'analytics': {'baseline_days': self.analytics.baseline_days,
+                          'anomaly_z': self.analytics.anomaly_z,
+                          'min_history_days': self.analytics.min_history_days},
+            'expires_at': (datetime.combine(run_date, datetime.min.time())
+                           + timedelta(hours=self.insight_ttl_hours)).isoformat()
+        }
+        slots = self.claim_workers()
+        max_pending = 2 * len(slots)
+        pending = deque()
+        carry = []
+        last_log = time.time()
+
+        read_conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+        pool = None
+        if len(slots) > 1:
+            pool = ProcessPoolExecutor(max_workers=len(slots),
+                                       mp_context=multiprocessing.get_context('forkserver'))
+        try:
+            reader = read_conn.cursor(name='daily_insights_rollup')
+            reader.itersize = self.chunk_rows
+            reader.execute(self.ROLLUP_QUERY, {
+                'run_date': run_date,
+                'days': self.analytics.history_days(self.period),
+                'after': after,
+                'lower': bounds[0],
+                'upper': bounds[1]
+            })
+
+            done = False
+            while not done:
+                rows = reader.fetchmany(self.chunk_rows)
+                metrics['rows_read'] += len(rows)
+                if rows:
+                    # Hold back the last user's rows: they may continue in the next chunk
+                    rows = carry + rows
+                    last_user = rows[-1][0]
+                    cut = len(rows)
+                    while cut and rows[cut - 1][0] == last_user:
+                        cut -= 1
+                    batch, carry = rows[:cut], rows[cut:]
+                else:
+                    batch, carry, done = carry, [], True
+
+                if batch:
+                    task = dict(task_base, rows=batch)
+                    if pool is None:
+                        future = Future()
+                        future.set_result(analyze_spending_batch(task))
+                    else:
+                        future = pool.submit(analyze_spending_batch, task)
+                    pending.append(future)
+                    metrics['max_pending'] = max(metrics['max_pending'], len(pending))
+
+                while pending and (len(pending) >= max_pending or done):
+                    self._commit(cur, conn, name, run_date, pending.popleft().result(), metrics)
+
+                if time.time() - last_log >= self.log_interval:
+                    last_log = time.time()
+                    elapsed = last_log - started
+                    logger.info(f"Daily insights {name} progress: {metrics['users']} users, "
+                                f"{metrics['insights']} insights, {metrics['rows_read']} rows read, "
+                                f"{metrics['rows_read'] / elapsed:,.0f} rows/s")
+            reader.close()
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            read_conn.close()
+            for slot in slots:
+                slot.close()
+
+    def _commit(self, cur, conn, name: str, run_date: date, result: Dict, metrics: Dict):
+        if result['copy']:
+            cur.copy_expert(self.COPY_SQL, io.StringIO(result['copy']))
+        cur.execute("""
+            UPDATE insight_pipeline_runs
+            SET last_user_id = %s, users = users + %s, insights = insights + %s, updated_at = NOW()
+            WHERE pipeline = %s AND run_date = %s
+        """, (result['last_user_id'], result['users'], result['insights'], name, run_date))
+        conn.commit()
+        metrics['users'] += result['users']
+        metrics['insights'] += result['insights']
+        metrics['batches'] += 1
+
+daily_insight_pipeline = DailyInsightPipeline(
+    spending_analytics,
+    chunk_rows=int(os.getenv('DAILY_INSIGHTS_CHUNK_ROWS', 50_000)),
+    max_workers=int(os.getenv('DAILY_INSIGHTS_WORKERS', 0)) or None,
+    host_workers=int(os.getenv('DAILY_INSIGHTS_HOST_WORKERS', 0)) or None
+)
+
+# ========================
+# Split Prediction
+# ========================
+
+ITEM_STOPWORDS = {'the', 'and', 'with', 'for', 'large', 'small', 'medium', 'each', 'side', 'extra'}
+
+def item_keywords(name: str) -> List[str]:
+    """Lower-case word stems of a receipt line, for keyword affinities"""
+    words = re.findall(r'[a-z]{3,}', (name or '').lower())
+    return sorted({w[:-1] if w.endswith('s') and len(w) > 3 else w
+                   for w in words if w not in ITEM_STOPWORDS})
+
+class SplitModel:
+    """Learned split affinities for one group, as dense float32 matrices.
+
+    Columns are members. member_share sums each member's share of every
+    completed bill; category_share is the same per merchant category; and
+    keyword_share sums, per item keyword, the fraction of each claimed item
+    a member took. Bills are folded in one at a time, so refreshing only
+    touches bills completed since `watermark`. Refreshes re-read a window
+    before the watermark to catch bills that committed late; `recent` holds
+    the ids of bills inside it so none is counted twice.
+    """
+
+    MAGIC = b'CCSM'
+    MATRICES = ('member_share', 'member_bills', 'category_share', 'keyword_share')
+
+    def __init__(self):
+        self.members, self.names = [], []
+        self.categories, self.keywords, self.merchants = {}, {}, {}
+        self.member_share = np.zeros(0, dtype=np.float32)
+        self.member_bills = np.zeros(0, dtype=np.float32)
+        self.category_share = np.zeros((0, 0), dtype=np.float32)
+        self.keyword_share = np.zeros((0, 0), dtype=np.float32)
+        self.bills = 0
+        self.watermark = None
+        self.recent: Dict[str, str] = {}  # bill id -> completed_at, for bills near the watermark
+        self.version = None  # invalidation version the model was refreshed against
+        self._member_index = {}
+
+    def _member(self, user_id: str, name: Optional[str]) -> int:
+        if user_id not in self._member_index:
+            self._member_index[user_id] = len(self.members)
+            self.members.append(user_id)
+            self.names.append(name)
+            self.member_share = np.pad(self.member_share, (0, 1))
+            self.member_bills = np.pad(self.member_bills, (0, 1))
+            self.category_share = np.pad(self.category_share, ((0, 0), (0, 1)))
+            self.keyword_share = np.pad(self.keyword_share, ((0, 0), (0, 1)))
+        elif name:
+            self.names[self._member_index[user_id]] = name
+        return self._member_index[user_id]
+
+    def _row(self, vocabulary: Dict[str, int], matrix: str, key: str) -> int:
+        if key not in vocabulary:
+            vocabulary[key] = len(vocabulary)
+            setattr(self, matrix, np.pad(getattr(self, matrix), ((0, 1), (0, 0))))
+        return vocabulary[key]
+
+    def add_bill(self, bill: Dict):
+        bill_id = str(bill['id']) if bill.get('id') is not None else None
+        if bill_id in self.recent:
+            return
+        completed_at = bill.get('completed_at')
+        if isinstance(completed_at, datetime):
+            if completed_at.tzinfo is not None:
+                completed_at = completed_at.astimezone(timezone.utc)
+            completed_at = completed_at.isoformat()
+            self.watermark = max(self.watermark or completed_at, completed_at)
+            if bill_id is not None:
+                self.recent[bill_id] = completed_at
+
+        participants = [p for p in bill['participants'] if p.get('user_id')]
+        if not participants:
+            return
+        columns = np.array([self._member(str(p['user_id']), p.get('name')) for p in participants])
+        owed = np.array([float(p.get('amount_owed') or 0) for p in participants])
+        shares = owed / owed.sum() if owed.sum() > 0 else np.full(len(owed), 1 / len(owed))
+
+        category = (bill.get('merchant_category') or 'other').lower()
+        if bill.get('merchant_name'):
+            self.merchants[bill['merchant_name'].lower()] = category
+        self.member_share[columns] += shares
+        self.member_bills[columns] += 1
+        row = self._row(self.categories, 'category_share', category)
+        self.category_share[row, columns] += shares
+
+        names = {str(i.get('id')): i.get('name') for i in (bill.get('items') or []) if isinstance(i, dict)}
+        claims = defaultdict(list)
+        for column, p in zip(columns, participants):
+            for item_id in p.get('items_claimed') or []:
+                claims[str(item_id)].append(column)
+        for item_id, claimers in claims.items():
+            for keyword in item_keywords(names.get(item_id)):
+                row = self._row(self.keywords, 'keyword_share', keyword)
+                self.keyword_share[row, claimers] += 1 / len(claimers)
+
+        self.bills += 1
+
+    def forget_before(self, cutoff: datetime):
+        """Drop remembered bill ids completed before cutoff (outside the re-read window)"""
+        self.recent = {bill_id: at for bill_id, at in self.recent.items()
+                       if datetime.fromisoformat(at) >= cutoff}
+
+    def score(self, items: List[Dict], merchant: Optional[str] = None,
+              category: Optional[str] = None, total: Optional[float] = None,
+              prior_weight: float = 1.0) -> Dict:
+        """Expected amount per member for a new bill.
+
+        Each item's member distribution is its keyword affinities plus the
+        merchant-category prior; amounts are prices @ distributions.
+        """
+        members = len(self.members)
+        if not members:
+            return {'amounts': np.zeros(0), 'item_probabilities': np.zeros((len(items), 0))}
+
+        def normalise(rows):
+            sums = rows.sum(axis=-1, keepdims=True)
+            return np.divide(rows, sums, out=np.full_like(rows, 1 / members), where=sums > 0)
+
+        base = normalise(self.member_share.astype(np.float64))
+        category = (category or self.merchants.get((merchant or '').lower()) or '').lower()
+        prior = base
+        if category in self.categories:
+            prior = normalise(self.category_share[self.categories[category]] + base)
+
+        prices = np.array([float(i.get('price') or 0) * float(i.get('quantity') or 1) for i in items])
+        indicator = np.zeros((len(items), len(self.keywords)), dtype=np.float32)
+        for row, item in enumerate(items):
+            for keyword in item_keywords(item.get('name')):
+                if keyword in self.keywords:
+                    indicator[row, self.keywords[keyword]] = 1
+        affinity = indicator @ normalise(self.keyword_share.astype(np.float64))
+        probabilities = normalise(affinity + prior_weight * prior)
+
+        amounts = prices @ probabilities
+        if not len(items) and total:
+            amounts = float(total) * prior
+        return {
+            'amounts': amounts,
+            'item_probabilities': probabilities,
+            'matched_items': int(np.count_nonzero(indicator.any(axis=1))),
+            'category': category or None
+        }
+
+    def to_bytes(self) -> bytes:
+        """MAGIC, uint32 header length, JSON header padded to 8 bytes, float32 matrices"""
+        buffers = [np.ascontiguousarray(getattr(self, m), dtype='<f4') for m in self.MATRICES]
+        header = json.dumps({
+            'members': self.members, 'names': self.names, 'categories': self.categories,
+            'keywords': self.keywords, 'merchants': self.merchants, 'bills': self.bills,
+            'watermark': self.watermark, 'recent': self.recent, 'version': self.version,
+            'shapes': {m: list(b.shape) for m, b in zip(self.MATRICES, buffers)}
+        }).encode()
+        header += b' ' * (-(len(self.MAGIC) + 4 + len(header)) % 8)
+        return b''.join([self.MAGIC, np.uint32(len(header)).astype('<u4').tobytes(), header,
+                         *(b.tobytes() for b in buffers)])
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'SplitModel':
+        if payload[:4] != cls.MAGIC:
+            raise ValueError("Not a split model")
+        length = int(np.frombuffer(payload[4:8], dtype='<u4')[0])
+        header = json.loads(payload[8:8 + length])
+        model = cls()
+        model.members, model.names = header['members'], header['names']
+        model.categories, model.keywords = header['categories'], header['keywords']
+        model.merchants, model.bills = header['merchants'], header['bills']
+        model.watermark = header['watermark']
+        model.recent = header.get('recent', {})
+        model.version = header.get('version')
+        model._member_index = {m: i for i, m in enumerate(model.members)}
+        offset = 8 + length
+        for name in cls.MATRICES:
+            shape = header['shapes'][name]
+            count = int(np.prod(shape))
+            setattr(model, name, np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+                    .reshape(shape).copy())
+            offset += count * 4
+        return model
+
+class SplitPredictor:
+    """Per-group SplitModels behind a process LRU and Redis, refreshed on bill completion.
+
+    A bills trigger NOTIFYs bill_completed with the group id and the
+    completion (migration 011: `group:bill:completed_at`). Every process's
+    listener drops the group from its LRU; the first to claim the completion
+    in Redis bumps the group's version, marking the stored model stale. Requests then
+    touch Postgres only for the first read after a bill completes, and only
+    for bills completed since the model's watermark, less `overlap` seconds
+    for transactions that committed after a later bill. bills.completed_at
+    is stamped by a trigger (migration 010). A listener reconnect bumps a
+    global epoch instead, since notifications may have been missed.
+    """
+
+    CHANNEL = 'bill_completed'
+
+    BILLS_QUERY = """
+        SELECT b.id, b.merchant_name, b.merchant_category, b.items, b.completed_at,
+               json_agg(json_build_object(
+                   'user_id', bp.user_id, 'name', u.name,
+                   'amount_owed', bp.amount_owed, 'items_claimed', bp.items_claimed
+               )) AS participants
+        FROM bills b
+        JOIN bill_participants bp ON bp.bill_id = b.id
+        JOIN users u ON u.id = bp.user_id
+        WHERE b.group_id = %(group_id)s
+            AND b.status = 'completed'
+            AND (%(watermark)s::timestamptz IS NULL
+                 OR b.completed_at >= %(watermark)s::timestamptz - %(overlap)s * INTERVAL '1 second')
+        GROUP BY b.id
+        ORDER BY b.completed_at, b.id
+    """
+
+    def __init__(self, redis_conn, listener: Optional[PostgresListener] = None,
+                 key_prefix: str = 'split_model:', ttl: int = 30 * 86400,
+                 local_ttl: float = 300, local_size: int = 10_000, overlap: float = 900):
+        self.redis = redis_conn
+        self.listener = listener
+        self.key_prefix = key_prefix
+        self.ttl = ttl
+        self.overlap = overlap
+        self.local = LRUCache(local_size, ttl=local_ttl)
+        self.stats = {'local': 0, 'redis': 0, 'refresh': 0}
+        self._invalidations = 0
+        if listener is not None:
+            listener.subscribe(self.CHANNEL, self.invalidate, on_reconnect=self._missed_notifications)
+
+    def fetch_bills(self, group_id: str, watermark: Optional[str]) -> List[Dict]:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            cur.execute(self.BILLS_QUERY, {'group_id': group_id, 'watermark': watermark,
+                                           'overlap': self.overlap})
+            return cur.fetchall()
+        finally:
+            cur.close()
+            conn.close()
+
+    def refresh(self, group_id: str, model: Optional[SplitModel] = None) -> SplitModel:
+        """Fold bills completed since the model's watermark into it"""
+        model = model or SplitModel()
+        for bill in self.fetch_bills(group_id, model.watermark):
+            model.add_bill(bill)
+        if model.watermark:
+            model.forget_before(datetime.fromisoformat(model.watermark) - timedelta(seconds=self.overlap))
+        return model
+
+    def model(self, group_id: str) -> SplitModel:
+        group_id = str(group_id)
+        model = self.local.get(group_id)
+        if model is not None:
+            self.stats['local'] += 1
+            return model
+        if self.listener is not None:
+            self.listener.start()
+
+        invalidations = self._invalidations
+        key = self.key_prefix + group_id
+        try:
+            payload, epoch, group_version = self.redis.mget(
+                key, self.key_prefix + 'epoch', self.key_prefix + 'version:' + group_id)
+        except redis.RedisError as e:
+            logger.warning(f"Split model cache read failed: {e}")
+            payload = epoch = group_version = None
+        version = f"{int(epoch or 0)}:{int(group_version or 0)}"
+
+        model = None
+        if payload:
+            try:
+                model = SplitModel.from_bytes(payload)
+            except ValueError as e:
+                logger.warning(f"Split model for {group_id} unreadable, rebuilding: {e}")
+        if model is not None and model.version == version:
+            self.stats['redis'] += 1
+        else:
+            # Version was read before querying, so a completion during the refresh stays visible
+            self.stats['refresh'] += 1
+            model = self.refresh(group_id, model)
+            model.version = version
+            try:
+                self.redis.setex(key, self.ttl, model.to_bytes())
+            except redis.RedisError as e:
+                logger.warning(f"Split model for {group_id} not saved: {e}")
+
+        # Any invalidation meanwhile (of this group or another) may have read an older version
+        if self._invalidations == invalidations:
+            self.local.put(group_id, model)
+        return model
+
+    def invalidate(self, payload: str):
+        """Handle a bill_completed payload: `group_id[:completion id]`"""
+        group_id, _, completion = str(payload).partition(':')
+        self._invalidations += 1
+        self.local.delete(group_id)
         try:
-            # Popular ETFs and stocks
-            symbols = ['SPY', 'QQQ', 'VTI', 'BND', 'GLD', 'AAPL', 'GOOGL', 'MSFT']
-            
-            market_data = {}
-            for symbol in symbols:
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                hist = ticker.history(period="1mo")
-                
-                market_data[symbol] = {
-                    'current_price': info.get('regularMarketPrice', 0),
-                    'day_change': info.get('regularMarketChangePercent', 0),
-                    'volume': info.get('regularMarketVolume', 0),
-                    'pe_ratio': info.get('trailingPE', 0),
-                    'market_cap': info.get('marketCap', 0),
-                    'volatility': hist['Close'].pct_change().std() * np.sqrt(252)
-                }
-            
-            # Add market sentiment
-            market_data['sentiment'] = await self.get_market_sentiment()
-            
-            return market_data
-            
-        except Exception as e:
-            logger.error(f"Market data fetch error: {e}")
-            return {}
-    
-    async def get_market_sentiment(self) -> Dict:
-        """Analyze market sentiment from news"""
-        # In production, fetch from news APIs
-        # For now, return mock data
-        return {
-            'overall': 'neutral',
-            'score': 0.6,
-            'fear_greed_index': 55
-        }
-    
-    def generate_recommendations(self, profile: Dict, amount: float, 
-                                market_data: Dict) -> Dict:
-        """Generate investment recommendations based on profile and market"""
-        
-        risk_profile = self.risk_profiles[profile['risk_profile']]
-        recommendations = []
-        
-        # Allocate based on risk profile
-        stock_amount = amount * risk_profile['stocks']
-        bond_amount = amount * risk_profile['bonds']
-        cash_amount = amount * risk_profile['cash']
-        
-        # Stock recommendations
-        if stock_amount > 0:
-            if profile['risk_profile'] == 'conservative':
-                recommendations.append({
-                    'symbol': 'VTI',
-                    'name': 'Vanguard Total Stock Market ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.7,
-                    'reason': 'Broad market exposure with low fees'
-                })
-                recommendations.append({
-                    'symbol': 'VIG',
-                    'name': 'Vanguard Dividend Appreciation ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.3,
-                    'reason': 'Stable dividend-paying companies'
-                })
-            elif profile['risk_profile'] == 'moderate':
-                recommendations.append({
-                    'symbol': 'VOO',
-                    'name': 'Vanguard S&P 500 ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.5,
-                    'reason': 'Core large-cap exposure'
-                })
-                recommendations.append({
-                    'symbol': 'QQQ',
-                    'name': 'Invesco QQQ Trust',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.3,
-                    'reason': 'Technology sector growth'
-                })
-                recommendations.append({
-                    'symbol': 'VXUS',
-                    'name': 'Vanguard International Stock ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.2,
-                    'reason': 'International diversification'
-                })
-            else:  # aggressive
-                recommendations.append({
-                    'symbol': 'ARKK',
-                    'name': 'ARK Innovation ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.3,
-                    'reason': 'Disruptive innovation exposure'
-                })
-                recommendations.append({
-                    'symbol': 'SOXX',
-                    'name': 'iShares Semiconductor ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.3,
-                    'reason': 'High-growth semiconductor sector'
-                })
-                recommendations.append({
-                    'symbol': 'ICLN',
-                    'name': 'iShares Global Clean Energy ETF',
-                    'type': 'etf',
-                    'amount': stock_amount * 0.4,
-                    'reason': 'Clean energy megatrend'
-                })
-        
-        # Bond recommendations
-        if bond_amount > 0:
-            recommendations.append({
-                'symbol': 'BND',
-                'name': 'Vanguard Total Bond Market ETF',
-                'type': 'etf',
-                'amount': bond_amount * 0.7,
-                'reason': 'Diversified bond exposure'
-            })
-            recommendations.append({
-                'symbol': 'TIP',
-                'name': 'iShares TIPS Bond ETF',
-                'type': 'etf',
-                'amount': bond_amount * 0.3,
-                'reason': 'Inflation protection'
-            })
-        
-        # Calculate expected returns
-        for rec in recommendations:
-            if rec['symbol'] in market_data:
-                rec['current_price'] = market_data[rec['symbol']]['current_price']
-                rec['shares'] = rec['amount'] / rec['current_price']
-                rec['expected_return'] = self.calculate_expected_return(
-                    rec['symbol'],
-                    market_data
-                )
-        
+            redis_layer.incr(self.key_prefix + 'version:' + group_id, ttl=self.ttl,
+                             once=self.key_prefix + 'notified:' + completion if completion else None,
+                             client=self.redis)
+        except redis.RedisError as e:
+            logger.warning(f"Split model invalidation failed: {e}")
+
+    def _missed_notifications(self):
+        self._invalidations += 1
+        self.local.clear()
+        try:
+            self.redis.incr(self.key_prefix + 'epoch')
+        except redis.RedisError as e:
+            logger.warning(f"Split model epoch bump failed: {e}")
+
+    def predict(self, group_id: str, items: List[Dict], merchant: Optional[str] = None,
+                category: Optional[str] = None, total: Optional[float] = None) -> Dict:
+        model = self.model(group_id)
+        scored = model.score(items, merchant, category, total)
+        amounts = scored['amounts']
+
+        predictions = [{
+            'user_id': user_id,
+            'name': name,
+            'predicted_amount': round(float(amount), 2),
+            'confidence': min(float(bills) / 10, 1.0)  # Cap at 100%
+        } for user_id, name, amount, bills in zip(model.members, model.names, amounts, model.member_bills)]
+        predictions.sort(key=lambda p: p['predicted_amount'], reverse=True)
+
+        probabilities = scored['item_probabilities']
+        assignments = [{
+            'index': row,
+            'name': item.get('name'),
+            'user_id': model.members[int(np.argmax(probabilities[row]))],
+            'probability': round(float(probabilities[row].max()), 3)
+        } for row, item in enumerate(items)] if model.members else []
+
         return {
-            'recommendations': recommendations,
-            'total_amount': amount,
-            'allocation': risk_profile,
-            'expected_portfolio_return': self.calculate_portfolio_return(recommendations),
-            'risk_score': risk_profile['risk_score']
+            'predictions': predictions,
+            'item_assignments': assignments,
+            'total_amount': round(sum(float(i.get('price') or 0) * float(i.get('quantity') or 1)
+                                      for i in items) if items else float(total or 0), 2),
+            'bills_learned': model.bills,
+            'matched_items': scored.get('matched_items', 0),
+            'merchant_category': scored.get('category'),
+            'method': 'learned_affinity' if model.bills else 'no_history'
         }
-    
-    def calculate_expected_return(self, symbol: str, market_data: Dict) -> float:
-        """Calculate expected return for a symbol"""
-        # Simplified calculation - in production use more sophisticated models
-        if symbol in market_data:
-            volatility = market_data[symbol].get('volatility', 0.15)
-            sentiment_score = market_data.get('sentiment', {}).get('score', 0.5)
-            
-            # Base return + sentiment adjustment
-            base_return = 0.08  # 8% historical average
-            sentiment_adjustment = (sentiment_score - 0.5) * 0.1
-            
-            return base_return + sentiment_adjustment
-        
-        return 0.07  # Default 7% return
-    
-    def calculate_portfolio_return(self, recommendations: List[Dict]) -> float:
-        """Calculate weighted portfolio return"""
-        total_amount = sum(rec['amount'] for rec in recommendations)
-        if total_amount == 0:
-            return 0
-        
-        weighted_return = sum(
-            rec['amount'] * rec.get('expected_return', 0.07) / total_amount
-            for rec in recommendations
-        )
-        
-        return weighted_return
-    
-    async def generate_ai_insights(self, profile: Dict, 
-                                  recommendations: Dict,
-                                  market_data: Dict) -> List[str]:
-        """Generate AI-powered insights"""
-        insights = []
-        
-        # Portfolio balance insight
-        allocation = recommendations['allocation']
-        if allocation['stocks'] > 0.7:
-            insights.append(
-                "Your portfolio is heavily weighted toward stocks. "
-                "Consider rebalancing if market volatility increases."
-            )
-        elif allocation['bonds'] > 0.5:
-            insights.append(
-                "Conservative allocation detected. "
-                "You may want to increase equity exposure for long-term growth."
-            )
-        
-        # Market timing insight
-        sentiment = market_data.get('sentiment', {})
-        if sentiment.get('fear_greed_index', 50) < 30:
-            insights.append(
-                "Market fear is high - this could be a good buying opportunity "
-                "for long-term investors."
-            )
-        elif sentiment.get('fear_greed_index', 50) > 70:
-            insights.append(
-                "Market greed is elevated - consider taking some profits "
-                "or waiting for better entry points."
-            )
-        
-        # Diversification insight
-        if len(profile.get('holdings', [])) < 5:
-            insights.append(
-                "Your portfolio could benefit from more diversification. "
-                "Consider adding different asset classes or sectors."
-            )
-        
-        # Cost optimization
-        total_amount = recommendations['total_amount']
-        if total_amount < 1000:
-            insights.append(
-                "With smaller amounts, focus on low-cost index ETFs "
-                "to minimize fees impact on returns."
-            )
-        
-        return insights
 
-investment_analyzer = InvestmentAnalyzer()
+split_predictor = SplitPredictor(
+    redis_client,
+    listener=pg_listener,
+    local_ttl=float(os.getenv('SPLIT_MODEL_LOCAL_TTL', 300))
+)
 
 # ========================
 # Fraud Detection
@@ -893,19 +4945,38 @@ async def process_receipt():
         image = request.files['image']
         image_data = image.read()
         
-        # Process receipt
+        # Process receipt (cached by image hash)
         result = await receipt_processor.process_receipt(image_data)
         
-        # Cache result
-        cache_key = f"receipt:{hashlib.md5(image_data).hexdigest()}"
-        redis_client.setex(cache_key, 3600, json.dumps(result))
-        
         return jsonify(result)
         
     except Exception as e:
         logger.error(f"Receipt processing error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ocr/reparse', methods=['POST'])
+def reparse_receipts():
+    """Re-run the receipt parser on stored OCR output for one or more image hashes"""
+    try:
+        data = request.json or {}
+        image_hashes = data.get('image_hashes') or ([data['image_hash']] if data.get('image_hash') else [])
+        
+        if not image_hashes:
+            return jsonify({'error': 'image_hash or image_hashes required'}), 400
+        if len(image_hashes) > 1000:
+            return jsonify({'error': 'At most 1000 image hashes per request'}), 400
+        
+        results = receipt_reparser.reparse(image_hashes, data.get('engine'))
+        
+        return jsonify({
+            'results': results,
+            'missing': [h for h in image_hashes if h not in results]
+        })
+        
+    except Exception as e:
+        logger.error(f"Receipt re-parse error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/investment/recommendations', methods=['POST'])
 async def get_investment_recommendations():
     """Get AI-powered investment recommendations"""
@@ -943,6 +5014,7 @@ async def check_fraud():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/insights/spending', methods=['GET'])
+@cached_route(CACHES['spending_insights'], tags=lambda: [f"user:{request.args.get('user_id')}"])
 def get_spending_insights():
     """Get AI-generated spending insights for user"""
     try:
@@ -952,68 +5024,27 @@ def get_spending_insights():
         if not user_id:
             return jsonify({'error': 'User ID required'}), 400
         
+        period = int(period)
+        if not 1 <= period <= 3650:
+            return jsonify({'error': 'period must be between 1 and 3650 days'}), 400
+        
         conn = get_db_connection()
         cur = conn.cursor()
         
-        # Get spending data
-        cur.execute("""
-            SELECT 
-                DATE(created_at) as date,
-                SUM(amount) as total,
-                COUNT(*) as count,
-                AVG(amount) as avg_amount
-            FROM transactions
-            WHERE user_id = %s 
-                AND type = 'split_payment'
-                AND created_at > NOW() - INTERVAL '%s days'
-            GROUP BY DATE(created_at)
-            ORDER BY date DESC
-        """, (user_id, int(period)))
-        
-        spending_data = cur.fetchall()
-        
-        # Generate insights
-        insights = []
-        
-        if spending_data:
-            total_spent = sum(day['total'] for day in spending_data)
-            avg_daily = total_spent / len(spending_data)
-            
-            insights.append({
-                'type': 'spending_pattern',
-                'title': 'Spending Trend',
-                'insight': f"You've spent ${total_spent:.2f} in the last {period} days, "
-                          f"averaging ${avg_daily:.2f} per day.",
-                'confidence_score': 0.95
-            })
-            
-            # Find peak spending days
-            peak_day = max(spending_data, key=lambda x: x['total'])
-            insights.append({
-                'type': 'peak_spending',
-                'title': 'Highest Spending Day',
-                'insight': f"Your highest spending was ${peak_day['total']:.2f} on {peak_day['date']}.",
-                'confidence_score': 1.0
-            })
-        
-        # Add AI-generated recommendations
-        if total_spent > avg_daily * 30 * 1.2:  # 20% over average
-            insights.append({
-                'type': 'savings_opportunity',
-                'title': 'Savings Opportunity',
-                'insight': "Your spending is 20% higher than usual. "
-                          "Consider reviewing recurring expenses for savings opportunities.",
-                'potential_savings': total_spent * 0.15,
-                'confidence_score': 0.8
-            })
+        try:
+            # Get spending data from the daily rollup
+            series = spending_rollups.series(cur, user_id, spending_analytics.history_days(period))
+        finally:
+            cur.close()
+            conn.close()
         
-        cur.close()
-        conn.close()
+        analysis = spending_analytics.analyze(series, period)
         
         return jsonify({
-            'insights': insights,
+            'insights': spending_analytics.insights(analysis),
             'period_days': period,
-            'total_spent': total_spent if spending_data else 0
+            'total_spent': analysis['total_spent'],
+            'analytics': analysis
         })
         
     except Exception as e:
@@ -1029,27 +5060,95 @@ def market_history():
         interval = request.args.get('interval', '1d')  # 1m,5m,15m,1h,1d,1wk,1mo
         symbols = [s.strip().upper() for s in symbols_param.split(',') if s.strip()]
 
-        result = {}
-        for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                hist = ticker.history(period=period, interval=interval)
-                # Convert to lists for JSON
-                timestamps = [int(pd.Timestamp(idx).timestamp()) for idx in hist.index]
-                closes = [float(v) for v in hist['Close'].tolist()]
-                result[symbol] = {
-                    'timestamps': timestamps,
-                    'close': closes
-                }
-            except Exception as e:
-                logger.warning(f"Failed to fetch history for {symbol}: {e}")
-                result[symbol] = {'timestamps': [], 'close': []}
+        if interval not in INTERVAL_SECONDS:
+            return jsonify({'error': f'Unsupported interval {interval}'}), 400
+        invalid = [s for s in symbols if not SYMBOL_PATTERN.match(s)]
+        if invalid:
+            return jsonify({'error': f"Invalid symbols: {', '.join(invalid)}"}), 400
 
-        return jsonify(result)
+        fields = [f.strip() for f in request.args.get('fields', 'close').split(',') if f.strip()]
+        if not fields or any(f not in HISTORY_FIELDS for f in fields):
+            return jsonify({'error': f"fields must be a subset of {','.join(HISTORY_FIELDS)}"}), 400
+        points = request.args.get('points', type=int)
+        method = request.args.get('downsample', 'lttb')  # lttb, ohlc
+        if method not in ('lttb', 'ohlc'):
+            return jsonify({'error': f'Unsupported downsample method {method}'}), 400
+
+        mimetype = negotiate_history_format()
+        if mimetype is None:
+            return jsonify({'error': 'No acceptable response format',
+                            'available': list(HISTORY_FORMATS)}), 406
+
+        history = market_history_service.get(symbols, period, interval)
+        if points:
+            history = {symbol: downsample_history(bars, points, method)
+                       for symbol, bars in history.items()}
+
+        response = app.response_class(HISTORY_ENCODERS[mimetype](history, fields), mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
     except Exception as e:
         logger.error(f"Market history error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/goals/projection', methods=['POST'])
+def project_goals():
+    """Probability of reaching goals, by goal ids or for a user's/group's active goals"""
+    try:
+        data = request.json or {}
+        goal_ids = data.get('goal_ids') or ([data['goal_id']] if data.get('goal_id') else [])
+        user_id = data.get('user_id')
+        group_id = data.get('group_id')
+        
+        if not (goal_ids or user_id or group_id):
+            return jsonify({'error': 'goal_ids, user_id or group_id required'}), 400
+        
+        goals = goal_projector.load_goals(goal_ids, user_id, group_id)
+        if not goals:
+            return jsonify({'error': 'No active goals found'}), 404
+        
+        projections = goal_projector.project(
+            goals,
+            paths=int(data.get('paths', 10_000)),
+            horizon_months=int(data.get('horizon_months', 120))
+        )
+        
+        return jsonify({
+            'projections': projections,
+            'moments_source': portfolio_optimizer.frontier()['source']
+        })
+        
+    except Exception as e:
+        logger.error(f"Goal projection error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sentiment', methods=['POST'])
+async def score_sentiment():
+    """Score the sentiment of supplied texts (e.g. news headlines)"""
+    try:
+        data = request.json or {}
+        texts = [str(t) for t in data.get('texts', []) if str(t).strip()]
+        
+        if not texts:
+            return jsonify({'error': 'texts required'}), 400
+        
+        sentiment_service.start()
+        sentiment_service.loaded.wait(timeout=30)
+        if not sentiment_service.ready:
+            return jsonify({'error': sentiment_service.error or 'Sentiment model loading'}), 503
+        
+        futures = [sentiment_service.submit(text) for text in texts]
+        scores = await asyncio.gather(*[asyncio.wrap_future(f) for f in futures])
+        
+        return jsonify({
+            'scores': [{'text': text, 'positive': round(score, 4)} for text, score in zip(texts, scores)],
+            'average': np.round(np.mean(scores), 4)
+        })
+        
+    except Exception as e:
+        logger.error(f"Sentiment scoring error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/predict/split', methods=['POST'])
 def predict_split():
     """Predict how to split a bill based on historical patterns"""
@@ -1059,54 +5158,387 @@ def predict_split():
         merchant = data.get('merchant')
         items = data.get('items', [])
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Get historical split patterns
-        cur.execute("""
-            SELECT 
-                bp.user_id,
-                u.name,
-                AVG(bp.amount_owed) as avg_amount,
-                COUNT(*) as frequency
-            FROM bill_participants bp
-            JOIN bills b ON bp.bill_id = b.id
-            JOIN users u ON bp.user_id = u.id
-            WHERE b.group_id = %s
-                AND b.status = 'completed'
-            GROUP BY bp.user_id, u.name
-        """, (group_id,))
-        
-        patterns = cur.fetchall()
-        
-        # Generate predictions
-        predictions = []
-        total_amount = sum(item['price'] for item in items)
-        
-        for pattern in patterns:
-            weight = pattern['frequency'] / sum(p['frequency'] for p in patterns)
-            predicted_amount = total_amount * weight
-            
-            predictions.append({
-                'user_id': pattern['user_id'],
-                'name': pattern['name'],
-                'predicted_amount': round(predicted_amount, 2),
-                'confidence': min(pattern['frequency'] / 10, 1.0)  # Cap at 100%
-            })
-        
-        cur.close()
-        conn.close()
+        if not group_id:
+            return jsonify({'error': 'Group ID required'}), 400
         
-        return jsonify({
-            'predictions': predictions,
-            'total_amount': total_amount,
-            'method': 'historical_pattern'
-        })
+        return jsonify(split_predictor.predict(
+            group_id,
+            items,
+            merchant=merchant,
+            category=data.get('merchant_category'),
+            total=data.get('total')
+        ))
         
     except Exception as e:
         logger.error(f"Split prediction error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/redis/stats', methods=['GET'])
+def redis_stats():
+    """This worker's Redis pool usage and per-command latency percentiles"""
+    try:
+        return jsonify(redis_layer.stats())
+    except Exception as e:
+        logger.error(f"Redis stats error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/receipts/archive/stats', methods=['GET'])
+def receipt_archive_stats():
+    """Uploads, dedupe hits and bytes saved by this worker's receipt archiver"""
+    return jsonify(receipt_archive.stats())
+
+@app.route('/api/responses/stats', methods=['GET'])
+def response_stats():
+    """This worker's response encode time per endpoint and format"""
+    return jsonify({
+        'encode': response_encode_latency.snapshot(),
+        'compression': {'min_size': response_compressor.min_size,
+                        'encodings': response_compressor.encodings()}
+    })
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit ratios and counters per cache"""
+    return jsonify({name: cache.stats() for name, cache in CACHES.items()})
+
+@app.route('/api/scheduler/jobs', methods=['GET'])
+def scheduler_status():
+    """Scheduled jobs, the current leader and each job's last run"""
+    try:
+        return jsonify(scheduler.status())
+    except Exception as e:
+        logger.error(f"Scheduler status error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/scheduler/jobs/<name>/history', methods=['GET'])
+def scheduler_history(name):
+    """Recent runs of one job, newest first"""
+    try:
+        if name not in scheduler.jobs:
+            return jsonify({'error': 'Unknown job'}), 404
+        limit = min(int(request.args.get('limit', 20)), scheduler.history_size)
+        return jsonify({'job': name, 'runs': scheduler.history(name, limit)})
+    except Exception as e:
+        logger.error(f"Scheduler history error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+# ========================
+# Scheduler
+# ========================
+
+class ScheduledJob:
+    """A job due every `interval` seconds (aligned to the epoch) or daily at 'HH:MM' local time"""
+
+    def __init__(self, name: str, fn, interval: Optional[float] = None, at: Optional[str] = None,
+                 shards: int = 1, max_runtime: float = 3600, misfire_grace: float = 300):
+        if (interval is None) == (at is None):
+            raise ValueError("Give exactly one of interval or at")
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.at = datetime.strptime(at, '%H:%M').time() if at else None
+        self.shards = shards
+        self.max_runtime = max_runtime
+        self.misfire_grace = misfire_grace
+
+    def last_due(self, now: float) -> float:
+        if self.interval:
+            return now - now % self.interval
+        today = datetime.combine(datetime.fromtimestamp(now).date(), self.at).timestamp()
+        return today if today <= now else today - 86400
+
+    def next_due(self, now: float) -> float:
+        if self.interval:
+            return self.last_due(now) + self.interval
+        return self.last_due(now) + 86400
+
+class DistributedScheduler:
+    """Runs each scheduled job once per due time across all service processes.
+
+    Every process runs two threads. The leader thread contends for a Redis
+    lease; the current leader sleeps until the next due time and enqueues
+    that occurrence's shards on a Redis list. The worker thread in every
+    process pops shards and runs them, so sharded jobs spread across
+    replicas. Occurrences are claimed with SET NX on their due time, which
+    keeps them exactly-once across leader changes. A per-job lock skips an
+    occurrence while the previous run is still going. The shard that
+    finishes last appends the run, with its duration, to the job's history.
+
+    Workers move a shard onto their own processing list (BLMOVE) and remove
+    it when it completes. Each process keeps an alive key refreshed; when
+    one lapses, the leader moves that instance's unfinished shards back to
+    the queue, so a worker restarting mid-shard delays the run instead of
+    losing it and holding the job lock until max_runtime.
+    """
+
+    RENEW_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('pexpire', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    RELEASE_SCRIPT = """
+        if redis.call('get', KEYS[1]) == ARGV[1] then
+            return redis.call('del', KEYS[1])
+        end
+        return 0
+    """
+
+    # KEYS: alive key, processing list, queue, instances set
+    REQUEUE_SCRIPT = """
+        if redis.call('exists', KEYS[1]) == 1 then
+            return -1
+        end
+        local moved = 0
+        while redis.call('lmove', KEYS[2], KEYS[3], 'LEFT', 'RIGHT') do
+            moved = moved + 1
+        end
+        redis.call('srem', KEYS[4], ARGV[1])
+        return moved
+    """
+
+    def __init__(self, redis_conn, prefix: str = 'scheduler:', lease_ttl: float = 15,
+                 history_size: int = 50, poll_timeout: int = 5):
+        self.redis = redis_conn
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.history_size = history_size
+        self.poll_timeout = poll_timeout
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs = {}
+        self.is_leader = False
+        self._renew = redis_conn.register_script(self.RENEW_SCRIPT)
+        self._release = redis_conn.register_script(self.RELEASE_SCRIPT)
+        self._requeue = redis_conn.register_script(self.REQUEUE_SCRIPT)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def add_job(self, name: str, fn, **options) -> ScheduledJob:
+        job = ScheduledJob(name, fn, **options)
+        self.jobs[name] = job
+        return job
+
+    def _key(self, *parts) -> str:
+        return self.prefix + ':'.join(str(p) for p in parts)
+
+    # Leadership and triggering
+
+    def heartbeat(self):
+        """Mark this instance alive so the leader leaves its processing list alone"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.sadd(self._key('instances'), self.instance_id)
+        pipe.set(self._key('alive', self.instance_id), 1, px=int(self.lease_ttl * 1000))
+        pipe.execute()
+
+    def elect(self) -> bool:
+        key, ttl_ms = self._key('leader'), int(self.lease_ttl * 1000)
+        try:
+            if self.is_leader and self._renew(keys=[key], args=[self.instance_id, ttl_ms]):
+                return True
+            self.is_leader = bool(self.redis.set(key, self.instance_id, nx=True, px=ttl_ms))
+        except redis.RedisError as e:
+            logger.warning(f"Scheduler election failed: {e}")
+            self.is_leader = False
+        return self.is_leader
+
+    def tick(self, now: float) -> List[str]:
+        """Trigger every job whose latest due time is within its misfire grace"""
+        triggered = []
+        for job in self.jobs.values():
+            due = job.last_due(now)
+            if now - due <= job.misfire_grace and self.trigger(job, due):
+                triggered.append(job.name)
+        return triggered
+
+    def trigger(self, job: ScheduledJob, due: float, manual: bool = False) -> bool:
+        """Claim one occurrence and enqueue its shards; False if already claimed"""
+        occurrence = f"{due:.0f}" + (f"-manual-{uuid.uuid4().hex[:8]}" if manual else '')
+        claim_ttl = int(max(job.interval or 86400, job.misfire_grace) * 2)
+        if not self.redis.set(self._key('claimed', job.name, occurrence), self.instance_id,
+                              nx=True, ex=claim_ttl):
+            return False
+
+        run_id = f"{job.name}:{occurrence}"
+        if not self.redis.set(self._key('running', job.name), run_id, nx=True,
+                              ex=int(job.max_runtime)):
+            running = self.redis.get(self._key('running', job.name))
+            self._record(job.name, {'run_id': run_id, 'due': due, 'status': 'skipped',
+                                    'reason': 'previous run still in progress',
+                                    'running': running.decode() if running else None})
+            logger.warning(f"Scheduler skipped {run_id}: previous run still in progress")
+            return True
+
+        run_key = self._key('run', run_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(run_key, mapping={'job': job.name, 'due': due, 'enqueued_at': time.time(),
+                                    'shards': job.shards, 'done': 0, 'failed': 0})
+        pipe.expire(run_key, int(job.max_runtime) + 3600)
+        pipe.lpush(self._key('queue'), *[json.dumps({'run_id': run_id, 'job': job.name,
+                                                      'shard': shard, 'shards': job.shards})
+                                          for shard in range(job.shards)])
+        pipe.execute()
+        logger.info(f"Scheduler enqueued {run_id} ({job.shards} shard(s))")
+        return True
+
+    def requeue_orphans(self) -> int:
+        """Return shards held by instances whose alive key expired to the queue"""
+        requeued = 0
+        for instance in self.redis.smembers(self._key('instances')):
+            instance = instance.decode()
+            moved = self._requeue(keys=[self._key('alive', instance), self._key('processing', instance),
+                                        self._key('queue'), self._key('instances')],
+                                  args=[instance])
+            if moved > 0:
+                logger.warning(f"Scheduler requeued {moved} shard(s) from dead instance {instance}")
+                requeued += moved
+        return requeued
+
+    def run_now(self, name: str) -> bool:
+        """Enqueue a job immediately, outside its schedule (still overlap-protected)"""
+        return self.trigger(self.jobs[name], time.time(), manual=True)
+
+    # Execution
+
+    def execute(self, task: Dict, raw: Optional[bytes] = None):
+        """Run one shard; raw is its queue entry, acknowledged with the shard's result"""
+        job = self.jobs.get(task['job'])
+        run_key = self._key('run', task['run_id'])
+        started = time.time()
+        self.redis.hsetnx(run_key, 'started_at', started)
+        error = None
+        try:
+            if job is None:
+                raise KeyError(f"Unknown job {task['job']}")
+            if task['shards'] > 1:
+                job.fn(shard=task['shard'], shards=task['shards'])
+            else:
+                job.fn()
+        except Exception as e:
+            error = f"shard {task['shard']}: {e}"
+            logger.error(f"Scheduled job {task['run_id']} failed: {error}")
+
+        pipe = self.redis.pipeline()
+        if error:
+            pipe.hincrby(run_key, 'failed', 1)
+            pipe.hset(run_key, f"error:{task['shard']}", error)
+        pipe.hincrbyfloat(run_key, 'shard_seconds', time.time() - started)
+        if raw is not None:
+            pipe.lrem(self._key('processing', self.instance_id), 1, raw)
+        pipe.hincrby(run_key, 'done', 1)
+        done = pipe.execute()[-1]
+        if done >= task['shards']:
+            self._finish(task, run_key)
+
+    def _finish(self, task: Dict, run_key: str):
+        run = {k.decode(): v.decode() for k, v in self.redis.hgetall(run_key).items()}
+        finished = time.time()
+        started = float(run.get('started_at', finished))
+        entry = {
+            'run_id': task['run_id'],
+            'due': float(run.get('due', 0)),
+            'status': 'failed' if int(run.get('failed', 0)) else 'succeeded',
+            'shards': task['shards'],
+            'started_at': started,
+            'finished_at': finished,
+            'duration_seconds': round(finished - started, 3),
+            'shard_seconds': round(float(run.get('shard_seconds', 0)), 3),
+            'delay_seconds': round(started - float(run.get('due', started)), 3),
+            'errors': [v for k, v in run.items() if k.startswith('error:')]
+        }
+        pipe = self.redis.pipeline()
+        self._record(task['job'], entry, pipe)
+        self._release(keys=[self._key('running', task['job'])], args=[task['run_id']], client=pipe)
+        pipe.delete(run_key)
+        pipe.execute()
+        logger.info(f"Scheduled job {task['run_id']} {entry['status']} "
+                    f"in {entry['duration_seconds']}s")
+
+    def _record(self, name: str, entry: Dict, pipe=None):
+        key = self._key('history', name)
+        own = pipe is None
+        pipe = self.redis.pipeline() if own else pipe
+        pipe.lpush(key, json.dumps(entry, default=str))
+        pipe.ltrim(key, 0, self.history_size - 1)
+        if own:
+            pipe.execute()
+
+    def history(self, name: str, limit: int = 20) -> List[Dict]:
+        return [json.loads(e) for e in self.redis.lrange(self._key('history', name), 0, limit - 1)]
+
+    def status(self) -> Dict:
+        now = time.time()
+        names = list(self.jobs)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.get(self._key('leader'))
+        for name in names:
+            pipe.exists(self._key('running', name))
+            pipe.lindex(self._key('history', name), 0)
+        leader, *replies = pipe.execute()
+        return {
+            'leader': leader.decode() if leader else None,
+            'instance': self.instance_id,
+            'is_leader': self.is_leader,
+            'jobs': {
+                name: {
+                    'next_due': datetime.fromtimestamp(self.jobs[name].next_due(now)).isoformat(),
+                    'shards': self.jobs[name].shards,
+                    'running': bool(running),
+                    'last_run': json.loads(last) if last else None
+                } for name, running, last in zip(names, replies[::2], replies[1::2])
+            }
+        }
+
+    # Threads
+
+    def _leader_loop(self):
+        while not self._stop.is_set():
+            wait = self.lease_ttl / 3
+            try:
+                self.heartbeat()
+                if self.elect():
+                    self.requeue_orphans()
+                    now = time.time()
+                    self.tick(now)
+                    next_due = min((job.next_due(now) for job in self.jobs.values()), default=now + wait)
+                    wait = min(wait, max(next_due - time.time(), 0))
+            except Exception as e:
+                logger.error(f"Scheduler leader loop error: {e}")
+            self._stop.wait(wait)
+
+    def _worker_loop(self):
+        queue, processing = self._key('queue'), self._key('processing', self.instance_id)
+        while not self._stop.is_set():
+            item = None
+            try:
+                item = self.redis.blmove(queue, processing, self.poll_timeout, 'RIGHT', 'LEFT')
+                if item:
+                    self.execute(json.loads(item), item)
+            except Exception as e:
+                logger.error(f"Scheduler worker error: {e}")
+                try:
+                    # Unacknowledged: hand the shard back rather than sit on it while alive
+                    if item and self.redis.lrem(processing, 1, item):
+                        self.redis.rpush(queue, item)
+                except redis.RedisError:
+                    pass
+                self._stop.wait(1)
+
+    def start(self):
+        self.heartbeat()
+        for target, name in ((self._leader_loop, 'scheduler-leader'), (self._worker_loop, 'scheduler-worker')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        if self.is_leader:
+            self._release(keys=[self._key('leader')], args=[self.instance_id])
+            self.is_leader = False
+
+scheduler = DistributedScheduler(redis_client, lease_ttl=float(os.getenv('SCHEDULER_LEASE_TTL', 15)))
+
 # ========================
 # Background Tasks
 # ========================
@@ -1115,31 +5547,42 @@ def update_market_data():
     """Periodically update market data cache"""
     try:
         logger.info("Updating market data...")
-        # Implementation here
+        market_data_cache.refresh()
+        market_history_service.sync(MARKET_SYMBOLS, '1d')
+        refresh_risk_analytics(max_age=0)
     except Exception as e:
         logger.error(f"Market data update error: {e}")
+        raise
 
-def generate_daily_insights():
-    """Generate daily insights for all users"""
+def generate_group_recommendations():
+    """Write the daily suggested investment for every group"""
     try:
-        logger.info("Generating daily insights...")
-        # Implementation here
+        logger.info("Generating group recommendations...")
+        group_recommendation_batch.run()
+    except Exception as e:
+        logger.error(f"Group recommendation batch error: {e}")
+        raise
+
+def generate_daily_insights(shard: int = 0, shards: int = 1):
+    """Generate daily insights for all users (or one shard of them)"""
+    try:
+        logger.info(f"Generating daily insights (shard {shard + 1}/{shards})...")
+        daily_insight_pipeline.run(shard=shard, shards=shards)
     except Exception as e:
         logger.error(f"Daily insights generation error: {e}")
+        raise
 
 # Schedule background tasks
-schedule.every(15).minutes.do(update_market_data)
-schedule.every().day.at("06:00").do(generate_daily_insights)
-
-def run_scheduler():
-    """Run scheduled tasks in background thread"""
-    while True:
-        schedule.run_pending()
-        time.sleep(60)
-
-# Start scheduler thread
-scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-scheduler_thread.start()
+scheduler.add_job('update_market_data', update_market_data, interval=15 * 60, max_runtime=15 * 60)
+scheduler.add_job('generate_group_recommendations', generate_group_recommendations,
+                  at='05:30', max_runtime=3600)
+scheduler.add_job('generate_daily_insights', generate_daily_insights, at='06:00',
+                  shards=int(os.getenv('DAILY_INSIGHTS_SHARDS', 4)), max_runtime=4 * 3600)
+
+# Every process executes queued jobs; one of them at a time is the leader that enqueues them.
+# Pool workers that import this module (receipt backfill and re-parse) don't join
+if os.getenv('SCHEDULER_ENABLED', '1') == '1' and multiprocessing.parent_process() is None:
+    scheduler.start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,1034 @@
+# ai-service/benchmarks.py
+# Micro-benchmarks for the AI service, run against local stubs (spending-rollups
+# needs a scratch Postgres: --database-url, or the pgserver package).
+#
+#   python benchmarks.py market-fetch --latency 0.05
+#   python benchmarks.py history-store
+#   python benchmarks.py history-encode --symbols 10 --bars 20000
+#   python benchmarks.py portfolio-optimizer --groups 100000
+#   python benchmarks.py group-recommendations --groups 100000
+#   python benchmarks.py sentiment --batch-sizes 1 8 32 64
+#   python benchmarks.py spending-rollups --rows 10000000 [--database-url postgresql://...]
+#   python benchmarks.py spending-analytics --days 365
+#   python benchmarks.py daily-insights --users 20000
+#   python benchmarks.py split-cache --groups 2000 --requests 5000
+#   python benchmarks.py response-encode --bars 5000
+#   python benchmarks.py receipt-reparse --receipts 20000
+#   python benchmarks.py receipt-layout [--corpus corpus.jsonl | --synthetic --receipts 2000]
+#   python benchmarks.py receipt-crop --images 5 --size 2000
+#   python benchmarks.py receipt-tiles --items 25 50 100 200 400
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('SCHEDULER_ENABLED', '0')  # CLI processes don't join the scheduler
+import AI_CODE
+from AI_CODE import (HISTORY_ENCODERS, FakeMarketDataSource, MarketDataClient,
+                     MarketHistoryService, OHLCVStore, PortfolioOptimizer,
+                     SentimentService, downsample_history)
+
+
+def _timed(fn, repeat: int = 1) -> float:
+    """Best wall time of fn over repeat runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_market_fetch(args):
+    """Wall time vs symbol count: sequential loop vs parallel vs bulk"""
+    print(f"{'symbols':>8} {'sequential':>12} {'parallel':>12} {'bulk':>12}")
+    for count in args.symbols:
+        symbols = [f"SYM{i:04d}" for i in range(count)]
+        source = FakeMarketDataSource(latency=args.latency)
+        parallel = MarketDataClient(source, max_workers=args.workers, bulk=False)
+        bulk = MarketDataClient(source, max_workers=args.workers, bulk=True)
+
+        sequential_s = _timed(lambda: [source.fetch_history(s, '1mo', '1d') for s in symbols])
+        parallel_s = _timed(lambda: parallel.history(symbols, '1mo', '1d'))
+        bulk_s = _timed(lambda: bulk.history(symbols, '1mo', '1d'))
+        print(f"{count:>8} {sequential_s:>11.3f}s {parallel_s:>11.3f}s {bulk_s:>11.3f}s")
+
+
+def bench_history_store(args):
+    """Range queries over 20 years of daily bars served from the local store"""
+    with tempfile.TemporaryDirectory() as root:
+        source = FakeMarketDataSource()
+        service = MarketHistoryService(OHLCVStore(root), MarketDataClient(source))
+        service.sync([args.symbol], '1d')
+        calls = source.calls
+
+        print(f"{'period':>8} {'bars':>8} {'read':>10} {'read+tolist':>12}")
+        for period in ('1mo', '1y', '5y', 'max'):
+            bars = service.get([args.symbol], period, '1d')[args.symbol]
+            read_s = _timed(lambda: service.get([args.symbol], period, '1d'), args.repeat)
+            convert_s = _timed(lambda: {k: v.tolist() for k, v in
+                                        service.get([args.symbol], period, '1d')[args.symbol].items()},
+                               args.repeat)
+            print(f"{period:>8} {len(bars['timestamp']):>8} "
+                  f"{read_s * 1000:>8.2f}ms {convert_s * 1000:>10.2f}ms")
+        print(f"network calls after initial backfill: {source.calls - calls}")
+
+
+def bench_history_encode(args):
+    """Payload size and encode time per response format, with and without downsampling"""
+    source = FakeMarketDataSource(max_bars=args.bars)
+    history = {}
+    for i in range(args.symbols):
+        frame = source._history(f"SYM{i:03d}", 'max', '1m')
+        history[f"SYM{i:03d}"] = {c: frame[c].to_numpy() for c in OHLCVStore.COLUMNS}
+    fields = args.fields.split(',')
+
+    print(f"{args.symbols} symbols x {args.bars} bars, fields={args.fields}")
+    print(f"{'format':>40} {'points':>8} {'bytes':>12} {'encode':>10}")
+    for points in [None] + args.points:
+        for method in (['lttb', 'ohlc'] if points else [None]):
+            for mimetype, encode in HISTORY_ENCODERS.items():
+                if mimetype.endswith('arrow.stream') and AI_CODE.pa is None:
+                    continue
+
+                def run():
+                    data = history
+                    if points:
+                        data = {s: downsample_history(b, points, method) for s, b in data.items()}
+                    return encode(data, fields)
+
+                size = len(run())
+                encode_s = _timed(run, args.repeat)
+                label = f"{mimetype}" + (f" [{method}]" if method else '')
+                print(f"{label:>40} {points or args.bars:>8} {size:>12,} {encode_s * 1000:>8.2f}ms")
+
+
+def bench_portfolio_optimizer(args):
+    """Frontier build time per snapshot and per-group allocation throughput"""
+    optimizer = PortfolioOptimizer(AI_CODE.DEFAULT_INVESTMENT_UNIVERSE)
+    mu, cov = optimizer.prior_moments()
+    build_s = _timed(lambda: optimizer.solve(mu, cov), 3)
+    frontier = optimizer.solve(mu, cov)
+    print(f"frontier: {len(frontier['volatility'])} points over "
+          f"{len(optimizer.symbols)} assets in {build_s * 1000:.1f}ms")
+
+    budgets = np.random.default_rng(0).uniform(0.03, 0.25, args.groups)
+    batch_s = _timed(lambda: optimizer.allocate_many(budgets, frontier), 5)
+    print(f"allocate_many: {args.groups:,} groups in {batch_s * 1000:.1f}ms "
+          f"({args.groups / batch_s:,.0f} groups/s)")
+
+    optimizer._frontier, optimizer._version = frontier, None
+    single = budgets[:min(args.groups, 10_000)]
+    single_s = _timed(lambda: [optimizer.allocate(b) for b in single])
+    print(f"allocate: {len(single):,} single lookups in {single_s * 1000:.1f}ms "
+          f"({len(single) / single_s:,.0f} groups/s)")
+
+
+def bench_group_recommendations(args):
+    """Batch recommendation evaluation for synthetic groups (no database)"""
+    rng = np.random.default_rng(0)
+    strategies = np.array(['conservative', 'moderate', 'aggressive', 'custom'])
+    profiles = pd.DataFrame({
+        'group_id': [f"g{i}" for i in range(args.groups)],
+        'investment_strategy': strategies[rng.integers(0, 4, args.groups)],
+        'amount': rng.choice([50, 100, 250, 500, 1000], args.groups),
+        'max_volatility': np.where(rng.random(args.groups) < 0.05,
+                                   rng.choice([0.08, 0.15], args.groups), np.nan),
+        'cash_reserve': np.nan,
+        'member_count': rng.integers(2, 12, args.groups),
+        'holding_count': rng.integers(0, 10, args.groups),
+    })
+    batch = AI_CODE.group_recommendation_batch
+    market_data = {'sentiment': {'score': 0.6}}
+    batch.optimizer.frontier()
+
+    evaluate_s = _timed(lambda: batch.evaluate(profiles, market_data), 3)
+    evaluation = batch.evaluate(profiles, market_data)
+    build_s = _timed(lambda: batch.build_insights(profiles, evaluation))
+    print(f"{args.groups:,} groups: evaluate {evaluate_s * 1000:.1f}ms, "
+          f"build ai_insights rows {build_s * 1000:.1f}ms "
+          f"({args.groups / (evaluate_s + build_s):,.0f} groups/s)")
+
+
+def bench_sentiment(args):
+    """Texts/sec through the micro-batching queue at different batch sizes"""
+    probe = SentimentService(model_name=args.model, backend=args.backend, quantize=args.quantize)
+    probe.start()
+    probe.loaded.wait()
+    if probe.ready:
+        infer, label = probe._infer, f"{args.model} ({args.backend}{', int8' if args.quantize else ''})"
+    else:
+        # No model backend here: a stub with fixed per-call overhead and per-text cost
+        def infer(texts):
+            time.sleep(args.stub_overhead + args.stub_per_text * len(texts))
+            return [0.5] * len(texts)
+        label = (f"stub ({args.stub_overhead * 1000:.0f}ms/call + "
+                 f"{args.stub_per_text * 1000:.1f}ms/text; model unavailable: {probe.error})")
+
+    print(f"model: {label}")
+    print(f"{'batch':>6} {'texts/s':>10} {'batches':>8} {'cached texts/s':>15}")
+    for batch_size in args.batch_sizes:
+        service = SentimentService(max_batch_size=batch_size, max_wait=0.005, infer_fn=infer)
+        texts = [f"Headline {batch_size}-{i}: markets move on earnings" for i in range(args.texts)]
+        cold_s = _timed(lambda: service.score(texts, timeout=None))
+        warm_s = _timed(lambda: service.score(texts, timeout=None))
+        print(f"{batch_size:>6} {args.texts / cold_s:>10,.0f} {service.batches:>8} "
+              f"{args.texts / warm_s:>15,.0f}")
+
+
+# Minimal subset of migration 001 that migration 003's trigger and the queries touch
+SPENDING_SCHEMA = """
+    CREATE TABLE users (id uuid PRIMARY KEY);
+    CREATE TABLE bills (id uuid PRIMARY KEY, merchant_category varchar(100));
+    CREATE TABLE transactions (
+        id bigserial PRIMARY KEY,
+        user_id uuid REFERENCES users (id),
+        bill_id uuid REFERENCES bills (id),
+        type text NOT NULL,
+        amount numeric(12, 2) NOT NULL,
+        created_at timestamptz DEFAULT NOW()
+    );
+    CREATE INDEX transactions_user_id_index ON transactions (user_id);
+    CREATE INDEX transactions_type_index ON transactions (type);
+    CREATE INDEX transactions_created_at_index ON transactions (created_at);
+    CREATE TABLE spending_daily (
+        user_id uuid NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+        day date NOT NULL,
+        category varchar(100) NOT NULL DEFAULT 'other',
+        total numeric(14, 2) NOT NULL DEFAULT 0,
+        txn_count integer NOT NULL DEFAULT 0,
+        sum_squares numeric(20, 4) NOT NULL DEFAULT 0,
+        updated_at timestamptz DEFAULT NOW(),
+        PRIMARY KEY (user_id, day, category)
+    );
+"""
+
+# The per-request query /api/insights/spending ran before the rollup
+RAW_SPENDING_QUERY = """
+    SELECT DATE(created_at) as date, SUM(amount) as total, COUNT(*) as count,
+           AVG(amount) as avg_amount
+    FROM transactions
+    WHERE user_id = %s AND type = 'split_payment'
+        AND created_at > NOW() - INTERVAL '%s days'
+    GROUP BY DATE(created_at)
+    ORDER BY date DESC
+"""
+
+
+def _scratch_postgres(args):
+    """DSN of --database-url, or of a throwaway local server (pip install pgserver)"""
+    if args.database_url:
+        return args.database_url, None
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit('spending-rollups needs --database-url or the pgserver package')
+    logging.getLogger('pgserver').setLevel(logging.WARNING)
+    server = pgserver.get_server(tempfile.mkdtemp(prefix='bench-pg-'), cleanup_mode='delete')
+    return server.get_uri(), server
+
+
+def _migration_sql(*names: str) -> list:
+    """SQL that the knex.raw calls in these migrations' up() issue, in order (needs node)"""
+    import subprocess
+
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'migrations')
+    script = """
+        const sqls = [];
+        const knex = {raw: async sql => { sqls.push(sql); }, fn: {now: () => 'NOW()'},
+                      schema: {createTable: async () => {}, alterTable: async () => {}}};
+        (async () => {
+          for (const path of process.argv.slice(1)) await require(path).up(knex);
+          process.stdout.write(JSON.stringify(sqls));
+        })();
+    """
+    paths = [os.path.abspath(os.path.join(directory, name)) for name in names]
+    try:
+        out = subprocess.run(['node', '-e', script, *paths], check=True, capture_output=True, text=True)
+    except FileNotFoundError:
+        raise SystemExit('spending-rollups needs node to read the migrations')
+    return json.loads(out.stdout)
+
+
+def _uuids(ids: np.ndarray, prefix: str) -> np.ndarray:
+    return np.char.add(prefix, np.char.zfill(ids.astype(str), 12))
+
+
+def bench_spending_rollups(args):
+    """Spending rollups on a real Postgres: trigger cost, backfill and per-request query.
+
+    Creates the tables the queries touch in a scratch schema, runs the
+    rollup migrations' own SQL (functions and triggers) against them,
+    bulk-loads generated split payments and times the raw per-request
+    aggregate against the rollup range read for the heaviest, p99 and median
+    users.
+    """
+    import io
+
+    import psycopg2
+    from psycopg2.extras import RealDictCursor, execute_values
+
+    dsn, server = _scratch_postgres(args)
+    rollup_sql = _migration_sql('003_spending_rollups.js', '007_spending_changed_notify.js',
+                                '009_spending_rollup_categories.js')
+
+    conn = psycopg2.connect(dsn, cursor_factory=RealDictCursor)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute('DROP SCHEMA IF EXISTS bench_spending CASCADE; CREATE SCHEMA bench_spending')
+    cur.execute('SET search_path TO bench_spending')
+    cur.execute(SPENDING_SCHEMA)
+    for sql in rollup_sql:
+        cur.execute(sql)
+    cur.execute('ALTER TABLE transactions DISABLE TRIGGER transactions_spending_rollup')
+
+    rng = np.random.default_rng(0)
+    categories = np.array(['restaurants', 'groceries', 'travel', 'entertainment', 'utilities'])
+    activity = rng.lognormal(0.0, 1.5, args.users)  # long tail of heavy users
+    users = rng.choice(args.users, args.rows, p=activity / activity.sum())
+    bills = rng.integers(0, args.bills, args.rows)
+    amounts = rng.gamma(2.0, 15.0, args.rows).round(2)
+    now = datetime.now(timezone.utc)
+    created = now - pd.to_timedelta(rng.uniform(0, args.days * 86400, args.rows), unit='s')
+    user_ids = _uuids(np.arange(args.users), '00000000-0000-0000-0000-')
+    bill_ids = _uuids(np.arange(args.bills), '00000000-0000-0000-0001-')
+
+    def copy(table, frame):
+        buffer = io.StringIO()
+        frame.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH CSV", buffer)
+
+    started = time.perf_counter()
+    copy('users', pd.DataFrame({'id': user_ids}))
+    copy('bills', pd.DataFrame({'id': bill_ids, 'merchant_category': categories[np.arange(args.bills) % 5]}))
+    for lo in range(0, args.rows, 1_000_000):  # in slices, so 10M rows fit in a few GB
+        part = slice(lo, lo + 1_000_000)
+        copy('transactions', pd.DataFrame({
+            'user_id': user_ids[users[part]], 'bill_id': bill_ids[bills[part]], 'type': 'split_payment',
+            'amount': amounts[part], 'created_at': created[part].strftime('%Y-%m-%d %H:%M:%S.%f+00')
+        }))
+    cur.execute('ANALYZE')
+    print(f"{args.rows:,} split payments, {args.users:,} users over {args.days} days "
+          f"loaded in {time.perf_counter() - started:.1f}s")
+
+    # Initial load through the service's own backfill (one transaction per month chunk)
+    os.environ['DATABASE_URL'] = dsn
+    os.environ['PGOPTIONS'] = '-c search_path=bench_spending'
+    stats = AI_CODE.spending_rollups.backfill()
+    cur.execute('ANALYZE spending_daily')
+    print(f"backfill: {stats['rows']:,} rollup rows in {stats['chunks']} chunks, {stats['seconds']:.1f}s")
+
+    # Trigger cost per inserted payment, in batches like the backend's bill settlement
+    batch = [(user_ids[u], bill_ids[b], 'split_payment', float(a))
+             for u, b, a in zip(rng.choice(users, args.insert_rows), rng.integers(0, args.bills, args.insert_rows),
+                                rng.gamma(2.0, 15.0, args.insert_rows).round(2))]
+    insert = 'INSERT INTO transactions (user_id, bill_id, type, amount) VALUES %s'
+    for enabled in (False, True):
+        cur.execute(f"ALTER TABLE transactions {'ENABLE' if enabled else 'DISABLE'} "
+                    f"TRIGGER transactions_spending_rollup")
+        elapsed = _timed(lambda: execute_values(cur, insert, batch, page_size=500))
+        print(f"insert {args.insert_rows:,} payments, trigger {'on ' if enabled else 'off'}: "
+              f"{elapsed / args.insert_rows * 1e6:>7.1f}us/row")
+        # Removed under the same trigger state, so the rollup ends up untouched
+        cur.execute('DELETE FROM transactions WHERE created_at >= %s', (now,))
+
+    # Re-categorised bills move their payments between rollup categories
+    moved = bill_ids[rng.choice(args.bills, args.bills // 100, replace=False)]
+    started = time.perf_counter()
+    cur.execute("UPDATE bills SET merchant_category = 'shopping' WHERE id = ANY(%s::uuid[])", (list(moved),))
+    print(f"re-categorise {len(moved):,} bills: {(time.perf_counter() - started) / len(moved) * 1000:.2f}ms/bill")
+
+    # The trigger and the backfill must agree with a fresh aggregate
+    cur.execute("""
+        WITH rolled AS (SELECT user_id, day, category, total, txn_count FROM spending_daily),
+             fresh AS (SELECT t.user_id, DATE(t.created_at), COALESCE(b.merchant_category, 'other'),
+                              SUM(t.amount), COUNT(*)::integer
+                       FROM transactions t LEFT JOIN bills b ON b.id = t.bill_id GROUP BY 1, 2, 3)
+        SELECT (SELECT COUNT(*) FROM (SELECT * FROM rolled EXCEPT SELECT * FROM fresh) a) +
+               (SELECT COUNT(*) FROM (SELECT * FROM fresh EXCEPT SELECT * FROM rolled) b) AS mismatched
+    """)
+    print(f"rollup rows disagreeing with transactions: {cur.fetchone()['mismatched']}")
+
+    counts = np.bincount(users, minlength=args.users)
+    ranked = np.argsort(counts)
+    print(f"{'user':>8} {'txns':>8} {'period':>7} {'raw':>10} {'rollup':>10} {'speedup':>8}")
+    for label, user in (('max', ranked[-1]), ('p99', ranked[int(args.users * 0.99)]),
+                        ('median', ranked[args.users // 2])):
+        for period in args.periods:
+            def raw():
+                cur.execute(RAW_SPENDING_QUERY, (user_ids[user], period))
+                return cur.fetchall()
+
+            def rollup():
+                cur.execute(AI_CODE.SpendingRollups.SERIES_QUERY, (user_ids[user], period))
+                return cur.fetchall()
+            raw_s, rollup_s = _timed(raw, args.repeat), _timed(rollup, args.repeat)
+            print(f"{label:>8} {counts[user]:>8,} {period:>7} {raw_s * 1000:>8.2f}ms "
+                  f"{rollup_s * 1000:>8.2f}ms {raw_s / rollup_s:>7.1f}x")
+
+    cur.execute('DROP SCHEMA bench_spending CASCADE')
+    conn.close()
+    if server is not None:
+        server.cleanup()
+
+
+def bench_spending_analytics(args):
+    """Latency of the full analytics pass over a user's rollup series (target < 20ms)"""
+    rng = np.random.default_rng(0)
+    today = np.datetime64('2025-06-30')
+    categories = np.array(['restaurants', 'groceries', 'travel', 'entertainment', 'utilities', 'other'])
+    rows = args.days * args.categories_per_day
+    series = {
+        'day': today - rng.integers(0, args.days, rows),
+        'category': categories[rng.integers(0, len(categories), rows)].astype(object),
+        'total': rng.gamma(2.0, 20.0, rows).round(2),
+        'count': rng.integers(1, 4, rows)
+    }
+    analytics = AI_CODE.SpendingAnalytics(min_history_days=args.days)
+    print(f"{rows:,} rollup rows over {args.days} days")
+    print(f"{'period':>7} {'analyze':>10} {'+insights':>10} {'anomalies':>10}")
+    for period in args.periods:
+        analysis = analytics.analyze(series, period, today)
+        analyze_s = _timed(lambda: analytics.analyze(series, period, today), args.repeat)
+        insights_s = _timed(lambda: analytics.insights(analytics.analyze(series, period, today)),
+                            args.repeat)
+        print(f"{period:>7} {analyze_s * 1000:>8.2f}ms {insights_s * 1000:>8.2f}ms "
+              f"{len(analysis['anomalies']):>10}")
+
+
+def bench_daily_insights(args):
+    """Nightly insight batches (no database): users/s inline vs across the process pool"""
+    rng = np.random.default_rng(0)
+    today = np.datetime64('2025-06-30')
+    categories = np.array(['restaurants', 'groceries', 'travel', 'entertainment', 'other'])
+    rows = []
+    for user in range(args.users):
+        active = rng.choice(365, rng.integers(5, 120), replace=False)
+        for day in np.sort(active):
+            rows.append((f"user-{user:08d}", int((today - day).astype(np.int64)),
+                         str(rng.choice(categories)), float(rng.gamma(2.0, 20.0)), 1))
+    batches = [rows[i:i + args.chunk_rows] for i in range(0, len(rows), args.chunk_rows)]
+    task = {'pipeline': 'daily_insights', 'run_date': str(today), 'period': 30,
+            'analytics': {}, 'expires_at': str(today + 2)}
+    print(f"{args.users:,} users, {len(rows):,} rollup rows, {len(batches)} batches")
+
+    # Batches are cut at chunk_rows here, so a few users straddle two; fine for timing
+    inline_s = _timed(lambda: [AI_CODE.analyze_spending_batch(dict(task, rows=b)) for b in batches])
+    with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context('forkserver')) as pool:
+        list(pool.map(AI_CODE.analyze_spending_batch, [dict(task, rows=batches[0])]))
+        pool_s = _timed(lambda: list(pool.map(AI_CODE.analyze_spending_batch,
+                                              [dict(task, rows=b) for b in batches])))
+    result = AI_CODE.analyze_spending_batch(dict(task, rows=batches[0]))
+    print(f"inline: {args.users / inline_s:,.0f} users/s; "
+          f"{args.workers} workers: {args.users / pool_s:,.0f} users/s; "
+          f"{result['insights'] / result['users']:.1f} insights/user, "
+          f"{len(result['copy']) / max(result['insights'], 1):.0f} COPY bytes/insight")
+
+
+def bench_split_cache(args):
+    """Split prediction latency on a synthetic workload: recompute vs Redis catch-up vs L1+Redis.
+
+    Postgres is a stub that sleeps --db-latency per query; bill completions
+    arrive at --completion-rate per request and invalidate their group as
+    the bill_completed notification would.
+    """
+    import fakeredis
+
+    rng = np.random.default_rng(0)
+    menu = ['pepperoni pizza', 'caesar salad', 'beer', 'burger', 'fries', 'sushi roll',
+            'pad thai', 'coffee', 'wine', 'nachos']
+    categories = ['restaurants', 'bars', 'groceries', 'coffee']
+    clock = [datetime(2025, 1, 1, tzinfo=timezone.utc)]
+
+    def make_bill(group):
+        clock[0] += timedelta(seconds=1)
+        members = [f"{group}-m{i}" for i in range(rng.integers(2, 8))]
+        items = [{'id': str(i), 'name': str(rng.choice(menu)), 'price': float(rng.integers(3, 30))}
+                 for i in range(rng.integers(2, 8))]
+        claims = [rng.choice(members) for _ in items]
+        return {'id': f"{group}-{clock[0].timestamp():.0f}", 'merchant_name': f"merchant {rng.integers(0, 20)}",
+                'merchant_category': str(rng.choice(categories)), 'items': items,
+                'completed_at': clock[0],
+                'participants': [{'user_id': m, 'name': m, 'items_claimed': [
+                                      it['id'] for it, c in zip(items, claims) if c == m],
+                                  'amount_owed': sum(it['price'] for it, c in zip(items, claims) if c == m)}
+                                 for m in members]}
+
+    bills = {f"g{g}": [make_bill(f"g{g}") for _ in range(args.bills)] for g in range(args.groups)}
+    activity = rng.lognormal(0.0, 1.5, args.groups)
+    requests = rng.choice(args.groups, args.requests, p=activity / activity.sum())
+    completions = rng.random(args.requests) < args.completion_rate
+    new_bills = {i: make_bill(f"g{requests[i]}") for i in np.flatnonzero(completions)}
+    items = [{'name': 'pizza', 'price': 18.0}, {'name': 'beer', 'price': 7.0}, {'name': 'fries', 'price': 5.0}]
+
+    def fetch_bills(group_id, watermark):
+        time.sleep(args.db_latency)
+        # Like BILLS_QUERY: re-reads from the watermark, the model skips bills it already has
+        return [b for b in bills[group_id] if watermark is None or b['completed_at'].isoformat() >= watermark]
+
+    def run(label, predict, predictor=None):
+        for group in bills:
+            bills[group] = bills[group][:args.bills]
+        latencies = np.empty(args.requests)
+        for i, group in enumerate(requests):
+            group_id = f"g{group}"
+            started = time.perf_counter()
+            predict(group_id).score(items, merchant='merchant 1')
+            latencies[i] = time.perf_counter() - started
+            if i in new_bills:
+                bills[group_id].append(new_bills[i])
+                if predictor is not None:
+                    predictor.invalidate(f"{group_id}:{new_bills[i]['id']}")
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        hits = ''
+        if predictor is not None:
+            total = sum(predictor.stats.values())
+            hits = ' '.join(f"{k}={v / total:.1%}" for k, v in predictor.stats.items())
+        print(f"{label:>16} {p50:>8.3f}ms {p99:>8.3f}ms {latencies.sum():>8.2f}s  {hits}")
+
+    print(f"{args.groups:,} groups x {args.bills} bills, {args.requests:,} requests, "
+          f"{completions.sum():,} completions, db latency {args.db_latency * 1000:.1f}ms")
+    print(f"{'strategy':>16} {'p50':>10} {'p99':>10} {'total':>9}  hit rates")
+
+    stub = AI_CODE.SplitPredictor(fakeredis.FakeRedis())
+    stub.fetch_bills = fetch_bills
+    run('recompute', lambda g: stub.refresh(g))
+
+    catch_up = AI_CODE.SplitPredictor(fakeredis.FakeRedis())
+    catch_up.fetch_bills = fetch_bills
+
+    def load_and_catch_up(group_id):
+        payload = catch_up.redis.get(catch_up.key_prefix + group_id)
+        model = AI_CODE.SplitModel.from_bytes(payload) if payload else None
+        watermark = model.watermark if model else None
+        model = catch_up.refresh(group_id, model)
+        if model.watermark != watermark:
+            catch_up.redis.set(catch_up.key_prefix + group_id, model.to_bytes())
+        return model
+    run('redis+catch-up', load_and_catch_up)
+
+    cached = AI_CODE.SplitPredictor(fakeredis.FakeRedis(), local_size=args.local_size)
+    cached.fetch_bills = fetch_bills
+    run('l1+redis+notify', cached.model, cached)
+
+
+def bench_response_encode(args):
+    """Encode time and size per route payload: stdlib json vs orjson vs msgpack, then compressed"""
+    from decimal import Decimal
+
+    rng = np.random.default_rng(0)
+    words = ['ORGANIC', 'BANANAS', 'MILK', '2%', 'BREAD', 'EGGS', 'LG', 'CHEDDAR', 'COFFEE', 'BEANS']
+    items = [{'name': ' '.join(rng.choice(words, 3)), 'price': round(float(rng.gamma(2, 4)), 2),
+              'quantity': 1} for _ in range(args.items)]
+    receipt = {
+        'merchant_name': 'COSTCO WHOLESALE', 'date': '2025-06-30', 'items': items,
+        'subtotal': Decimal('182.44'), 'tax': Decimal('14.21'), 'total': Decimal('196.65'),
+        'confidence': np.float64(0.83), 'ocr_method': 'tesseract', 'image_hash': 'f' * 64,
+        'raw_text': '\n'.join(f"{i['name']:<30}{i['price']:>8.2f}" for i in items) * 2
+    }
+
+    source = FakeMarketDataSource(max_bars=args.bars)
+    history = {}
+    for i in range(args.symbols):
+        frame = source._history(f"SYM{i:03d}", 'max', '1d')
+        history[f"SYM{i:03d}"] = {c: frame[c].to_numpy() for c in OHLCVStore.COLUMNS}
+    fields = ['open', 'high', 'low', 'close', 'volume']
+
+    today = np.datetime64('2025-06-30')
+    categories = np.array(['restaurants', 'groceries', 'travel', 'entertainment', 'utilities', 'other'])
+    rows = 365 * 3
+    analytics = AI_CODE.SpendingAnalytics(min_history_days=365)
+    analysis = analytics.analyze({
+        'day': today - rng.integers(0, 365, rows),
+        'category': categories[rng.integers(0, len(categories), rows)].astype(object),
+        'total': rng.gamma(2.0, 20.0, rows).round(2),
+        'count': rng.integers(1, 4, rows)
+    }, 365, today)
+    spending = {'insights': analytics.insights(analysis), 'period_days': 365,
+                'total_spent': analysis['total_spent'], 'analytics': analysis}
+
+    recommendations = {
+        'group_id': 'a' * 36, 'amount': Decimal('100.00'),
+        'recommendations': [{'symbol': f"SYM{i:03d}", 'amount': Decimal(f"{rng.uniform(5, 40):.2f}"),
+                             'weight': np.float64(rng.uniform(0, 0.4)), 'score': np.float32(rng.uniform()),
+                             'sentiment': rng.uniform(-1, 1)} for i in range(20)],
+        'generated_at': datetime.now(timezone.utc)
+    }
+
+    def stdlib_history():
+        # What the route did before: tolist() every column, then json.dumps
+        return json.dumps({symbol: {'timestamps': bars['timestamp'].tolist(),
+                                    **{f: bars[f].tolist() for f in fields}}
+                           for symbol, bars in history.items()}).encode()
+
+    routes = [
+        ('ocr/receipt', receipt, None),
+        ('market/history', None, stdlib_history),
+        ('insights/spending', spending, None),
+        ('investment/recommendations', recommendations, None),
+    ]
+    compressor = AI_CODE.response_compressor
+    encodings = compressor.encodings()
+    print(f"{'route':>28} {'encoder':>8} {'bytes':>10} {'encode':>10}"
+          + ''.join(f" {e + ' bytes':>11} {e:>9}" for e in encodings))
+    for route, payload, stdlib in routes:
+        if payload is None:
+            encoders = {'stdlib': stdlib,
+                        'orjson': lambda: AI_CODE.encode_history_json(history, fields),
+                        'msgpack': lambda: AI_CODE.encode_history_msgpack(history, fields)}
+        else:
+            encoders = {'stdlib': lambda: json.dumps(payload, default=AI_CODE._pack_default).encode(),
+                        'orjson': lambda: AI_CODE.json_dumps(payload),
+                        'msgpack': lambda: AI_CODE.pack(payload)}
+        for name, encode in encoders.items():
+            body = encode()
+            line = f"{route:>28} {name:>8} {len(body):>10,} {_timed(encode, args.repeat) * 1000:>8.3f}ms"
+            for encoding in encodings:
+                compressed = compressor.compress(body, encoding)
+                seconds = _timed(lambda: compressor.compress(body, encoding), args.repeat)
+                line += f" {len(compressed):>11,} {seconds * 1000:>7.2f}ms"
+            print(line)
+
+
+def _reparse_rows(rows):
+    """What a re-parse worker does per batch: decode the stored rows, then parse"""
+    return AI_CODE.reparse_receipt_batch([AI_CODE.OcrStore.decode(row) for row in rows])
+
+
+def bench_receipt_reparse(args):
+    """Re-parse throughput from stored OCR rows (decode + parse), single process and pooled"""
+    rng = np.random.default_rng(0)
+    words = ['ORGANIC', 'BANANAS', 'MILK', 'BREAD', 'EGGS', 'CHEDDAR', 'COFFEE', 'BEANS', 'SALSA']
+    merchants = ['TRADER JOES', 'COSTCO WHOLESALE', 'BLUE BOTTLE COFFEE', 'SHELL', 'AMC THEATER']
+
+    def make_row(i):
+        lines = [str(rng.choice(merchants)), f"{rng.integers(1, 13)}/{rng.integers(1, 29)}/2025"]
+        lines += [f"{' '.join(rng.choice(words, 2))} {rng.gamma(2, 4):.2f}"
+                  for _ in range(rng.integers(3, args.max_items))]
+        lines += ['SUBTOTAL 42.10', 'TAX 3.20', 'TOTAL 45.30']
+        tokens = ' '.join(lines).split()
+        words_col = {'text': tokens, 'left': list(range(len(tokens))), 'top': [0] * len(tokens),
+                     'width': [40] * len(tokens), 'height': [12] * len(tokens),
+                     'conf': [91.5] * len(tokens)}
+        return {'image_hash': f"{i:064x}", 'engine': 'tesseract-bench', 'method': 'tesseract',
+                'text': '\n'.join(lines), 'words': AI_CODE.pack(words_col), 'confidence': 0.91}
+
+    rows = [make_row(i) for i in range(args.receipts)]
+    chunks = [rows[i:i + args.chunk] for i in range(0, len(rows), args.chunk)]
+
+    print(f"{args.receipts:,} stored OCR outputs, {args.chunk} per batch")
+    seconds = _timed(lambda: [_reparse_rows(c) for c in chunks])
+    print(f"{'1 process':>12} {seconds:>8.2f}s {args.receipts / seconds:>10,.0f} receipts/s")
+    for workers in args.workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_reparse_rows, chunks[:workers]))  # Warm up the workers
+            seconds = _timed(lambda: list(pool.map(_reparse_rows, chunks)))
+        print(f"{f'{workers} workers':>12} {seconds:>8.2f}s {args.receipts / seconds:>10,.0f} receipts/s")
+
+
+def _synthetic_receipt(rng, wide: bool, misread_rate: float) -> Dict:
+    """Tesseract-shaped words and ground truth for one receipt.
+
+    On wide receipts the price column is far enough from the names that
+    Tesseract reports it as a separate block, which is what breaks the
+    line-based parser.
+    """
+    goods = ['ORGANIC BANANAS', 'MILK 2%', 'SOURDOUGH BREAD', 'LG EGGS', 'CHEDDAR', 'COFFEE BEANS',
+             'SALSA VERDE', 'PAPER TOWELS', 'OLIVE OIL', 'GREEK YOGURT', 'ROTISSERIE CHICKEN']
+    width = 1200 if wide else 420
+    words = {k: [] for k in ('text', 'left', 'top', 'width', 'height', 'conf',
+                             'block_num', 'par_num', 'line_num')}
+    confidence = float(rng.beta(6, 2.2))
+    y = [20]
+
+    def emit(tokens, block, x=10, right=None):
+        spans = [len(t) * 11 for t in tokens]
+        if right is not None:
+            x = right - sum(spans) - 8 * (len(tokens) - 1)
+        jitter = rng.integers(-2, 3)
+        for token, span in zip(tokens, spans):
+            words['text'].append(token)
+            words['left'].append(int(x))
+            words['top'].append(int(y[0] + jitter))
+            words['width'].append(span)
+            words['height'].append(14)
+            words['conf'].append(float(np.clip(confidence * 100 + rng.normal(0, 8), 0, 99)))
+            words['block_num'].append(block)
+            words['par_num'].append(1)
+            words['line_num'].append(y[0])
+            x += span + 8
+
+    def price_text(amount):
+        text = f"{amount:.2f}"
+        if rng.random() < misread_rate:
+            text = text[:-1] + str((int(text[-1]) + 3) % 10)  # A misread digit
+        return text
+
+    column = width - 20 + int(rng.integers(-6, 7))
+    emit(['TRADER', 'JOES', '#552'], 1)
+    y[0] += 22
+    emit([f"{rng.integers(1, 13):02d}/{rng.integers(1, 29):02d}/2025", '14:32'], 1)
+    y[0] += 30
+
+    items = []
+    for _ in range(rng.integers(3, 16)):
+        name = str(rng.choice(goods))
+        quantity = int(rng.choice([1, 1, 1, 1, 2, 3]))
+        unit = round(float(rng.gamma(2.0, 2.5)) + 0.49, 2)
+        items.append({'name': name, 'price': unit, 'quantity': quantity})
+        price_block = 2 if wide else 1
+        if quantity > 1:
+            emit(name.split(), 1)
+            y[0] += 22
+            emit([str(quantity), '@', f"{unit:.2f}"], 1, x=40)
+            emit([price_text(unit * quantity)], price_block, right=column)
+        else:
+            emit(name.split(), 1)
+            emit([price_text(unit)], price_block, right=column)
+        y[0] += 22
+
+    subtotal = round(sum(i['price'] * i['quantity'] for i in items), 2)
+    tax = round(subtotal * 0.0725, 2)
+    total = round(subtotal + tax, 2)
+    y[0] += 10
+    for label, amount in (('SUBTOTAL', subtotal), ('TAX', tax), ('TOTAL', total)):
+        emit([label], 1)
+        emit([price_text(amount)], 2 if wide else 1, right=column)
+        y[0] += 22
+    emit(['VISA', f"{total:.2f}"], 1)
+
+    # Tesseract reads block by block
+    order = sorted(range(len(words['text'])), key=lambda i: (words['block_num'][i],
+                                                              words['top'][i], words['left'][i]))
+    words = {k: [v[i] for i in order] for k, v in words.items()}
+    return {'words': words, 'confidence': confidence,
+            'truth': {'merchant_name': 'TRADER JOES #552', 'items': items,
+                      'subtotal': subtotal, 'tax': tax, 'total': total}}
+
+
+RECEIPT_LAYOUT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'tests', 'fixtures', 'receipt_layout_corpus.jsonl')
+
+
+def bench_receipt_layout(args):
+    """Line-based vs layout-aware parsing on a labelled corpus: accuracy and GPT-4 escalation rate.
+
+    The default corpus is the hand-labelled fixture. --synthetic generates
+    receipts instead; they follow the layout parser's own assumptions, so
+    use them for timing rather than accuracy.
+    """
+    processor = AI_CODE.receipt_processor
+    if not args.synthetic:
+        with open(args.corpus) as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+        label = args.corpus
+    else:
+        rng = np.random.default_rng(0)
+        corpus = [_synthetic_receipt(rng, rng.random() < args.wide_share, args.misread_rate)
+                  for _ in range(args.receipts)]
+        label = f"synthetic, {args.wide_share:.0%} wide, {args.misread_rate:.0%} misread prices"
+
+    print(f"{len(corpus):,} receipts ({label})")
+    print(f"{'parser':>8} {'item F1':>8} {'totals':>8} {'reconciled':>11} {'GPT-4':>7} {'parse':>10}")
+    for parser in ('text', 'layout'):
+        diffs, escalations, reconciled = [], [], []
+        started = time.perf_counter()
+        for receipt in corpus:
+            ocr = {'method': 'tesseract', 'confidence': receipt['confidence'],
+                   'text': receipt.get('text') or AI_CODE.words_to_text(receipt['words']),
+                   'words': receipt['words'] if parser == 'layout' else {}}
+            result = processor.parse_ocr(ocr)
+            diffs.append(AI_CODE.diff_receipts(receipt['truth'], result))
+            escalations.append(processor.needs_gpt4(result))
+            reconciled.append(bool(result.get('reconciled')))
+        per_receipt = (time.perf_counter() - started) / len(corpus)
+        print(f"{parser:>8} {np.mean([d['item_f1'] for d in diffs]):>8.3f} "
+              f"{np.mean([d['total_match'] for d in diffs]):>8.1%} {np.mean(reconciled):>11.1%} "
+              f"{np.mean(escalations):>7.1%} {per_receipt * 1000:>8.3f}ms")
+
+
+def _synthetic_photo(rng, size: int):
+    """A receipt photographed on a table: (BGR image, true corners tl/tr/br/bl)"""
+    import cv2
+
+    h, w = size, size * 3 // 4
+    grain = cv2.GaussianBlur(rng.normal(0, 1, (h, w)).astype(np.float32), (0, 0), size / 200)
+    grain = 30 * grain / (np.abs(grain).max() + 1e-6)
+    wood = np.clip(np.stack([70 + grain, 95 + grain, 130 + grain], axis=-1)
+                   + np.linspace(-25, 25, w)[None, :, None], 0, 255).astype(np.uint8)
+
+    paper_h = int(h * rng.uniform(0.55, 0.8))
+    paper_w = int(paper_h * rng.uniform(0.3, 0.45))
+    paper = np.full((paper_h, paper_w, 3), 245, np.uint8)
+    line = max(paper_h // 45, 8)
+    for i, y in enumerate(range(line * 2, paper_h - line, line)):
+        cv2.putText(paper, f"ITEM {i:02d} GROCERIES", (line // 2, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    line / 40, (30, 30, 30), max(line // 12, 1))
+        cv2.putText(paper, f"{rng.uniform(1, 30):6.2f}", (paper_w - 5 * line, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, line / 40, (30, 30, 30), max(line // 12, 1))
+
+    cx, cy = w * rng.uniform(0.4, 0.6), h * rng.uniform(0.45, 0.55)
+    angle = np.deg2rad(rng.uniform(-12, 12))
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    half = np.array([[-paper_w, -paper_h], [paper_w, -paper_h], [paper_w, paper_h], [-paper_w, paper_h]]) / 2
+    corners = (half * [[1.0, 1.0], [1.0, 1.0], [0.92, 1.0], [0.92, 1.0]]) @ rotation.T + [cx, cy]
+    corners = (corners + rng.normal(0, size / 150, corners.shape)).astype(np.float32)
+    source = np.array([[0, 0], [paper_w, 0], [paper_w, paper_h], [0, paper_h]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(source, corners)
+    warped = cv2.warpPerspective(paper, matrix, (w, h))
+    mask = cv2.warpPerspective(np.full((paper_h, paper_w), 255, np.uint8), matrix, (w, h))
+    photo = np.where(mask[..., None] > 0, warped, wood)
+
+    # A thumb holding the bottom corner
+    cv2.ellipse(photo, (int(corners[3][0]), int(corners[3][1])), (size // 14, size // 9),
+                float(rng.uniform(0, 180)), 0, 360, (120, 160, 215), -1)
+    return photo, corners
+
+
+def bench_receipt_crop(args):
+    """Region detection on synthetic phone photos: pixels removed and preprocessing/OCR time saved"""
+    import shutil
+
+    import cv2
+    import pytesseract
+
+    rng = np.random.default_rng(0)
+    processor = AI_CODE.ReceiptProcessor(detect_region=True)
+    ocr = shutil.which('tesseract') is not None
+    if not ocr:
+        print('tesseract not installed: timing preprocessing only')
+    print(f"{'image':>5} {'pixels':>10} {'cropped':>10} {'saved':>6} {'IoU':>5} {'detect':>9} "
+          f"{'prep full':>10} {'prep crop':>10}" + (f" {'ocr full':>10} {'ocr crop':>10}" if ocr else ''))
+
+    saved_seconds, reductions = [], []
+    for i in range(args.images):
+        photo, truth = _synthetic_photo(rng, args.size)
+        detect_s = _timed(lambda: processor.crop_receipt(photo), args.repeat)
+        cropped, info = processor.crop_receipt(photo)
+
+        iou = 0.0
+        if info['detected']:
+            a = cv2.fillPoly(np.zeros(photo.shape[:2], np.uint8), [truth.astype(np.int32)], 1)
+            b = cv2.fillPoly(np.zeros(photo.shape[:2], np.uint8),
+                             [np.array(info['corners'], dtype=np.int32)], 1)
+            iou = np.logical_and(a, b).sum() / max(np.logical_or(a, b).sum(), 1)
+
+        prep_full = _timed(lambda: processor.preprocess_image(photo))
+        prep_crop = _timed(lambda: processor.preprocess_image(cropped))
+        line = (f"{i:>5} {info['pixels']:>10,} {info['cropped_pixels']:>10,} "
+                f"{1 - info['cropped_pixels'] / info['pixels']:>6.0%} {iou:>5.2f} {detect_s * 1000:>7.1f}ms "
+                f"{prep_full:>9.2f}s {prep_crop:>9.2f}s")
+        saved = prep_full - prep_crop - detect_s
+        if ocr:
+            full_img, crop_img = processor.preprocess_image(photo), processor.preprocess_image(cropped)
+            ocr_full = _timed(lambda: pytesseract.image_to_data(full_img))
+            ocr_crop = _timed(lambda: pytesseract.image_to_data(crop_img))
+            line += f" {ocr_full:>9.2f}s {ocr_crop:>9.2f}s"
+            saved += ocr_full - ocr_crop
+        print(line)
+        saved_seconds.append(saved)
+        reductions.append(1 - info['cropped_pixels'] / info['pixels'])
+
+    print(f"mean pixel reduction {np.mean(reductions):.0%}, "
+          f"mean time saved per image {np.mean(saved_seconds):.2f}s (after detection cost)")
+
+
+def _tall_receipt(items: int, width: int = 600, line: int = 34) -> np.ndarray:
+    """Binarised receipt (black text on white) with a header, `items` lines and totals"""
+    import cv2
+
+    rows = ['COSTCO WHOLESALE', '#1092 MOUNTAIN VIEW', ''] + \
+           [f"{1000 + i:<6}ITEM {i:03d} KIRKLAND {((i * 37) % 2000) / 100 + 1:>8.2f}" for i in range(items)] + \
+           ['', 'SUBTOTAL 1234.56', 'TAX 98.76', 'TOTAL 1333.32']
+    img = np.full((line * (len(rows) + 2), width), 255, np.uint8)
+    for i, text in enumerate(rows):
+        cv2.putText(img, text, (10, line * (i + 1) + line // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.7, 0, 2)
+    return img
+
+
+def bench_receipt_tiles(args):
+    """OCR latency against receipt length: one Tesseract pass vs parallel overlapping strips"""
+    import shutil
+
+    import pytesseract
+
+    if shutil.which('tesseract') is None:
+        # No Tesseract here: a stub subprocess that burns CPU per megapixel (so strips compete
+        # for cores as the real ones do) and reports one word per band of ink, including bands
+        # cut by the strip edge. Its timings show scheduling, not Tesseract's speed
+        def image_to_data(img, output_type=None):
+            seconds = args.stub_overhead + args.stub_per_mpx * img.size / 1e6
+            subprocess.run([sys.executable, '-c', 'import time\nend = time.process_time() + '
+                            f'{seconds}\nwhile time.process_time() < end:\n    pass'], check=True)
+            edges = np.diff(np.concatenate(([0], (img < 128).any(axis=1).astype(np.int8), [0])))
+            tops, bottoms = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            n = len(tops)
+            return {'text': ['LINE'] * n, 'left': [10] * n, 'top': tops.tolist(),
+                    'width': [img.shape[1] - 20] * n, 'height': (bottoms - tops).tolist(),
+                    'conf': [90.0] * n, 'block_num': [1] * n, 'par_num': [1] * n,
+                    'line_num': list(range(n))}
+        pytesseract.image_to_data = image_to_data
+        print(f"stub OCR ({args.stub_overhead * 1000:.0f}ms/call + {args.stub_per_mpx:.2f}s/megapixel of CPU; "
+              f"tesseract not installed, so not a Tesseract measurement)")
+
+    processor = AI_CODE.ReceiptProcessor(tile_height=args.tile_height, tile_overlap=args.tile_overlap,
+                                         tile_workers=args.workers, ocr_slots=args.workers,
+                                         slot_dir=tempfile.mkdtemp(prefix='bench-ocr-slots-'))
+    print(f"{args.workers} OCR slots on {os.cpu_count()} cores")
+    print(f"{'items':>6} {'height':>7} {'tiles':>6} {'single':>9} {'tiled':>9} {'speedup':>8} {'words':>13}")
+    rows = []
+    for items in args.items:
+        img = _tall_receipt(items)
+        tiles = len(processor.find_tile_cuts(img)) + 1
+        single_data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+        tiled_data = processor.image_to_data_tiled(img)
+        single = _timed(lambda: pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT),
+                        args.repeat)
+        tiled = _timed(lambda: processor.image_to_data_tiled(img), args.repeat)
+        words = f"{len(tiled_data['text'])}/{len([t for t in single_data['text'] if str(t).strip()])}"
+        print(f"{items:>6} {img.shape[0]:>7,} {tiles:>6} {single:>8.2f}s {tiled:>8.2f}s "
+              f"{single / tiled:>7.1f}x {words:>13}")
+        rows.append((items, single, tiled))
+
+    # Latency against length, as text bars
+    scale = 40 / max(max(single, tiled) for _, single, tiled in rows)
+    print()
+    for items, single, tiled in rows:
+        print(f"{items:>6} single |{'#' * max(int(single * scale), 1)}")
+        print(f"{'':>6}  tiled |{'=' * max(int(tiled * scale), 1)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI service benchmarks')
+    sub = parser.add_subparsers(dest='suite', required=True)
+
+    p = sub.add_parser('market-fetch', help='bulk/concurrent market data fetching')
+    p.add_argument('--symbols', type=int, nargs='+', default=[1, 8, 32, 128])
+    p.add_argument('--latency', type=float, default=0.05, help='stub round trip, seconds')
+    p.add_argument('--workers', type=int, default=8)
+    p.set_defaults(fn=bench_market_fetch)
+
+    p = sub.add_parser('history-store', help='local OHLCV store range queries')
+    p.add_argument('--symbol', default='SPY')
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(fn=bench_history_store)
+
+    p = sub.add_parser('history-encode', help='market history response formats')
+    p.add_argument('--symbols', type=int, default=10)
+    p.add_argument('--bars', type=int, default=20_000)
+    p.add_argument('--fields', default='open,high,low,close,volume')
+    p.add_argument('--points', type=int, nargs='*', default=[1000])
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(fn=bench_history_encode)
+
+    p = sub.add_parser('portfolio-optimizer', help='efficient frontier and allocation lookups')
+    p.add_argument('--groups', type=int, default=100_000)
+    p.set_defaults(fn=bench_portfolio_optimizer)
+
+    p = sub.add_parser('group-recommendations', help='batch recommendations for many groups')
+    p.add_argument('--groups', type=int, default=100_000)
+    p.set_defaults(fn=bench_group_recommendations)
+
+    p = sub.add_parser('sentiment', help='batched sentiment inference throughput')
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32, 64])
+    p.add_argument('--texts', type=int, default=512)
+    p.add_argument('--model', default='distilbert-base-uncased-finetuned-sst-2-english')
+    p.add_argument('--backend', choices=['pytorch', 'onnx'], default='pytorch')
+    p.add_argument('--quantize', action='store_true')
+    p.add_argument('--stub-overhead', type=float, default=0.02)
+    p.add_argument('--stub-per-text', type=float, default=0.002)
+    p.set_defaults(fn=bench_sentiment)
+
+    p = sub.add_parser('spending-rollups', help='raw transaction scans vs daily rollups')
+    p.add_argument('--database-url', help='scratch database (default: a throwaway pgserver)')
+    p.add_argument('--rows', type=int, default=10_000_000)
+    p.add_argument('--users', type=int, default=20_000)
+    p.add_argument('--bills', type=int, default=50_000)
+    p.add_argument('--days', type=int, default=730)
+    p.add_argument('--insert-rows', type=int, default=10_000)
+    p.add_argument('--periods', type=int, nargs='+', default=[30, 90, 365])
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(fn=bench_spending_rollups)
+
+    p = sub.add_parser('spending-analytics', help='vectorised spending analytics latency')
+    p.add_argument('--days', type=int, default=365)
+    p.add_argument('--categories-per-day', type=int, default=3)
+    p.add_argument('--periods', type=int, nargs='+', default=[30, 90, 365])
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(fn=bench_spending_analytics)
+
+    p = sub.add_parser('daily-insights', help='nightly insight batch throughput')
+    p.add_argument('--users', type=int, default=20_000)
+    p.add_argument('--chunk-rows', type=int, default=50_000)
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(fn=bench_daily_insights)
+
+    p = sub.add_parser('split-cache', help='split model cache hit rates and latency')
+    p.add_argument('--groups', type=int, default=2000)
+    p.add_argument('--bills', type=int, default=30)
+    p.add_argument('--requests', type=int, default=5000)
+    p.add_argument('--completion-rate', type=float, default=0.02)
+    p.add_argument('--db-latency', type=float, default=0.002)
+    p.add_argument('--local-size', type=int, default=500)
+    p.set_defaults(fn=bench_split_cache)
+
+    p = sub.add_parser('response-encode', help='API response serialisation per route')
+    p.add_argument('--items', type=int, default=60)
+    p.add_argument('--symbols', type=int, default=5)
+    p.add_argument('--bars', type=int, default=5000)
+    p.add_argument('--repeat', type=int, default=20)
+    p.set_defaults(fn=bench_response_encode)
+
+    p = sub.add_parser('receipt-reparse', help='re-parse throughput from stored OCR output')
+    p.add_argument('--receipts', type=int, default=20_000)
+    p.add_argument('--max-items', type=int, default=30)
+    p.add_argument('--chunk', type=int, default=1000)
+    p.add_argument('--workers', type=int, nargs='*', default=[os.cpu_count() or 1])
+    p.set_defaults(fn=bench_receipt_reparse)
+
+    p = sub.add_parser('receipt-layout', help='layout-aware parsing accuracy and GPT-4 escalations')
+    p.add_argument('--corpus', default=RECEIPT_LAYOUT_CORPUS,
+                   help='JSONL of {words, confidence, truth[, text]} (default: tests/fixtures)')
+    p.add_argument('--synthetic', action='store_true', help='generated receipts instead of --corpus')
+    p.add_argument('--receipts', type=int, default=2000, help='with --synthetic')
+    p.add_argument('--wide-share', type=float, default=0.4, help='with --synthetic')
+    p.add_argument('--misread-rate', type=float, default=0.01,
+                   help='with --synthetic: chance a price token is misread')
+    p.set_defaults(fn=bench_receipt_layout)
+
+    p = sub.add_parser('receipt-crop', help='receipt region detection and the OCR time it saves')
+    p.add_argument('--images', type=int, default=5)
+    p.add_argument('--size', type=int, default=2000, help='photo height in pixels (width is 3/4)')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(fn=bench_receipt_crop)
+
+    p = sub.add_parser('receipt-tiles', help='tiled parallel OCR latency against receipt length')
+    p.add_argument('--items', type=int, nargs='+', default=[25, 50, 100, 200, 400])
+    p.add_argument('--tile-height', type=int, default=1600)
+    p.add_argument('--tile-overlap', type=int, default=80)
+    p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--stub-overhead', type=float, default=0.05)
+    p.add_argument('--stub-per-mpx', type=float, default=1.5)
+    p.set_defaults(fn=bench_receipt_tiles)
+
+    args = parser.parse_args()
+    AI_CODE.logger.setLevel('WARNING')
+    args.fn(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# ai-service/goal_simulation.py
+# Goal projection kernel. Kept out of AI_CODE so the projector's worker
+# processes only import numpy, not the whole service.
+
+from typing import Dict
+
+import numpy as np
+
+
+def simulate_goal(params: Dict) -> Dict:
+    """Monte Carlo projection of one goal's balance under a fixed allocation.
+
+    Monthly asset log returns are multivariate normal with the annualised
+    moments in params, the portfolio is rebalanced monthly and the
+    contribution is added at each month end. Paths are simulated in chunks
+    stepping month by month, so memory is O(chunk x assets) plus a float32
+    yearly checkpoint per path, independent of the horizon.
+    """
+    rng = np.random.default_rng(params['seed'])
+    weights = np.asarray(params['weights'], dtype=np.float64)
+    mu = np.asarray(params['mu'], dtype=np.float64)
+    cov = np.asarray(params['cov'], dtype=np.float64)
+    months, paths, chunk = params['months'], params['paths'], params.get('chunk', 20_000)
+    cash = params['cash']
+
+    drift = mu / 12 - np.diag(cov) / 24
+    chol = np.linalg.cholesky(cov / 12 + np.eye(len(mu)) * 1e-12)
+    cash_growth = np.exp(params['risk_free_rate'] / 12)
+    checkpoint_months = list(range(12, months + 1, 12))
+    if not checkpoint_months or checkpoint_months[-1] != months:
+        checkpoint_months.append(months)
+    checkpoint_index = {m: i for i, m in enumerate(checkpoint_months)}
+
+    final = np.empty(paths)
+    checkpoints = np.empty((len(checkpoint_months), paths), dtype=np.float32)
+    for start in range(0, paths, chunk):
+        n = min(chunk, paths - start)
+        wealth = np.full(n, params['current_amount'], dtype=np.float64)
+        for month in range(1, months + 1):
+            shocks = rng.standard_normal((n, len(mu))) @ chol.T
+            growth = np.exp(drift + shocks) @ weights
+            wealth = wealth * ((1 - cash) * growth + cash * cash_growth) + params['monthly_contribution']
+            if month in checkpoint_index:
+                checkpoints[checkpoint_index[month], start:start + n] = wealth
+        final[start:start + n] = wealth
+
+    fan = np.percentile(checkpoints, [10, 50, 90], axis=1)
+    return {
+        'goal_id': params['goal_id'],
+        'name': params.get('name'),
+        'target_amount': params['target_amount'],
+        'months': months,
+        'paths': paths,
+        'probability': round(float(np.mean(final >= params['target_amount'])), 4),
+        'final_balance': {
+            'p10': round(float(np.percentile(final, 10)), 2),
+            'p50': round(float(np.percentile(final, 50)), 2),
+            'p90': round(float(np.percentile(final, 90)), 2)
+        },
+        'projection': [
+            {'month': m, 'p10': round(float(fan[0, i]), 2),
+             'p50': round(float(fan[1, i]), 2), 'p90': round(float(fan[2, i]), 2)}
+            for i, m in enumerate(checkpoint_months)
+        ]
+    }
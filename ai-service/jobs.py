@@ -0,0 +1,111 @@
+# ai-service/jobs.py
+# Command-line entry points for the AI service's batch jobs.
+#
+#   python jobs.py recommendations [--dry-run]
+#   python jobs.py spending-rollups [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--user-id ID]
+#   python jobs.py daily-insights [--run-date YYYY-MM-DD] [--restart]
+#   python jobs.py reocr [--source s3|DIR] [--baseline db|FILE] [--output FILE] [--limit N]
+#   python jobs.py reparse [--engine VERSION] [--baseline db|FILE] [--output FILE]
+
+import argparse
+import os
+import json
+from datetime import date
+
+os.environ.setdefault('SCHEDULER_ENABLED', '0')  # CLI processes don't join the scheduler
+import AI_CODE
+
+
+def run_recommendations(args):
+    return AI_CODE.group_recommendation_batch.run(dry_run=args.dry_run)
+
+
+def run_spending_rollups(args):
+    return AI_CODE.spending_rollups.backfill(since=args.since, until=args.until,
+                                             user_id=args.user_id, chunk_days=args.chunk_days)
+
+
+def run_daily_insights(args):
+    pipeline = AI_CODE.daily_insight_pipeline
+    if args.workers:
+        pipeline.max_workers = args.workers
+    if args.chunk_rows:
+        pipeline.chunk_rows = args.chunk_rows
+    return pipeline.run(run_date=args.run_date, restart=args.restart)
+
+
+def run_reocr(args):
+    backfill = AI_CODE.receipt_backfill
+    if args.workers:
+        backfill.workers = args.workers
+    if args.prefetch:
+        backfill.prefetch = args.prefetch
+    if args.cache_dir:
+        backfill.cache_dir = args.cache_dir
+    if args.source == 's3':
+        source = AI_CODE.S3ReceiptSource(AI_CODE.receipt_archive, prefix=args.prefix)
+    else:
+        source = AI_CODE.DirectoryReceiptSource(args.source)
+    return backfill.run(source, baseline=args.baseline, limit=args.limit,
+                        output=args.output, force=args.force)
+
+
+def run_reparse(args):
+    reparser = AI_CODE.receipt_reparser
+    if args.workers:
+        reparser.workers = args.workers
+    if args.chunk_rows:
+        reparser.chunk_rows = args.chunk_rows
+    return reparser.run(engine=args.engine, baseline=args.baseline, output=args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AI service batch jobs')
+    sub = parser.add_subparsers(dest='job', required=True)
+
+    p = sub.add_parser('recommendations', help='suggested investment for every group')
+    p.add_argument('--dry-run', action='store_true', help='evaluate without writing ai_insights')
+    p.set_defaults(fn=run_recommendations)
+
+    p = sub.add_parser('spending-rollups', help='rebuild spending_daily from transactions')
+    p.add_argument('--since', type=date.fromisoformat, help='first day (default: earliest transaction)')
+    p.add_argument('--until', type=date.fromisoformat, help='day after the last (default: tomorrow)')
+    p.add_argument('--user-id', help='only this user')
+    p.add_argument('--chunk-days', type=int, default=31)
+    p.set_defaults(fn=run_spending_rollups)
+
+    p = sub.add_parser('daily-insights', help='spending insights for every user')
+    p.add_argument('--run-date', type=date.fromisoformat, help='default: today')
+    p.add_argument('--restart', action='store_true', help='discard the checkpoint and rerun')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--chunk-rows', type=int)
+    p.set_defaults(fn=run_daily_insights)
+
+    p = sub.add_parser('reocr', help='re-run OCR over archived receipts and diff the results')
+    p.add_argument('--source', default='s3', help="'s3' (the receipt archive) or a local directory")
+    p.add_argument('--prefix', help='S3 key prefix (default: the archive prefix)')
+    p.add_argument('--baseline', default='db',
+                   help="'db' (bills.receipt_data), a previous --output file, or '' for none")
+    p.add_argument('--output', help='write one JSON line per image')
+    p.add_argument('--limit', type=int)
+    p.add_argument('--workers', type=int)
+    p.add_argument('--prefetch', type=int)
+    p.add_argument('--cache-dir')
+    p.add_argument('--force', action='store_true', help='ignore cached results for this pipeline version')
+    p.set_defaults(fn=run_reocr)
+
+    p = sub.add_parser('reparse', help='re-parse stored OCR output without running OCR')
+    p.add_argument('--engine', help='only this OCR engine version (default: latest per image)')
+    p.add_argument('--baseline', default='db',
+                   help="'db' (bills.receipt_data), a previous --output file, or '' for none")
+    p.add_argument('--output', help='write one JSON line per receipt')
+    p.add_argument('--workers', type=int)
+    p.add_argument('--chunk-rows', type=int)
+    p.set_defaults(fn=run_reparse)
+
+    args = parser.parse_args()
+    print(json.dumps(args.fn(args), indent=2, default=str))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+# ai-service/spending_insights.py
+# Spending analytics and the daily insight batch kernel. Kept out of AI_CODE so
+# the insight pipeline's worker processes only import numpy, not the whole service.
+
+import json
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+class SpendingAnalytics:
+    """Spending statistics for one user, computed with NumPy over the daily rollup.
+
+    The series is densified to one value per day, then every metric is an
+    array operation over it: a trailing mean baseline, robust (MAD) z-scores
+    against that baseline, a weekday index, category shares and monthly
+    totals. The previous period is compared with the current one to flag
+    savings opportunities.
+    """
+
+    def __init__(self, baseline_days: int = 28, anomaly_z: float = 3.5,
+                 min_history_days: int = 365):
+        self.baseline_days = baseline_days
+        self.anomaly_z = anomaly_z
+        self.min_history_days = min_history_days
+
+    def history_days(self, period: int) -> int:
+        """Days to load: the period, the one before it, and enough for seasonality"""
+        return max(2 * period, period + self.baseline_days, self.min_history_days)
+
+    def analyze(self, series: Dict[str, np.ndarray], period: int,
+                today: Optional[np.datetime64] = None) -> Dict:
+        today = np.datetime64(today or date.today(), 'D')
+        length = self.history_days(period)
+        start = today - (length - 1)
+
+        offset = (series['day'] - start).astype(np.int64)
+        keep = (offset >= 0) & (offset < length)
+        offset, totals = offset[keep], series['total'][keep]
+        daily = np.bincount(offset, weights=totals, minlength=length)
+        txns = np.bincount(offset, weights=series['count'][keep], minlength=length)
+
+        # Trailing mean of the baseline_days before each day (partial windows at the start)
+        cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+        index = np.arange(length)
+        window_start = np.maximum(index - self.baseline_days, 0)
+        window = index - window_start
+        with np.errstate(invalid='ignore', divide='ignore'):
+            baseline = (cumulative[index] - cumulative[window_start]) / window
+
+        current = slice(length - period, length)
+        period_daily = daily[current]
+        period_total = float(period_daily.sum())
+        previous_total = float(daily[max(length - 2 * period, 0):length - period].sum())
+
+        # Robust z-score of each day's excess over its baseline
+        residual = period_daily - np.nan_to_num(baseline[current])
+        centre = np.median(residual)
+        mad = np.median(np.abs(residual - centre))
+        if mad > 0:
+            z = 0.6745 * (residual - centre) / mad
+        else:
+            spread = residual.std()
+            z = (residual - residual.mean()) / spread if spread > 0 else np.zeros(period)
+        anomalous = np.flatnonzero((z > self.anomaly_z) & (period_daily > 0))
+        period_days = start + (length - period) + np.arange(period)
+
+        # Weekday index: mean spend on that weekday relative to the overall daily mean
+        active = np.flatnonzero(daily)
+        weekday_index = np.zeros(7)
+        if len(active):
+            first = active[0]
+            weekday = ((start + np.arange(first, length)).astype(np.int64) + 3) % 7  # 0 = Monday
+            weekday_mean = (np.bincount(weekday, weights=daily[first:], minlength=7)
+                            / np.maximum(np.bincount(weekday, minlength=7), 1))
+            overall = daily[first:].mean()
+            weekday_index = weekday_mean / overall if overall > 0 else weekday_index
+
+        # Category breakdown over the period
+        in_period = offset >= length - period
+        names, codes = np.unique(series['category'][keep][in_period].astype(str), return_inverse=True)
+        category_totals = np.bincount(codes, weights=totals[in_period], minlength=len(names))
+        order = np.argsort(category_totals)[::-1]
+
+        # Monthly totals over the loaded history; the last month is month-to-date
+        months = (start + index).astype('datetime64[M]')
+        month_names, month_codes = np.unique(months, return_inverse=True)
+        monthly = np.bincount(month_codes, weights=daily, minlength=len(month_names))
+        month_change = None
+        if len(monthly) >= 3 and monthly[-3] > 0:
+            month_change = float(monthly[-2] / monthly[-3] - 1)
+
+        return {
+            'period_days': period,
+            'total_spent': round(period_total, 2),
+            'transactions': int(txns[current].sum()),
+            'daily_average': round(period_total / period, 2),
+            'active_days': int(np.count_nonzero(period_daily)),
+            'previous_period_total': round(previous_total, 2),
+            'baseline_daily': round(float(np.nan_to_num(baseline[-1])), 2),
+            'peak_day': ({'date': str(period_days[int(np.argmax(period_daily))]),
+                          'total': round(float(period_daily.max()), 2)}
+                         if period_total > 0 else None),
+            'anomalies': [{'date': str(period_days[i]),
+                           'total': round(float(period_daily[i]), 2),
+                           'baseline': round(float(np.nan_to_num(baseline[current][i])), 2),
+                           'z_score': round(float(z[i]), 2)} for i in anomalous],
+            'weekday_index': {WEEKDAYS[d]: round(float(weekday_index[d]), 3) for d in range(7)},
+            'categories': [{'category': names[i],
+                            'total': round(float(category_totals[i]), 2),
+                            'share': round(float(category_totals[i] / period_total), 3)}
+                           for i in order if category_totals[i] > 0],
+            'monthly': [{'month': str(m), 'total': round(float(t), 2)}
+                        for m, t in zip(month_names, monthly)],
+            'month_over_month': round(month_change, 3) if month_change is not None else None
+        }
+
+    def insights(self, analysis: Dict) -> List[Dict]:
+        period = analysis['period_days']
+        total = analysis['total_spent']
+        insights = []
+        if total <= 0:
+            return insights
+
+        insights.append({
+            'type': 'spending_pattern',
+            'title': 'Spending Trend',
+            'insight': f"You've spent ${total:.2f} in the last {period} days, "
+                      f"averaging ${analysis['daily_average']:.2f} per day.",
+            'confidence_score': 0.95
+        })
+
+        peak = analysis['peak_day']
+        insights.append({
+            'type': 'peak_spending',
+            'title': 'Highest Spending Day',
+            'insight': f"Your highest spending was ${peak['total']:.2f} on {peak['date']}.",
+            'confidence_score': 1.0
+        })
+
+        if analysis['anomalies']:
+            worst = max(analysis['anomalies'], key=lambda a: a['z_score'])
+            insights.append({
+                'type': 'spending_anomaly',
+                'title': 'Unusual Spending',
+                'insight': f"{len(analysis['anomalies'])} day(s) stood out from your usual spending; "
+                          f"on {worst['date']} you spent ${worst['total']:.2f} against a typical "
+                          f"${worst['baseline']:.2f}.",
+                'data': analysis['anomalies'],
+                'confidence_score': 0.85
+            })
+
+        weekday, index = max(analysis['weekday_index'].items(), key=lambda item: item[1])
+        if index >= 1.3:
+            insights.append({
+                'type': 'weekday_pattern',
+                'title': 'Busiest Day of the Week',
+                'insight': f"You spend {index - 1:.0%} more than average on {weekday}s.",
+                'confidence_score': 0.75
+            })
+
+        if analysis['categories']:
+            top = analysis['categories'][0]
+            insights.append({
+                'type': 'category_breakdown',
+                'title': 'Top Category',
+                'insight': f"{top['category'].title()} accounts for {top['share']:.0%} "
+                          f"of your spending (${top['total']:.2f}).",
+                'data': analysis['categories'],
+                'confidence_score': 0.9
+            })
+
+        change = analysis['month_over_month']
+        if change is not None and abs(change) >= 0.1:
+            insights.append({
+                'type': 'monthly_trend',
+                'title': 'Month-over-Month',
+                'insight': f"Last month's spending was {abs(change):.0%} "
+                          f"{'higher' if change > 0 else 'lower'} than the month before.",
+                'confidence_score': 0.8
+            })
+
+        previous = analysis['previous_period_total']
+        if previous > 0 and total > previous * 1.2:  # 20% over the previous period
+            insights.append({
+                'type': 'savings_opportunity',
+                'title': 'Savings Opportunity',
+                'insight': f"Your spending is {total / previous - 1:.0%} higher than the previous "
+                          f"{period} days. Consider reviewing recurring expenses for savings opportunities.",
+                'potential_savings': round(total - previous, 2),
+                'confidence_score': 0.8
+            })
+
+        return insights
+
+
+AI_INSIGHT_TYPES = {'spending_pattern', 'savings_opportunity', 'investment_recommendation',
+                    'group_health', 'fraud_alert', 'market_analysis'}
+
+
+def _copy_field(value) -> str:
+    """One field in COPY text format"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def analyze_spending_batch(task: Dict) -> Dict:
+    """Spending insights for a batch of users, as COPY rows for ai_insights.
+
+    task['rows'] are (user_id, epoch_day, category, total, txn_count) tuples
+    ordered by user_id; runs in a pool worker, so everything is plain data.
+    """
+    rows = task['rows']
+    analytics = SpendingAnalytics(**task.get('analytics', {}))
+    today = np.datetime64(task['run_date'], 'D')
+    users = np.array([r[0] for r in rows], dtype=object)
+    days = np.array([r[1] for r in rows], dtype=np.int64).astype('datetime64[D]')
+    categories = np.array([r[2] for r in rows], dtype=object)
+    totals = np.array([r[3] for r in rows], dtype=np.float64)
+    counts = np.array([r[4] for r in rows], dtype=np.int64)
+    bounds = np.concatenate(([0], np.flatnonzero(users[1:] != users[:-1]) + 1, [len(rows)]))
+
+    lines = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        series = {'day': days[lo:hi], 'category': categories[lo:hi],
+                  'total': totals[lo:hi], 'count': counts[lo:hi]}
+        analysis = analytics.analyze(series, task['period'], today)
+        for insight in analytics.insights(analysis):
+            kind = insight['type']
+            data = {'pipeline': task['pipeline'], 'run_date': task['run_date'], 'kind': kind,
+                    'data': insight.get('data')}
+            lines.append('\t'.join(_copy_field(v) for v in (
+                users[lo],
+                kind if kind in AI_INSIGHT_TYPES else 'spending_pattern',
+                insight['title'],
+                insight['insight'],
+                json.dumps(data),
+                insight.get('confidence_score'),
+                insight.get('potential_savings'),
+                task['expires_at']
+            )) + '\n')
+
+    return {
+        'copy': ''.join(lines),
+        'users': len(bounds) - 1,
+        'insights': len(lines),
+        'rows': len(rows),
+        'last_user_id': users[-1] if len(rows) else None
+    }
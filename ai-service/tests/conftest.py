@@ -0,0 +1,76 @@
+# ai-service/tests/conftest.py
+# Shared fixtures. AI_CODE trains placeholder models into ./models on import,
+# so the suite runs from a scratch directory with the scheduler switched off.
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+os.environ.setdefault('SCHEDULER_ENABLED', '0')
+os.environ.setdefault('HF_HUB_OFFLINE', '1')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_workdir = tempfile.mkdtemp(prefix='ai-service-tests-')
+os.makedirs(os.path.join(_workdir, 'models'))
+os.chdir(_workdir)
+
+
+def wait_for(predicate, timeout: float = 5.0, interval: float = 0.01):
+    """Poll until predicate() is truthy (background threads in the code under test)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return bool(predicate())
+
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip('fakeredis')
+    return fakeredis.FakeRedis()
+
+
+@pytest.fixture(scope='session')
+def redis_server():
+    """URL of a throwaway local redis-server on a free port"""
+    binary = shutil.which('redis-server')
+    if binary is None:
+        pytest.skip('redis-server not installed')
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([binary, '--port', str(port), '--bind', '127.0.0.1',
+                                '--save', '', '--appendonly', 'no'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail('redis-server did not start')
+                time.sleep(0.05)
+        yield f"redis://127.0.0.1:{port}/0"
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+@pytest.fixture
+def redis_url(redis_server):
+    import redis
+
+    client = redis.Redis.from_url(redis_server)
+    client.flushdb()
+    client.close()
+    return redis_server
@@ -0,0 +1,47 @@
+# ai-service/tests/test_daily_insights.py
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from AI_CODE import DailyInsightPipeline
+from spending_insights import SpendingAnalytics, analyze_spending_batch
+
+
+def batch_task(users: int = 20, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    today = np.datetime64('2025-06-30')
+    rows = []
+    for user in range(users):
+        for day in np.sort(rng.choice(365, 60, replace=False)):
+            rows.append((f"user-{user:04d}", int((today - day).astype(np.int64)),
+                         str(rng.choice(['groceries', 'travel'])), float(rng.gamma(2.0, 20.0)), 1))
+    return {'pipeline': 'daily_insights', 'run_date': str(today), 'period': 30,
+            'analytics': {}, 'expires_at': str(today + 2), 'rows': rows}
+
+
+def test_batches_match_inline_results_in_a_forkserver_pool():
+    tasks = [batch_task(seed=seed) for seed in range(3)]
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('forkserver')) as pool:
+        pooled = list(pool.map(analyze_spending_batch, tasks))
+
+    assert pooled == [analyze_spending_batch(task) for task in tasks]
+    assert pooled[0]['users'] == 20 and pooled[0]['insights'] > 0
+
+
+def test_shards_on_one_host_share_the_worker_slots(tmp_path):
+    def pipeline():
+        return DailyInsightPipeline(SpendingAnalytics(), max_workers=3, host_workers=4,
+                                    slot_dir=str(tmp_path))
+
+    first = pipeline().claim_workers()
+    second = pipeline().claim_workers()
+    assert (len(first), len(second)) == (3, 1)
+
+    for slot in first + second:
+        slot.close()
+    third = pipeline().claim_workers()
+    assert len(third) == 3
+    for slot in third:
+        slot.close()
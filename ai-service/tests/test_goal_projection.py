@@ -0,0 +1,45 @@
+# ai-service/tests/test_goal_projection.py
+
+from AI_CODE import GoalProjector
+from goal_simulation import simulate_goal
+
+
+def goal_params(goal_id: str, **overrides):
+    params = {
+        'goal_id': goal_id, 'name': goal_id, 'target_amount': 20_000.0,
+        'current_amount': 5_000.0, 'monthly_contribution': 250.0,
+        'months': 36, 'paths': 2_000, 'cash': 0.1,
+        'weights': [0.6, 0.4], 'mu': [0.07, 0.03],
+        'cov': [[0.03, 0.002], [0.002, 0.005]],
+        'risk_free_rate': 0.04, 'seed': 42,
+    }
+    params.update(overrides)
+    return params
+
+
+def test_simulation_is_seeded_and_fan_is_ordered():
+    first, second = simulate_goal(goal_params('a')), simulate_goal(goal_params('a'))
+
+    assert first == second
+    assert [p['month'] for p in first['projection']] == [12, 24, 36]
+    for point in first['projection']:
+        assert point['p10'] <= point['p50'] <= point['p90']
+    assert 0 <= first['probability'] <= 1
+
+
+def test_projector_pool_uses_forkserver_and_matches_serial_results():
+    projector = GoalProjector(analyzer=None, optimizer=None, max_workers=2)
+    params = [goal_params(str(i), seed=i, monthly_contribution=100.0 * i) for i in range(3)]
+    try:
+        pool = projector._executor()
+        assert pool._mp_context.get_start_method() == 'forkserver'
+        assert list(pool.map(simulate_goal, params)) == [simulate_goal(p) for p in params]
+    finally:
+        projector._pool.shutdown()
+
+
+def test_contributions_raise_success_probability():
+    low = simulate_goal(goal_params('g', monthly_contribution=0.0))
+    high = simulate_goal(goal_params('g', monthly_contribution=500.0))
+
+    assert high['probability'] > low['probability']
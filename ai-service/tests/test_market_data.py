@@ -0,0 +1,114 @@
+# ai-service/tests/test_market_data.py
+
+import json
+import time
+
+import pytest
+
+from AI_CODE import FakeMarketDataSource, MarketDataCache, MarketDataClient
+from conftest import wait_for
+
+SYMBOLS = ['SPY', 'QQQ', 'BND']
+
+
+@pytest.fixture
+def source():
+    return FakeMarketDataSource(seed=7)
+
+
+@pytest.fixture
+def cache(fake_redis, source):
+    return MarketDataCache(fake_redis, MarketDataClient(source, max_workers=2), SYMBOLS,
+                           key='test:snapshot', fresh_ttl=60, max_stale=3600, lock_ttl=30)
+
+
+def store_snapshot(cache, age: float, quotes=None):
+    snapshot = {
+        'fetched_at': time.time() - age,
+        'source': 'fake',
+        'fetch_seconds': 0.01,
+        'quotes': quotes or {'SPY': {'current_price': 500.0}},
+    }
+    cache.redis.set(cache.key, json.dumps(snapshot))
+
+
+def test_fake_source_is_deterministic_and_overlapping_periods_agree(source):
+    month = source.fetch_history('SPY', '1mo', '1d')
+    year = source.fetch_history('SPY', '1y', '1d')
+
+    assert month.equals(FakeMarketDataSource(seed=7).fetch_history('SPY', '1mo', '1d'))
+    overlap = year[year['timestamp'].isin(month['timestamp'])].reset_index(drop=True)
+    assert overlap.equals(month.reset_index(drop=True))
+    assert (month['high'] >= month[['open', 'close']].max(axis=1)).all()
+    assert (month['low'] <= month[['open', 'close']].min(axis=1)).all()
+
+
+def test_missing_snapshot_returns_immediately_and_refreshes_in_background(fake_redis, source):
+    source.latency = 0.3
+    cache = MarketDataCache(fake_redis, MarketDataClient(source), SYMBOLS, key='test:snapshot')
+
+    started = time.perf_counter()
+    quotes, freshness = cache.get_snapshot()
+
+    assert time.perf_counter() - started < source.latency
+    assert quotes == {}
+    assert freshness == {'status': 'missing', 'source': 'fake', 'fetched_at': None,
+                         'age_seconds': None, 'stale': True}
+    assert wait_for(lambda: fake_redis.get(cache.key) is not None)
+    assert wait_for(lambda: fake_redis.get(cache.lock_key) is None)
+
+    quotes, freshness = cache.get_snapshot()
+    assert sorted(quotes) == sorted(SYMBOLS)
+    assert freshness['status'] == 'fresh'
+    assert not freshness['stale']
+
+
+def test_stale_snapshot_is_served_while_it_is_revalidated(cache, source):
+    store_snapshot(cache, age=120)
+
+    quotes, freshness = cache.get_snapshot()
+
+    assert quotes == {'SPY': {'current_price': 500.0}}
+    assert freshness['status'] == 'stale'
+    assert freshness['stale'] is True
+    assert 119 <= freshness['age_seconds'] <= 125
+    assert wait_for(lambda: json.loads(cache.redis.get(cache.key))['quotes'].keys() == set(SYMBOLS))
+    assert wait_for(lambda: cache.redis.get(cache.lock_key) is None)
+
+
+def test_fresh_snapshot_does_not_touch_the_source(cache, source):
+    store_snapshot(cache, age=5)
+
+    quotes, freshness = cache.get_snapshot()
+
+    assert freshness['status'] == 'fresh'
+    assert freshness['fetched_at'].endswith('Z')
+    assert freshness['source'] == 'fake'
+    assert source.calls == 0
+    assert cache.redis.get(cache.lock_key) is None
+
+
+def test_refresh_lock_allows_one_refresh_at_a_time(cache, source):
+    source.latency = 0.2
+    store_snapshot(cache, age=120)
+
+    assert cache.refresh_async() is True
+    assert cache.refresh_async() is False
+    cache.get_snapshot()
+    assert 0 < cache.redis.pttl(cache.lock_key) <= cache.lock_ttl * 1000
+
+    assert wait_for(lambda: cache.redis.get(cache.lock_key) is None)
+    # One bulk history download plus one fundamentals call per symbol
+    assert source.calls == 1 + len(SYMBOLS)
+
+
+def test_failed_refresh_releases_the_lock_and_keeps_the_old_snapshot(cache, source, monkeypatch):
+    store_snapshot(cache, age=120)
+    monkeypatch.setattr(cache.client, 'quotes', lambda symbols: {})
+
+    assert cache.refresh_async() is True
+    assert wait_for(lambda: cache.redis.get(cache.lock_key) is None)
+
+    quotes, freshness = cache.get_snapshot()
+    assert quotes == {'SPY': {'current_price': 500.0}}
+    assert freshness['status'] == 'stale'
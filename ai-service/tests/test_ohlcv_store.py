@@ -0,0 +1,111 @@
+# ai-service/tests/test_ohlcv_store.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from AI_CODE import OHLCVStore
+
+DAY = 86400
+
+
+def make_bars(days, close=None):
+    timestamps = np.asarray(days, dtype=np.int64) * DAY
+    close = np.full(len(timestamps), 100.0) if close is None else np.asarray(close, dtype=np.float64)
+    return pd.DataFrame({
+        'symbol': 'SPY', 'timestamp': timestamps,
+        'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+        'volume': np.full(len(timestamps), 1e6),
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    return OHLCVStore(str(tmp_path))
+
+
+def column_sizes(store):
+    series_dir = store._series_dir('SPY', '1d')
+    return {c: os.path.getsize(os.path.join(series_dir, f"{c}.bin")) for c in store.COLUMNS}
+
+
+def test_range_read(store):
+    store.write('SPY', '1d', make_bars(range(10), close=np.arange(10)))
+
+    bars = store.read('SPY', '1d', start=3 * DAY, end=5 * DAY)
+
+    assert bars['timestamp'].tolist() == [3 * DAY, 4 * DAY, 5 * DAY]
+    assert bars['close'].tolist() == [3.0, 4.0, 5.0]
+    assert store.last_timestamp('SPY', '1d') == 9 * DAY
+
+
+def test_tail_write_replaces_the_partial_last_bar(store):
+    store.write('SPY', '1d', make_bars(range(5), close=[1, 2, 3, 4, 5]))
+
+    store.write('SPY', '1d', make_bars([4, 5, 6], close=[40, 50, 60]))
+
+    bars = store.read('SPY', '1d')
+    assert bars['timestamp'].tolist() == [d * DAY for d in range(7)]
+    assert bars['close'].tolist() == [1, 2, 3, 4, 40, 50, 60]
+
+
+def test_write_starting_at_the_first_stored_bar_rewrites_from_zero(store):
+    store.write('SPY', '1d', make_bars([1, 2, 3], close=[1, 2, 3]))
+
+    store.write('SPY', '1d', make_bars([1, 2, 3, 4], close=[10, 20, 30, 40]))
+
+    assert store.read('SPY', '1d')['close'].tolist() == [10, 20, 30, 40]
+
+
+def test_write_before_the_first_stored_bar_replaces_the_series(store):
+    store.write('SPY', '1d', make_bars([5, 6, 7], close=[5, 6, 7]))
+
+    store.write('SPY', '1d', make_bars([1, 2, 5, 6], close=[1, 2, 50, 60]))
+
+    bars = store.read('SPY', '1d')
+    assert bars['timestamp'].tolist() == [d * DAY for d in (1, 2, 5, 6)]
+    assert bars['close'].tolist() == [1, 2, 50, 60]
+
+
+def test_shorter_rewrite_never_shrinks_column_files(store):
+    store.write('SPY', '1d', make_bars(range(10)))
+    sizes = column_sizes(store)
+    before = store.read('SPY', '1d')  # Reader holding maps across the rewrite
+
+    store.write('SPY', '1d', make_bars([8], close=[7]))
+
+    assert column_sizes(store) == sizes
+    assert store.read('SPY', '1d')['close'].tolist() == [100] * 8 + [7]
+    assert len(before['close']) == 10
+    assert float(before['close'][-1]) == 100.0
+
+
+def test_store_without_length_file_falls_back_to_column_sizes(store):
+    store.write('SPY', '1d', make_bars(range(4)))
+    os.remove(os.path.join(store._series_dir('SPY', '1d'), 'length'))
+
+    assert len(store.read('SPY', '1d')['timestamp']) == 4
+    store.write('SPY', '1d', make_bars([4]))
+    assert len(store.read('SPY', '1d')['timestamp']) == 5
+
+
+def test_symbols_without_bars_are_not_marked_synced(store):
+    from AI_CODE import FakeMarketDataSource, MarketDataClient, MarketHistoryService, empty_history_frame
+
+    source = FakeMarketDataSource()
+    service = MarketHistoryService(store, MarketDataClient(source, bulk=False), sync_ttl=900)
+    real_fetch = source.fetch_history
+    source.fetch_history = lambda symbol, period, interval: (
+        empty_history_frame() if symbol == 'QQQ' else real_fetch(symbol, period, interval))
+
+    service.sync(['SPY', 'QQQ'], '1d')
+    assert store.synced_at('SPY', '1d') > 0
+    assert store.synced_at('QQQ', '1d') == 0
+
+    source.fetch_history = real_fetch
+    calls = source.calls
+    service.sync(['SPY', 'QQQ'], '1d')
+    assert source.calls == calls + 1  # Only QQQ is retried
+    assert store.last_timestamp('QQQ', '1d') is not None
@@ -0,0 +1,29 @@
+# ai-service/tests/test_portfolio_optimizer.py
+
+import pytest
+
+from AI_CODE import PortfolioOptimizer, RiskAnalytics
+
+
+def asset(asset_class: str):
+    return {'name': asset_class, 'type': 'etf', 'asset_class': asset_class, 'reason': ''}
+
+
+def test_asset_classes_without_a_prior_fall_back_to_the_default():
+    optimizer = PortfolioOptimizer({'VTI': asset('stocks'), 'VNQ': asset('reits'),
+                                    'GLD': asset('commodities')}, points=5, iterations=50)
+
+    mu, cov = optimizer.prior_moments()
+    assert mu.tolist() == [0.08, 0.06, 0.06]
+    assert cov[1, 1] == pytest.approx(0.15 ** 2)
+    # Different unknown classes are not treated as one class
+    assert cov[1, 2] == pytest.approx(0.1 * 0.15 ** 2)
+
+    weights = optimizer.allocate(0.12)
+    assert sum(weights.values()) == pytest.approx(1.0)
+    assert optimizer.frontier(RiskAnalytics())['source'] == 'prior'
+
+
+def test_universe_entries_need_an_asset_class():
+    with pytest.raises(ValueError, match='VNQ'):
+        PortfolioOptimizer({'VTI': asset('stocks'), 'VNQ': {'name': 'REIT', 'type': 'etf'}})
@@ -0,0 +1,183 @@
+# ai-service/tests/test_receipt_archive.py
+# ReceiptArchive against moto's in-process S3
+
+import hashlib
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from AI_CODE import ReceiptArchive
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+BUCKET = 'receipts-test'
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def archive(s3):
+    archive = ReceiptArchive(s3, BUCKET, workers=2, multipart_threshold=5 * MB, multipart_chunksize=5 * MB)
+    yield archive
+    archive.flush(10)
+
+
+def receipt_png() -> bytes:
+    img = np.full((400, 300, 3), 255, np.uint8)
+    for row in range(20, 380, 30):
+        cv2.putText(img, f"ITEM {row:03d}  {row / 10:6.2f}", (10, row), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1)
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def count_calls(monkeypatch, obj, name, gate=None):
+    calls = []
+    original = getattr(obj, name)
+
+    def wrapper(*args, **kwargs):
+        calls.append(args)
+        if gate is not None:
+            gate.wait(5)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(obj, name, wrapper)
+    return calls
+
+
+def test_key_is_content_addressed(archive):
+    data = b'not really an image'
+    digest = hashlib.sha256(data).hexdigest()
+
+    assert archive.archive(data) == f"receipts/{digest[:2]}/{digest}"
+    archive.flush(10)
+    assert archive.load(archive.key_for(digest)) == data
+
+
+def test_disabled_without_a_bucket(s3):
+    assert ReceiptArchive(s3, None).archive(b'image') is None
+
+
+def test_concurrent_duplicate_is_not_uploaded_twice(archive, monkeypatch):
+    gate = threading.Event()
+    heads = count_calls(monkeypatch, archive, 'exists', gate)
+
+    first = archive.archive(b'same image')
+    second = archive.archive(b'same image')  # First upload still in flight
+    gate.set()
+    archive.flush(10)
+
+    assert first == second
+    assert len(heads) == 1
+    assert archive.metrics['uploaded'] == 1
+    assert archive.metrics['deduplicated'] == 1
+
+
+def test_known_key_skips_the_head_request(archive, monkeypatch):
+    archive.archive(b'seen before')
+    archive.flush(10)
+    heads = count_calls(monkeypatch, archive, 'exists')
+
+    archive.archive(b'seen before')
+    archive.flush(10)
+
+    assert heads == []
+    assert archive.metrics['deduplicated'] == 1
+
+
+def test_object_already_in_the_bucket_is_found_by_head(s3, archive, monkeypatch):
+    archive.archive(b'uploaded by another worker')
+    archive.flush(10)
+
+    fresh = ReceiptArchive(s3, BUCKET)
+    uploads = count_calls(monkeypatch, fresh.s3, 'upload_fileobj')
+    fresh.archive(b'uploaded by another worker')
+    fresh.flush(10)
+
+    assert uploads == []
+    assert fresh.metrics['deduplicated'] == 1
+    assert fresh.metrics['uploaded'] == 0
+
+
+def test_failed_upload_is_retried_on_the_next_archive(archive, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('S3 unavailable')
+    monkeypatch.setattr(archive.s3, 'upload_fileobj', broken)
+    key = archive.archive(b'flaky')
+    archive.flush(10)
+    assert archive.metrics['failed'] == 1
+    monkeypatch.undo()
+
+    assert archive.archive(b'flaky') == key
+    archive.flush(10)
+    assert archive.load(key) == b'flaky'
+
+
+def test_large_images_go_up_in_multipart_chunks(s3, archive):
+    big = np.random.default_rng(0).bytes(11 * MB)
+    small = b'x' * 1024
+    big_key, small_key = archive.archive(big), archive.archive(small)
+    archive.flush(30)
+
+    assert s3.head_object(Bucket=BUCKET, Key=big_key)['ETag'].strip('"').endswith('-3')
+    assert '-' not in s3.head_object(Bucket=BUCKET, Key=small_key)['ETag'].strip('"')
+    assert archive.load(big_key) == big
+
+
+def test_lossless_formats_are_stored_as_lossless_webp(s3, archive):
+    png = receipt_png()
+    key = archive.archive(png)
+    archive.flush(10)
+
+    head = s3.head_object(Bucket=BUCKET, Key=key)
+    stored = archive.load(key)
+    assert head['ContentType'] == 'image/webp'
+    assert head['Metadata']['original-format'] == 'PNG'
+    assert head['Metadata']['sha256'] == hashlib.sha256(png).hexdigest()
+    assert len(stored) < len(png)
+    decoded = cv2.imdecode(np.frombuffer(stored, np.uint8), cv2.IMREAD_UNCHANGED)
+    original = cv2.imdecode(np.frombuffer(png, np.uint8), cv2.IMREAD_UNCHANGED)
+    assert np.array_equal(decoded, original)
+
+
+def test_jpeg_is_kept_byte_for_byte(s3, archive):
+    jpeg = cv2.imencode('.jpg', cv2.imdecode(np.frombuffer(receipt_png(), np.uint8), cv2.IMREAD_COLOR))[1].tobytes()
+    key = archive.archive(jpeg)
+    archive.flush(10)
+
+    assert s3.head_object(Bucket=BUCKET, Key=key)['ContentType'] == 'image/jpeg'
+    assert archive.load(key) == jpeg
+
+
+def test_process_receipt_archives_on_cache_hits_too(fake_redis, monkeypatch):
+    import asyncio
+
+    import AI_CODE
+
+    monkeypatch.setattr(AI_CODE.CACHES['receipts'], 'redis', fake_redis)
+    monkeypatch.setattr(AI_CODE.CACHES['receipts'], 'bus', None)
+    archived, extracted = [], []
+    monkeypatch.setattr(AI_CODE.receipt_archive, 'archive',
+                        lambda data, digest: archived.append(digest) or f"receipts/{digest}")
+
+    async def extract(image_data, digest=None):
+        extracted.append(digest)
+        return {'success': True, 'total': 12.5}
+    processor = AI_CODE.ReceiptProcessor()
+    monkeypatch.setattr(processor, 'extract', extract)
+
+    first = asyncio.run(processor.process_receipt(b'receipt bytes'))
+    second = asyncio.run(processor.process_receipt(b'receipt bytes'))
+
+    digest = hashlib.sha256(b'receipt bytes').hexdigest()
+    assert first == second == {'success': True, 'total': 12.5, 'image_hash': digest,
+                               'image_key': f"receipts/{digest}"}
+    assert extracted == [digest]
+    assert archived == [digest, digest]
@@ -0,0 +1,121 @@
+# ai-service/tests/test_receipt_layout.py
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from AI_CODE import ReceiptProcessor, diff_receipts, words_to_text
+
+CORPUS = os.path.join(os.path.dirname(__file__), 'fixtures', 'receipt_layout_corpus.jsonl')
+
+CHAR_WIDTH, LINE_HEIGHT, PRICE_RIGHT = 12, 20, 420
+
+
+def layout(rows):
+    """image_to_data-style word boxes: names from the left margin, prices right-aligned"""
+    words = {'text': [], 'left': [], 'top': [], 'width': [], 'height': [], 'conf': []}
+
+    def add(token, left, top):
+        for key, value in zip(words, (token, left, top, len(token) * CHAR_WIDTH, LINE_HEIGHT - 4, 95.0)):
+            words[key].append(value)
+
+    for i, row in enumerate(rows):
+        top = 40 + i * int(LINE_HEIGHT * 1.5)
+        *name, last = row.split()
+        tokens = name if any(c.isdigit() for c in last) and '.' in last else row.split()
+        x = 20
+        for token in tokens:
+            add(token, x, top)
+            x += (len(token) + 1) * CHAR_WIDTH
+        if tokens is name:
+            add(last, PRICE_RIGHT - len(last) * CHAR_WIDTH, top)
+    return words
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return ReceiptProcessor(detect_region=False)
+
+
+def parse(processor, rows):
+    return processor.parse_receipt_layout(layout(['FRESH MARKET', '123 MAIN ST'] + rows))
+
+
+def item_names(result):
+    return [item['name'] for item in result['items']]
+
+
+def test_item_names_containing_label_words_stay_items(processor):
+    result = parse(processor, ['MULTIPACK YOGURT 5.99', 'ROASTED CASHEWS 7.49', 'BANANAS 1.20',
+                               'SUBTOTAL 14.68', 'TAX 1.17', 'TOTAL 15.85'])
+
+    assert item_names(result) == ['MULTIPACK YOGURT', 'ROASTED CASHEWS', 'BANANAS']
+    assert (result['subtotal'], result['tax'], result['tip'], result['total']) == (14.68, 1.17, 0, 15.85)
+    assert result['reconciled'] is True
+    assert not processor.needs_gpt4({**result, 'confidence': 0.5})  # Reconciled: no GPT-4
+
+
+@pytest.mark.parametrize('name', ['TIPTREE JAM', 'CASHMERE SOCKS', 'CHANGEABLE HEAD MOP',
+                                  'VISAGE CREAM', 'SUBMARINE ROLL', 'TAXCO SALSA', 'CREDITON CHEDDAR'])
+def test_label_words_inside_item_names(processor, name):
+    result = parse(processor, [f"{name} 3.50", 'BREAD 2.00', 'TOTAL 5.50'])
+
+    assert item_names(result) == [name, 'BREAD']
+    assert result['total'] == 5.50
+    assert result['tip'] == 0
+
+
+def test_tender_and_savings_rows_are_not_items_or_totals(processor):
+    result = parse(processor, ['MILK 3.49', 'EGGS 4.51', 'SUBTOTAL 8.00', 'SALES TAX 0.64',
+                               'TOTAL 8.64', 'TOTAL SAVINGS 1.00', 'VISA 8.64', 'CASH 10.00',
+                               'CHANGE 1.36', 'YOU SAVED 1.00'])
+
+    assert item_names(result) == ['MILK', 'EGGS']
+    assert (result['subtotal'], result['tax'], result['total']) == (8.00, 0.64, 8.64)
+    assert result['reconciled'] is True
+
+
+@pytest.mark.parametrize('subtotal_label,tax_label,total_label', [
+    ('SUB-TOTAL', 'TAX', 'BALANCE DUE'),
+    ('SUB TOTAL', 'TOTAL TAX', 'AMOUNT DUE'),
+    ('SUBTOTAL', 'HST', 'GRAND TOTAL'),
+])
+def test_summary_label_variants(processor, subtotal_label, tax_label, total_label):
+    result = parse(processor, ['COFFEE 4.00', 'MUFFIN 3.00', f"{subtotal_label} 7.00",
+                               f"{tax_label} 0.56", f"{total_label} 7.56"])
+
+    assert item_names(result) == ['COFFEE', 'MUFFIN']
+    assert (result['subtotal'], result['tax'], result['total']) == (7.00, 0.56, 7.56)
+    assert result['reconciled'] is True
+
+
+def test_tip_and_gratuity_rows(processor):
+    result = parse(processor, ['PASTA 18.00', 'WINE 12.00', 'TAX 2.40', 'GRATUITY 5.40', 'TOTAL 37.80'])
+
+    assert item_names(result) == ['PASTA', 'WINE']
+    assert result['tip'] == 5.40
+    assert result['reconciled'] is True
+
+
+def test_labelled_corpus_item_f1_and_escalations(processor):
+    """Hand-labelled receipts (tax flags, item codes, coupons, wrapped names, skew, misreads, cut-off totals)"""
+    with open(CORPUS) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+    scores = {}
+    for parser in ('text', 'layout'):
+        f1, escalations = [], []
+        for receipt in corpus:
+            result = processor.parse_ocr({'method': 'tesseract', 'confidence': receipt['confidence'],
+                                          'text': words_to_text(receipt['words']),
+                                          'words': receipt['words'] if parser == 'layout' else {}})
+            f1.append(diff_receipts(receipt['truth'], result)['item_f1'])
+            escalations.append(processor.needs_gpt4(result))
+        scores[parser] = float(np.mean(f1)), float(np.mean(escalations))
+
+    assert len(corpus) == 24
+    assert scores['layout'][0] >= 0.80
+    assert scores['layout'][1] <= 4 / 24
+    assert scores['layout'][0] > scores['text'][0] + 0.25
+    assert scores['layout'][1] < scores['text'][1]
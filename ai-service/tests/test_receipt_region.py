@@ -0,0 +1,110 @@
+# ai-service/tests/test_receipt_region.py
+# Receipt region detection on fixture photos (fixtures/receipt_photos/corners.json has the
+# paper's true corners, tl/tr/br/bl, some of them outside the frame)
+
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import AI_CODE
+from AI_CODE import ReceiptProcessor
+
+PHOTOS = os.path.join(os.path.dirname(__file__), 'fixtures', 'receipt_photos')
+with open(os.path.join(PHOTOS, 'corners.json')) as f:
+    CORNERS = json.load(f)
+
+
+def photo(name):
+    return cv2.imread(os.path.join(PHOTOS, name))
+
+
+def iou(a, b, shape):
+    """Overlap of two quadrilaterals, clipped to the frame"""
+    masks = [np.zeros(shape[:2], np.uint8) for _ in range(2)]
+    for mask, quad in zip(masks, (a, b)):
+        cv2.fillPoly(mask, [np.round(quad).astype(np.int32)], 1)
+    return (masks[0] & masks[1]).sum() / (masks[0] | masks[1]).sum()
+
+
+@pytest.fixture(scope='module')
+def processor():
+    return ReceiptProcessor(detect_region=True)
+
+
+@pytest.mark.parametrize('name', ['table.jpg', 'past_frame.jpg', 'white_table.jpg'])
+def test_receipt_is_found(processor, name):
+    img = photo(name)
+    corners = processor.detect_receipt_region(img)
+
+    assert corners is not None
+    assert iou(corners, CORNERS[name], img.shape) > 0.9
+
+
+def test_receipt_running_past_the_frame_is_cropped_at_the_edge(processor):
+    img = photo('past_frame.jpg')
+    cropped, info = processor.crop_receipt(img)
+
+    assert info['detected']
+    assert max(y for _, y in info['corners']) <= img.shape[0]
+    assert cropped.shape[0] > 0.65 * img.shape[0]  # Everything from the top edge down to the frame
+
+
+def test_white_table_is_not_taken_for_paper(processor):
+    cropped, info = processor.crop_receipt(photo('white_table.jpg'))
+
+    assert info['detected']
+    assert info['cropped_pixels'] < 0.45 * info['pixels']
+
+
+def test_scan_is_left_uncropped(processor):
+    img = photo('scan.jpg')
+    cropped, info = processor.crop_receipt(img)
+
+    pixels = img.shape[0] * img.shape[1]
+    assert info == {'detected': False, 'pixels': pixels, 'cropped_pixels': pixels}
+    assert cropped is img
+
+
+def fake_tesseract(monkeypatch, confidence):
+    """image_to_data whose confidence depends on the image it is given"""
+    calls = []
+
+    def image_to_data(img, output_type=None):
+        calls.append(img.shape)
+        return {'text': ['TOTAL', '9.99'], 'left': [10, 200], 'top': [10, 10], 'width': [60, 50],
+                'height': [14, 14], 'conf': [confidence(img)] * 2, 'block_num': [1, 1],
+                'par_num': [1, 1], 'line_num': [1, 1]}
+    monkeypatch.setattr(AI_CODE.pytesseract, 'image_to_data', image_to_data)
+    return calls
+
+
+def encode(img):
+    return cv2.imencode('.png', img)[1].tobytes()
+
+
+def test_low_confidence_crop_falls_back_to_the_whole_photo(processor, monkeypatch):
+    img = photo('table.jpg')
+    calls = fake_tesseract(monkeypatch, lambda im: 40.0 if im.shape[:2] != img.shape[:2] else 85.0)
+
+    ocr = processor.ocr_with_tesseract(encode(img))
+
+    assert ocr['confidence'] == pytest.approx(0.85)
+    assert [shape[:2] for shape in calls][-1] == img.shape[:2]
+    assert len(calls) == 2
+
+
+def test_confident_crop_is_kept(processor, monkeypatch):
+    img = photo('table.jpg')
+    calls = fake_tesseract(monkeypatch, lambda im: 90.0)
+
+    ocr = processor.ocr_with_tesseract(encode(img))
+
+    assert ocr['confidence'] == pytest.approx(0.9)
+    assert len(calls) == 1 and calls[0][:2] != img.shape[:2]
+
+
+def test_region_detection_is_off_by_default():
+    assert ReceiptProcessor().detect_region is False
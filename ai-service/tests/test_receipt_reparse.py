@@ -0,0 +1,36 @@
+# ai-service/tests/test_receipt_reparse.py
+
+import orjson
+import pytest
+
+from AI_CODE import ReceiptProcessor, ReceiptReparser
+
+
+class ListStore:
+    """OcrStore.stream over in-memory OCR outputs"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def stream(self, engine=None, chunk_rows=5000):
+        for start in range(0, len(self.outputs), chunk_rows):
+            yield self.outputs[start:start + chunk_rows]
+
+
+def ocr(i: int):
+    return {'image_hash': f"{i:064x}", 'engine': 'tesseract-5', 'method': 'tesseract', 'words': {},
+            'confidence': 0.8, 'text': f"CORNER CAFE\nLATTE {i % 7 + 3}.50\nMUFFIN 2.25\nTOTAL {i % 7 + 5}.75"}
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_reparse_results_do_not_depend_on_the_pool(tmp_path, workers):
+    output = tmp_path / f"reparse-{workers}.jsonl"
+    reparser = ReceiptReparser(ReceiptProcessor(detect_region=False), ListStore([ocr(i) for i in range(40)]),
+                               workers=workers, chunk_rows=8)
+
+    report = reparser.run(baseline='', output=str(output))
+
+    assert report['receipts'] == 40
+    entries = [orjson.loads(line) for line in output.read_text().splitlines()]
+    assert [e['image_hash'] for e in entries] == [f"{i:064x}" for i in range(40)]
+    assert entries[3]['result']['total'] == 8.75
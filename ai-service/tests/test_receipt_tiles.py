@@ -0,0 +1,74 @@
+# ai-service/tests/test_receipt_tiles.py
+
+import os
+import threading
+import time
+
+import numpy as np
+
+import AI_CODE
+from AI_CODE import ReceiptProcessor
+
+
+def tall_receipt(lines: int = 200):
+    """A binarised receipt: one dark band per text line, blank rows between"""
+    img = np.full((lines * 40 + 40, 400), 255, np.uint8)
+    for i in range(lines):
+        img[40 + i * 40:40 + i * 40 + 20, 20:380] = 0
+    return img
+
+
+def fake_tesseract(monkeypatch, seconds: float = 0.02):
+    """image_to_data reporting one word per ink band, tracking how many calls overlap"""
+    state = {'running': 0, 'peak': 0, 'calls': 0}
+    lock = threading.Lock()
+
+    def image_to_data(img, output_type=None):
+        with lock:
+            state['running'] += 1
+            state['calls'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        time.sleep(seconds)
+        with lock:
+            state['running'] -= 1
+        edges = np.diff(np.concatenate(([0], (img < 128).any(axis=1).astype(np.int8), [0])))
+        tops, bottoms = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        n = len(tops)
+        return {'text': ['LINE'] * n, 'left': [20] * n, 'top': tops.tolist(), 'width': [360] * n,
+                'height': (bottoms - tops).tolist(), 'conf': [90.0] * n, 'block_num': [1] * n,
+                'par_num': [1] * n, 'line_num': list(range(n))}
+    monkeypatch.setattr(AI_CODE.pytesseract, 'image_to_data', image_to_data)
+    return state
+
+
+def test_tesseract_runs_are_bounded_across_processors_and_strips(monkeypatch, tmp_path):
+    state = fake_tesseract(monkeypatch)
+    # Two processors sharing a slot directory stand in for two worker processes on one host
+    processors = [ReceiptProcessor(tile_height=800, tile_workers=4, ocr_slots=2, slot_dir=str(tmp_path))
+                  for _ in range(2)]
+    img = tall_receipt()
+    results = []
+    threads = [threading.Thread(target=lambda p=p: results.append(p.image_to_data_tiled(img)))
+               for p in processors for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert state['peak'] == 2
+    assert [len(r['text']) for r in results] == [200] * 4
+
+
+def test_one_slot_reads_a_tall_receipt_in_one_pass(monkeypatch, tmp_path):
+    state = fake_tesseract(monkeypatch, seconds=0)
+    processor = ReceiptProcessor(tile_height=800, ocr_slots=1, slot_dir=str(tmp_path))
+    monkeypatch.setattr(processor, 'preprocess_image', lambda img: img)
+
+    ocr = processor.tesseract_pass(tall_receipt())
+
+    assert state['calls'] == 1
+    assert len(ocr['words']['text']) == 200
+
+
+def test_tesseract_gets_one_openmp_thread():
+    assert os.environ['OMP_THREAD_LIMIT'] == '1'
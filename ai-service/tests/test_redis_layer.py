@@ -0,0 +1,111 @@
+# ai-service/tests/test_redis_layer.py
+# Runs against a real redis-server (skipped when the binary is not installed)
+
+import json
+import os
+
+import pytest
+
+from AI_CODE import DistributedScheduler, RedisLayer, _RedisProxy
+
+
+@pytest.fixture
+def layer(redis_url):
+    layer = RedisLayer(redis_url, max_connections=4)
+    yield layer
+    layer.client.connection_pool.disconnect()
+
+
+def test_get_many_and_set_many_round_trip_in_batches(layer):
+    layer.set_many({'a': b'1', 'b': b'2'}, ttl=10)
+    layer.set_many({'forever': b'3'})
+
+    assert layer.get_many(['a', 'b', 'missing']) == {'a': b'1', 'b': b'2', 'missing': None}
+    assert layer.get_many([]) == {}
+    assert 0 < layer.client.pttl('a') <= 10_000
+    assert layer.client.pttl('forever') == -1
+
+
+def test_incr_sets_ttl_on_create_and_keeps_it_afterwards(layer):
+    assert layer.incr('hits', 1, ttl=5) == 1
+    assert layer.incr('hits', 2, ttl=50) == 3
+
+    assert 0 < layer.client.pttl('hits') <= 5_000
+
+
+def test_incr_gives_a_ttl_to_a_counter_that_has_none(layer):
+    layer.client.set('legacy', 10)
+
+    assert layer.incr('legacy', 1, ttl=5) == 11
+    assert 0 < layer.client.pttl('legacy') <= 5_000
+    assert layer.incr('plain', 1) == 1
+    assert layer.client.pttl('plain') == -1
+
+
+def test_incr_once_applies_only_for_the_first_claim(layer):
+    assert layer.incr('version', 1, ttl=50, once='notified:1', once_ttl=5) == 1
+    assert layer.incr('version', 1, ttl=50, once='notified:1', once_ttl=5) is None
+    assert layer.incr('version', 1, ttl=50, once='notified:2', once_ttl=5) == 2
+
+    assert int(layer.client.get('version')) == 2
+    assert 0 < layer.client.pttl('notified:1') <= 5_000
+
+
+def test_hincr_adds_fields_and_refreshes_ttl(layer):
+    assert layer.hincr('stats', {'count': 1, 'seconds': 0.25}, ttl=5) == {'count': 1.0, 'seconds': 0.25}
+    assert layer.hincr('stats', {'count': 1}, ttl=50) == {'count': 2.0}
+
+    assert 5_000 < layer.client.pttl('stats') <= 50_000
+    assert float(layer.client.hget('stats', 'seconds')) == 0.25
+
+
+def test_scheduler_status_and_finish_through_the_proxy(layer):
+    calls = []
+    scheduler = DistributedScheduler(_RedisProxy(layer), prefix='test:scheduler:')
+    scheduler.add_job('sharded', lambda shard=0, shards=1: calls.append(shard),
+                      interval=3600, shards=3, max_runtime=600)
+    scheduler.elect()
+    scheduler.heartbeat()
+    assert scheduler.run_now('sharded')
+    assert scheduler.status()['jobs']['sharded']['running'] is True
+
+    queue, processing = scheduler._key('queue'), scheduler._key('processing', scheduler.instance_id)
+    while (item := layer.client.lmove(queue, processing, 'RIGHT', 'LEFT')) is not None:
+        scheduler.execute(json.loads(item), item)
+
+    status = scheduler.status()
+    assert sorted(calls) == [0, 1, 2]
+    assert status['leader'] == scheduler.instance_id
+    assert status['jobs']['sharded']['running'] is False
+    assert status['jobs']['sharded']['last_run']['status'] == 'succeeded'
+    assert status['jobs']['sharded']['last_run']['shards'] == 3
+    assert layer.client.keys('test:scheduler:run:*') == []
+
+
+def test_forked_child_gets_its_own_pool(layer):
+    parent_client = layer.client
+    parent_client.set('owner', 'parent')
+
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = layer.client is not parent_client and layer.incr('child', 1) == 1
+            layer.reset()
+            ok = ok and layer.client.get('owner') == b'parent'
+        finally:
+            os._exit(0 if ok else 1)
+
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert layer.client is parent_client
+    assert parent_client.get('child') == b'1'  # Parent's sockets survived the child
+
+
+def test_reset_rebuilds_the_client(layer):
+    before = layer.client
+
+    layer.reset()
+
+    assert layer.client is not before
+    assert layer.client.ping()
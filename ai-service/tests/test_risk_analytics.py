@@ -0,0 +1,45 @@
+# ai-service/tests/test_risk_analytics.py
+
+import numpy as np
+
+from AI_CODE import RiskAnalytics
+
+
+def price_matrix(bars: int, symbols: int = 3, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0004, 0.01, size=(bars, symbols))
+    timestamps = np.arange(bars, dtype=np.int64) * 86_400
+    return timestamps, 100 * np.exp(np.cumsum(returns, axis=0))
+
+
+def test_incremental_updates_match_a_refit_over_the_same_history():
+    timestamps, prices = price_matrix(900)
+    symbols = ['SPY', 'AAA', 'BBB']
+
+    incremental = RiskAnalytics(window=20, history=100)
+    incremental.fit(timestamps[:150], symbols, prices[:150])
+    for i in range(150, len(timestamps)):
+        incremental.update(int(timestamps[i]), prices[i])
+
+    refit = RiskAnalytics(window=20, history=100)
+    refit.fit(timestamps[-120:], symbols, prices[-120:])
+
+    np.testing.assert_allclose(incremental.covariance(), refit.covariance(), rtol=1e-9)
+    np.testing.assert_allclose(incremental.expected_returns(), refit.expected_returns(), rtol=1e-9)
+    np.testing.assert_allclose(incremental.drawdown(), refit.drawdown(), rtol=1e-9)
+    np.testing.assert_allclose(incremental.max_drawdown(), refit.max_drawdown(), rtol=1e-9)
+
+
+def test_replacing_the_latest_bar_restores_the_history_ring():
+    timestamps, prices = price_matrix(130)
+    symbols = ['SPY', 'AAA', 'BBB']
+
+    replaced = RiskAnalytics(window=20, history=100)
+    replaced.fit(timestamps[:-1], symbols, prices[:-1])
+    replaced.update(int(timestamps[-1]), prices[-1] * 0.5)
+    replaced.update(int(timestamps[-1]), prices[-1])
+
+    direct = RiskAnalytics(window=20, history=100)
+    direct.fit(timestamps, symbols, prices)
+
+    assert replaced.metrics() == direct.metrics()
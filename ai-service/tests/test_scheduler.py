@@ -0,0 +1,71 @@
+# ai-service/tests/test_scheduler.py
+
+import json
+
+import pytest
+
+from AI_CODE import DistributedScheduler
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+def make_scheduler(redis_conn, calls):
+    scheduler = DistributedScheduler(redis_conn, prefix='test:scheduler:', lease_ttl=5)
+    scheduler.add_job('nightly', lambda shard=0, shards=1: calls.append(shard),
+                      at='06:00', shards=2, max_runtime=600)
+    return scheduler
+
+
+def take(scheduler):
+    """What _worker_loop does with one queue entry, minus the blocking wait"""
+    return scheduler.redis.lmove(scheduler._key('queue'),
+                                 scheduler._key('processing', scheduler.instance_id), 'RIGHT', 'LEFT')
+
+
+def test_completed_shards_are_acknowledged_and_release_the_job(fake_redis, calls):
+    scheduler = make_scheduler(fake_redis, calls)
+    scheduler.heartbeat()
+    assert scheduler.trigger(scheduler.jobs['nightly'], 1_000_000.0)
+
+    while (item := take(scheduler)) is not None:
+        scheduler.execute(json.loads(item), item)
+
+    assert sorted(calls) == [0, 1]
+    assert fake_redis.llen(scheduler._key('processing', scheduler.instance_id)) == 0
+    assert not fake_redis.exists(scheduler._key('running', 'nightly'))
+    assert scheduler.history('nightly')[0]['status'] == 'succeeded'
+
+
+def test_shards_of_a_dead_worker_are_requeued_and_finish_the_run(fake_redis, calls):
+    crashed, survivor = make_scheduler(fake_redis, calls), make_scheduler(fake_redis, calls)
+    crashed.heartbeat()
+    survivor.heartbeat()
+    survivor.trigger(survivor.jobs['nightly'], 1_000_000.0)
+
+    assert take(crashed) is not None  # Dies mid-shard: never acknowledged
+    assert survivor.requeue_orphans() == 0  # Still inside its lease
+    fake_redis.delete(crashed._key('alive', crashed.instance_id))
+
+    assert survivor.requeue_orphans() == 1
+    assert fake_redis.llen(crashed._key('processing', crashed.instance_id)) == 0
+    assert crashed.instance_id.encode() not in fake_redis.smembers(survivor._key('instances'))
+
+    while (item := take(survivor)) is not None:
+        survivor.execute(json.loads(item), item)
+    assert sorted(calls) == [0, 1]
+    assert not fake_redis.exists(survivor._key('running', 'nightly'))
+    assert survivor.history('nightly')[0]['status'] == 'succeeded'
+
+
+def test_status_reports_running_jobs_and_last_run(fake_redis, calls):
+    scheduler = make_scheduler(fake_redis, calls)
+    scheduler.elect()
+    scheduler.trigger(scheduler.jobs['nightly'], 1_000_000.0)
+
+    status = scheduler.status()
+    assert status['leader'] == scheduler.instance_id
+    assert status['jobs']['nightly']['running'] is True
+    assert status['jobs']['nightly']['last_run'] is None
@@ -0,0 +1,45 @@
+# ai-service/tests/test_sentiment_service.py
+
+import threading
+
+import pytest
+
+from AI_CODE import SentimentService
+
+
+class BrokenModel(SentimentService):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.release = threading.Event()
+
+    def _load_model(self):
+        self.release.wait(5)
+        raise OSError('model files missing')
+
+
+def test_batches_are_scored_and_cached():
+    calls = []
+
+    def infer(texts):
+        calls.append(list(texts))
+        return [0.9 if 'good' in t else 0.1 for t in texts]
+
+    service = SentimentService(infer_fn=infer, max_wait=0.05)
+    assert service.score(['good news', 'bad news', 'good news']) == [0.9, 0.1, 0.9]
+    assert service.score(['bad news'], timeout=0) == [0.1]
+    assert sum(len(batch) for batch in calls) == 2
+
+
+def test_submit_fails_fast_once_the_model_failed_to_load():
+    service = BrokenModel()
+    queued = service.submit('queued while loading')
+    service.release.set()
+
+    with pytest.raises(RuntimeError, match='model files missing'):
+        queued.result(timeout=5)
+    assert service.loaded.is_set() and not service.ready
+
+    later = service.submit('after the failure')
+    assert later.done()
+    with pytest.raises(RuntimeError, match='model files missing'):
+        later.result(timeout=0)
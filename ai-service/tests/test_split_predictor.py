@@ -0,0 +1,80 @@
+# ai-service/tests/test_split_predictor.py
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from AI_CODE import SplitModel, SplitPredictor
+
+T0 = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def bill(bill_id: str, seconds: float, *members: str):
+    return {'id': bill_id, 'merchant_name': 'Cafe', 'merchant_category': 'restaurants', 'items': [],
+            'completed_at': T0 + timedelta(seconds=seconds),
+            'participants': [{'user_id': m, 'name': m, 'amount_owed': 10, 'items_claimed': []}
+                             for m in members]}
+
+
+class Committed(SplitPredictor):
+    """fetch_bills over an in-memory list of committed bills, with BILLS_QUERY's bounds"""
+
+    def __init__(self, fake_redis, **kwargs):
+        super().__init__(fake_redis, **kwargs)
+        self.committed = []
+
+    def fetch_bills(self, group_id, watermark):
+        since = None if watermark is None else datetime.fromisoformat(watermark) - timedelta(seconds=self.overlap)
+        return sorted((b for b in self.committed if since is None or b['completed_at'] >= since),
+                      key=lambda b: (b['completed_at'], b['id']))
+
+
+def test_late_and_tied_completions_are_learned_exactly_once(fake_redis):
+    predictor = Committed(fake_redis, overlap=60)
+    predictor.committed.append(bill('a', 10, 'ann', 'bob'))
+    model = predictor.refresh('g')
+    assert model.bills == 1
+
+    # b committed after a was learned but completed earlier; c completed at the same instant as a
+    predictor.committed += [bill('b', 5, 'ann'), bill('c', 10, 'bob')]
+    model = predictor.refresh('g', model)
+    assert model.bills == 3
+    assert model.member_bills.tolist() == [2, 2]
+
+    model = predictor.refresh('g', SplitModel.from_bytes(model.to_bytes()))
+    assert model.bills == 3
+
+
+def test_remembered_ids_are_bounded_by_the_overlap(fake_redis):
+    predictor = Committed(fake_redis, overlap=60)
+    predictor.committed = [bill(str(i), 30 * i, 'ann') for i in range(10)]
+    model = predictor.refresh('g')
+
+    assert model.bills == 10
+    assert sorted(model.recent, key=int) == ['7', '8', '9']
+    assert model.watermark == (T0 + timedelta(seconds=270)).isoformat()
+
+
+@pytest.mark.parametrize('completed_at', [None, '2025-06-01'])
+def test_bills_without_a_datetime_still_count(fake_redis, completed_at):
+    model = SplitModel()
+    model.add_bill(dict(bill('x', 0, 'ann'), completed_at=completed_at))
+    assert model.bills == 1 and model.watermark is None
+
+
+def test_each_completion_bumps_the_group_version_once_across_processes(fake_redis):
+    processes = [Committed(fake_redis) for _ in range(3)]
+    for predictor in processes:
+        predictor.committed.append(bill('a', 0, 'ann'))
+        predictor.model('g')
+
+    for predictor in processes:
+        predictor.invalidate('g:a:1748779200')
+    assert int(fake_redis.get('split_model:version:g')) == 1
+    assert all(predictor.local.get('g') is None for predictor in processes)
+
+    # A re-completion is a new notification; 005's group-only payload always bumps
+    for predictor in processes:
+        predictor.invalidate('g:a:1748779500')
+    processes[0].invalidate('g')
+    assert int(fake_redis.get('split_model:version:g')) == 3
@@ -0,0 +1,64 @@
+# ai-service/tests/test_tiered_cache.py
+
+import asyncio
+import time
+
+import pytest
+
+import AI_CODE
+from AI_CODE import TieredCache
+
+
+@pytest.fixture
+def cache(fake_redis):
+    return TieredCache('test', fake_redis, ttl=60, local_ttl=30)
+
+
+def slow(value, seconds=0.05):
+    def load():
+        time.sleep(seconds)
+        return value
+    return load
+
+
+def test_sync_compute_records_recompute_time_for_early_refresh(cache):
+    assert cache.get_or_compute('k', slow({'a': 1})) == {'a': 1}
+
+    assert cache.local.get('k')['d'] >= 0.05
+
+
+def test_async_compute_records_recompute_time(cache):
+    async def load():
+        await asyncio.sleep(0.05)
+        return 7
+
+    assert asyncio.run(cache.aget_or_compute('k', load)) == 7
+    assert cache.local.get('k')['d'] >= 0.05
+
+
+def test_result_computed_across_an_invalidation_is_not_stored(cache):
+    def load():
+        cache.invalidate('k')
+        return 'old'
+
+    assert cache.get_or_compute('k', load) == 'old'
+    assert cache.local.get('k') is None
+    assert cache.redis.get(cache._key('k')) is None
+    assert cache.redis.get(cache._key('k') + ':lock') is None
+
+    started = time.monotonic()
+    assert cache.get_or_compute('k', lambda: 'new') == 'new'
+    assert time.monotonic() - started < 1
+    assert cache.metrics['lock_waits'] == 0
+
+
+def test_spending_changed_drops_only_that_users_insights(cache, monkeypatch):
+    monkeypatch.setitem(AI_CODE.CACHES, 'spending_insights', cache)
+    cache.get_or_compute('u1-30', lambda: 'u1', tags=['user:u1'])
+    cache.get_or_compute('u2-30', lambda: 'u2', tags=['user:u2'])
+
+    AI_CODE.invalidate_spending('u1')
+
+    assert cache.local.get('u1-30') is None
+    assert cache.redis.get(cache._key('u1-30')) is None
+    assert cache.get_or_compute('u2-30', lambda: 'recomputed') == 'u2'
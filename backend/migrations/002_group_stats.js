@@ -0,0 +1,107 @@
+// backend/migrations/002_group_stats.js
+// Materialised per-group stats for the AI service, kept current by triggers
+
+exports.up = async function(knex) {
+  await knex.schema.createTable('group_stats', table => {
+    table.uuid('group_id').primary().references('id').inTable('groups').onDelete('CASCADE');
+    table.integer('member_count').notNullable().defaultTo(0);
+    table.decimal('avg_member_investment', 12, 2);
+    table.jsonb('holdings').notNullable().defaultTo('[]'); // [{symbol, type, total_shares, avg_cost}]
+    table.timestamp('updated_at').defaultTo(knex.fn.now());
+  });
+
+  // Recompute one group's row and tell listeners (AI service caches) it changed
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION refresh_group_stats(target_group uuid) RETURNS void AS $$
+    BEGIN
+      IF target_group IS NULL OR NOT EXISTS (SELECT 1 FROM groups WHERE id = target_group) THEN
+        RETURN;
+      END IF;
+
+      INSERT INTO group_stats (group_id, member_count, avg_member_investment, holdings, updated_at)
+      SELECT target_group,
+             (SELECT COUNT(DISTINCT gm.user_id) FROM group_members gm WHERE gm.group_id = target_group),
+             (SELECT AVG(u.lifetime_invested)
+                FROM group_members gm JOIN users u ON u.id = gm.user_id
+               WHERE gm.group_id = target_group),
+             COALESCE((SELECT jsonb_agg(jsonb_build_object(
+                          'symbol', h.symbol, 'type', h.type,
+                          'total_shares', h.total_shares, 'avg_cost', h.avg_cost))
+                         FROM (SELECT symbol, type, SUM(shares) AS total_shares,
+                                      AVG(average_cost) AS avg_cost
+                                 FROM investments
+                                WHERE group_id = target_group
+                                GROUP BY symbol, type) h), '[]'::jsonb),
+             NOW()
+      ON CONFLICT (group_id) DO UPDATE SET
+        member_count = EXCLUDED.member_count,
+        avg_member_investment = EXCLUDED.avg_member_investment,
+        holdings = EXCLUDED.holdings,
+        updated_at = EXCLUDED.updated_at;
+
+      PERFORM pg_notify('group_stats_changed', target_group::text);
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_row_changed() RETURNS trigger AS $$
+    BEGIN
+      IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_group_stats(OLD.group_id);
+      END IF;
+      IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.group_id IS DISTINCT FROM OLD.group_id) THEN
+        PERFORM refresh_group_stats(NEW.group_id);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_user_changed() RETURNS trigger AS $$
+    BEGIN
+      PERFORM refresh_group_stats(gm.group_id) FROM group_members gm WHERE gm.user_id = NEW.id;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_settings_changed() RETURNS trigger AS $$
+    BEGIN
+      PERFORM pg_notify('group_stats_changed', NEW.id::text);
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE TRIGGER group_members_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, user_id ON group_members
+      FOR EACH ROW EXECUTE FUNCTION group_stats_row_changed();
+    CREATE TRIGGER investments_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, symbol, type, shares, average_cost ON investments
+      FOR EACH ROW EXECUTE FUNCTION group_stats_row_changed();
+    CREATE TRIGGER users_lifetime_invested_stats AFTER UPDATE OF lifetime_invested ON users
+      FOR EACH ROW WHEN (OLD.lifetime_invested IS DISTINCT FROM NEW.lifetime_invested)
+      EXECUTE FUNCTION group_stats_user_changed();
+    CREATE TRIGGER groups_settings_changed AFTER UPDATE ON groups
+      FOR EACH ROW EXECUTE FUNCTION group_settings_changed();
+  `);
+
+  // Backfill existing groups
+  await knex.raw('SELECT refresh_group_stats(id) FROM groups');
+};
+
+exports.down = async function(knex) {
+  await knex.raw('DROP TRIGGER IF EXISTS groups_settings_changed ON groups');
+  await knex.raw('DROP TRIGGER IF EXISTS users_lifetime_invested_stats ON users');
+  await knex.raw('DROP TRIGGER IF EXISTS investments_stats ON investments');
+  await knex.raw('DROP TRIGGER IF EXISTS group_members_stats ON group_members');
+  await knex.raw('DROP FUNCTION IF EXISTS group_settings_changed()');
+  await knex.raw('DROP FUNCTION IF EXISTS group_stats_user_changed()');
+  await knex.raw('DROP FUNCTION IF EXISTS group_stats_row_changed()');
+  await knex.raw('DROP FUNCTION IF EXISTS refresh_group_stats(uuid)');
+  await knex.schema.dropTableIfExists('group_stats');
+};
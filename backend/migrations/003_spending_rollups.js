@@ -0,0 +1,72 @@
+// backend/migrations/003_spending_rollups.js
+// Per-user, per-day, per-category split payment totals, maintained from transactions by trigger
+
+exports.up = async function(knex) {
+  await knex.schema.createTable('spending_daily', table => {
+    table.uuid('user_id').notNullable().references('id').inTable('users').onDelete('CASCADE');
+    table.date('day').notNullable();
+    table.string('category', 100).notNullable().defaultTo('other'); // bills.merchant_category
+    table.decimal('total', 14, 2).notNullable().defaultTo(0);
+    table.integer('txn_count').notNullable().defaultTo(0);
+    table.decimal('sum_squares', 20, 4).notNullable().defaultTo(0); // For per-transaction variance
+    table.timestamp('updated_at').defaultTo(knex.fn.now());
+
+    table.primary(['user_id', 'day', 'category']);
+  });
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION spending_rollup_apply(
+      target_user uuid, target_day date, target_bill uuid, delta numeric, sign integer
+    ) RETURNS void AS $$
+    DECLARE
+      target_category varchar(100);
+    BEGIN
+      SELECT COALESCE(b.merchant_category, 'other') INTO target_category
+        FROM bills b WHERE b.id = target_bill;
+
+      INSERT INTO spending_daily AS s (user_id, day, category, total, txn_count, sum_squares, updated_at)
+      VALUES (target_user, target_day, COALESCE(target_category, 'other'),
+              sign * delta, sign, sign * delta * delta, NOW())
+      ON CONFLICT (user_id, day, category) DO UPDATE SET
+        total = s.total + EXCLUDED.total,
+        txn_count = s.txn_count + EXCLUDED.txn_count,
+        sum_squares = s.sum_squares + EXCLUDED.sum_squares,
+        updated_at = EXCLUDED.updated_at;
+
+      DELETE FROM spending_daily
+       WHERE user_id = target_user AND day = target_day
+         AND category = COALESCE(target_category, 'other') AND txn_count <= 0;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  // Same row selection as the old raw query: split payments, bucketed by DATE(created_at)
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION spending_rollup_changed() RETURNS trigger AS $$
+    BEGIN
+      IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.type = 'split_payment' AND OLD.user_id IS NOT NULL THEN
+        PERFORM spending_rollup_apply(OLD.user_id, DATE(OLD.created_at), OLD.bill_id, OLD.amount, -1);
+      END IF;
+      IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.type = 'split_payment' AND NEW.user_id IS NOT NULL THEN
+        PERFORM spending_rollup_apply(NEW.user_id, DATE(NEW.created_at), NEW.bill_id, NEW.amount, 1);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE TRIGGER transactions_spending_rollup
+      AFTER INSERT OR DELETE OR UPDATE OF user_id, bill_id, type, amount, created_at ON transactions
+      FOR EACH ROW EXECUTE FUNCTION spending_rollup_changed();
+  `);
+
+  // Existing rows are loaded with `python jobs.py spending-rollups` in the ai-service
+};
+
+exports.down = async function(knex) {
+  await knex.raw('DROP TRIGGER IF EXISTS transactions_spending_rollup ON transactions');
+  await knex.raw('DROP FUNCTION IF EXISTS spending_rollup_changed()');
+  await knex.raw('DROP FUNCTION IF EXISTS spending_rollup_apply(uuid, date, uuid, numeric, integer)');
+  await knex.schema.dropTableIfExists('spending_daily');
+};
@@ -0,0 +1,23 @@
+// backend/migrations/004_insight_pipeline_runs.js
+// Checkpoints and metrics for the AI service's nightly batch pipelines
+
+exports.up = async function(knex) {
+  await knex.schema.createTable('insight_pipeline_runs', table => {
+    table.string('pipeline', 50).notNullable();
+    table.date('run_date').notNullable();
+    table.enum('status', ['running', 'completed', 'failed']).defaultTo('running');
+    table.uuid('last_user_id'); // Users are processed in id order; resume after this one
+    table.integer('users').defaultTo(0);
+    table.integer('insights').defaultTo(0);
+    table.jsonb('metrics').defaultTo('{}');
+    table.timestamp('started_at').defaultTo(knex.fn.now());
+    table.timestamp('updated_at').defaultTo(knex.fn.now());
+    table.timestamp('completed_at');
+
+    table.primary(['pipeline', 'run_date']);
+  });
+};
+
+exports.down = async function(knex) {
+  await knex.schema.dropTableIfExists('insight_pipeline_runs');
+};
@@ -0,0 +1,27 @@
+// backend/migrations/005_bill_completed_notify.js
+// NOTIFY bill_completed (payload: group id) so the AI service can refresh its split models
+
+exports.up = async function(knex) {
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION notify_bill_completed() RETURNS trigger AS $$
+    BEGIN
+      IF NEW.status = 'completed' AND NEW.group_id IS NOT NULL
+         AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed') THEN
+        PERFORM pg_notify('bill_completed', NEW.group_id::text);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE TRIGGER bills_completed_notify
+      AFTER INSERT OR UPDATE OF status ON bills
+      FOR EACH ROW EXECUTE FUNCTION notify_bill_completed();
+  `);
+};
+
+exports.down = async function(knex) {
+  await knex.raw('DROP TRIGGER IF EXISTS bills_completed_notify ON bills');
+  await knex.raw('DROP FUNCTION IF EXISTS notify_bill_completed()');
+};
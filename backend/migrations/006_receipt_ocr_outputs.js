@@ -0,0 +1,21 @@
+// backend/migrations/006_receipt_ocr_outputs.js
+// Raw OCR output per receipt image and OCR engine version, so receipts can be re-parsed without OCR
+
+exports.up = async function(knex) {
+  await knex.schema.createTable('receipt_ocr_outputs', table => {
+    table.string('image_hash', 64).notNullable(); // SHA-256 of the uploaded image (receipt_data.image_hash)
+    table.string('engine', 100).notNullable(); // e.g. tesseract-5.3.0-<preprocessing hash>
+    table.string('method', 30).notNullable(); // tesseract, google_vision
+    table.text('text').notNullable();
+    table.binary('words').notNullable(); // msgpack columns: text, left, top, width, height, conf, ...
+    table.integer('word_count').notNullable().defaultTo(0);
+    table.decimal('confidence', 5, 4);
+    table.timestamp('created_at').defaultTo(knex.fn.now());
+
+    table.primary(['image_hash', 'engine']);
+  });
+};
+
+exports.down = async function(knex) {
+  await knex.schema.dropTableIfExists('receipt_ocr_outputs');
+};
@@ -0,0 +1,40 @@
+// backend/migrations/007_spending_changed_notify.js
+// NOTIFY spending_changed (payload: user id) whenever a user's spending_daily rows change,
+// so the AI service can drop that user's cached spending insights
+
+const applyFunction = notify => `
+  CREATE OR REPLACE FUNCTION spending_rollup_apply(
+    target_user uuid, target_day date, target_bill uuid, delta numeric, sign integer
+  ) RETURNS void AS $$
+  DECLARE
+    target_category varchar(100);
+  BEGIN
+    SELECT COALESCE(b.merchant_category, 'other') INTO target_category
+      FROM bills b WHERE b.id = target_bill;
+
+    INSERT INTO spending_daily AS s (user_id, day, category, total, txn_count, sum_squares, updated_at)
+    VALUES (target_user, target_day, COALESCE(target_category, 'other'),
+            sign * delta, sign, sign * delta * delta, NOW())
+    ON CONFLICT (user_id, day, category) DO UPDATE SET
+      total = s.total + EXCLUDED.total,
+      txn_count = s.txn_count + EXCLUDED.txn_count,
+      sum_squares = s.sum_squares + EXCLUDED.sum_squares,
+      updated_at = EXCLUDED.updated_at;
+
+    DELETE FROM spending_daily
+     WHERE user_id = target_user AND day = target_day
+       AND category = COALESCE(target_category, 'other') AND txn_count <= 0;
+    ${notify ? `
+    -- Delivered at commit; repeats within one transaction are collapsed by Postgres
+    PERFORM pg_notify('spending_changed', target_user::text);` : ''}
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+exports.up = async function(knex) {
+  await knex.raw(applyFunction(true));
+};
+
+exports.down = async function(knex) {
+  await knex.raw(applyFunction(false));
+};
@@ -0,0 +1,288 @@
+// backend/migrations/008_group_stats_deltas.js
+// Maintain group_stats by applying each row change as a delta instead of re-aggregating the group
+
+const HOLDINGS_JSON = `
+  COALESCE((SELECT jsonb_agg(jsonb_build_object(
+               'symbol', h.symbol, 'type', NULLIF(h.type, ''),
+               'total_shares', h.total_shares, 'avg_cost', h.cost_sum / h.positions)
+             ORDER BY h.symbol, h.type)
+              FROM group_holdings h WHERE h.group_id = target_group), '[]'::jsonb)`;
+
+exports.up = async function(knex) {
+  // Running sums behind avg_member_investment (AVG skips NULL lifetime_invested)
+  await knex.schema.alterTable('group_stats', table => {
+    table.decimal('invested_sum', 16, 2).notNullable().defaultTo(0);
+    table.integer('invested_count').notNullable().defaultTo(0);
+  });
+
+  // Per-symbol running sums behind group_stats.holdings; type '' stands for NULL
+  await knex.schema.createTable('group_holdings', table => {
+    table.uuid('group_id').notNullable().references('id').inTable('groups').onDelete('CASCADE');
+    table.string('symbol', 10).notNullable();
+    table.string('type', 20).notNullable().defaultTo('');
+    table.decimal('total_shares', 18, 6).notNullable().defaultTo(0);
+    table.decimal('cost_sum', 18, 2).notNullable().defaultTo(0);
+    table.integer('positions').notNullable().defaultTo(0);
+
+    table.primary(['group_id', 'symbol', 'type']);
+  });
+
+  // Full recompute, now only used for the backfill and for a member whose user row
+  // is already gone (ON DELETE CASCADE from users)
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION refresh_group_stats(target_group uuid) RETURNS void AS $$
+    BEGIN
+      IF target_group IS NULL OR NOT EXISTS (SELECT 1 FROM groups WHERE id = target_group) THEN
+        RETURN;
+      END IF;
+
+      DELETE FROM group_holdings WHERE group_id = target_group;
+      INSERT INTO group_holdings (group_id, symbol, type, total_shares, cost_sum, positions)
+      SELECT target_group, symbol, COALESCE(type::text, ''), SUM(shares), SUM(average_cost), COUNT(*)
+        FROM investments
+       WHERE group_id = target_group
+       GROUP BY symbol, COALESCE(type::text, '');
+
+      INSERT INTO group_stats AS s (group_id, member_count, invested_sum, invested_count,
+                                    avg_member_investment, holdings, updated_at)
+      SELECT target_group, COUNT(DISTINCT gm.user_id),
+             COALESCE(SUM(u.lifetime_invested), 0), COUNT(u.lifetime_invested),
+             AVG(u.lifetime_invested), ${HOLDINGS_JSON}, NOW()
+        FROM group_members gm LEFT JOIN users u ON u.id = gm.user_id
+       WHERE gm.group_id = target_group
+      ON CONFLICT (group_id) DO UPDATE SET
+        member_count = EXCLUDED.member_count,
+        invested_sum = EXCLUDED.invested_sum,
+        invested_count = EXCLUDED.invested_count,
+        avg_member_investment = EXCLUDED.avg_member_investment,
+        holdings = EXCLUDED.holdings,
+        updated_at = EXCLUDED.updated_at;
+
+      PERFORM pg_notify('group_stats_changed', target_group::text);
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  // Add (sign = 1) or remove (sign = -1) one member's contribution
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_apply_member(target_group uuid, target_user uuid, sign integer)
+    RETURNS void AS $$
+    DECLARE
+      invested numeric;
+    BEGIN
+      IF target_group IS NULL OR target_user IS NULL THEN
+        RETURN;
+      END IF;
+      SELECT u.lifetime_invested INTO invested FROM users u WHERE u.id = target_user;
+      IF NOT FOUND THEN
+        PERFORM refresh_group_stats(target_group);
+        RETURN;
+      END IF;
+
+      INSERT INTO group_stats (group_id) SELECT id FROM groups WHERE id = target_group
+      ON CONFLICT (group_id) DO NOTHING;
+      UPDATE group_stats SET
+        member_count = member_count + sign,
+        invested_sum = invested_sum + sign * COALESCE(invested, 0),
+        invested_count = invested_count + sign * (invested IS NOT NULL)::int,
+        updated_at = NOW()
+       WHERE group_id = target_group;
+      UPDATE group_stats SET
+        avg_member_investment = CASE WHEN invested_count > 0 THEN invested_sum / invested_count END
+       WHERE group_id = target_group;
+
+      PERFORM pg_notify('group_stats_changed', target_group::text);
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  // Add or remove one investment row's shares and cost, then re-render that group's holdings
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_apply_holding(
+      target_group uuid, target_symbol varchar, target_type text, shares numeric, cost numeric, sign integer
+    ) RETURNS void AS $$
+    BEGIN
+      IF target_group IS NULL OR NOT EXISTS (SELECT 1 FROM groups WHERE id = target_group) THEN
+        RETURN;
+      END IF;
+
+      -- Serialise writers per group so the re-render below sees every committed delta
+      INSERT INTO group_stats (group_id) VALUES (target_group) ON CONFLICT (group_id) DO NOTHING;
+      PERFORM 1 FROM group_stats WHERE group_id = target_group FOR UPDATE;
+
+      INSERT INTO group_holdings AS h (group_id, symbol, type, total_shares, cost_sum, positions)
+      VALUES (target_group, target_symbol, COALESCE(target_type, ''), sign * shares, sign * cost, sign)
+      ON CONFLICT (group_id, symbol, type) DO UPDATE SET
+        total_shares = h.total_shares + EXCLUDED.total_shares,
+        cost_sum = h.cost_sum + EXCLUDED.cost_sum,
+        positions = h.positions + EXCLUDED.positions;
+      DELETE FROM group_holdings
+       WHERE group_id = target_group AND symbol = target_symbol
+         AND type = COALESCE(target_type, '') AND positions <= 0;
+
+      UPDATE group_stats SET holdings = ${HOLDINGS_JSON}, updated_at = NOW()
+       WHERE group_id = target_group;
+
+      PERFORM pg_notify('group_stats_changed', target_group::text);
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_member_changed() RETURNS trigger AS $$
+    BEGIN
+      IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM group_stats_apply_member(OLD.group_id, OLD.user_id, -1);
+      END IF;
+      IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM group_stats_apply_member(NEW.group_id, NEW.user_id, 1);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_investment_changed() RETURNS trigger AS $$
+    BEGIN
+      IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM group_stats_apply_holding(OLD.group_id, OLD.symbol, OLD.type::text,
+                                          OLD.shares, OLD.average_cost, -1);
+      END IF;
+      IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM group_stats_apply_holding(NEW.group_id, NEW.symbol, NEW.type::text,
+                                          NEW.shares, NEW.average_cost, 1);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  // Shift the running sums of every group the user belongs to by old -> new
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_user_changed() RETURNS trigger AS $$
+    BEGIN
+      UPDATE group_stats s SET
+        invested_sum = s.invested_sum - COALESCE(OLD.lifetime_invested, 0) + COALESCE(NEW.lifetime_invested, 0),
+        invested_count = s.invested_count - (OLD.lifetime_invested IS NOT NULL)::int
+                                          + (NEW.lifetime_invested IS NOT NULL)::int,
+        updated_at = NOW()
+        FROM group_members gm
+       WHERE gm.user_id = NEW.id AND s.group_id = gm.group_id;
+      UPDATE group_stats s SET
+        avg_member_investment = CASE WHEN s.invested_count > 0 THEN s.invested_sum / s.invested_count END
+        FROM group_members gm
+       WHERE gm.user_id = NEW.id AND s.group_id = gm.group_id;
+
+      PERFORM pg_notify('group_stats_changed', gm.group_id::text)
+         FROM group_members gm WHERE gm.user_id = NEW.id AND gm.group_id IS NOT NULL;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    DROP TRIGGER IF EXISTS group_members_stats ON group_members;
+    DROP TRIGGER IF EXISTS investments_stats ON investments;
+    DROP TRIGGER IF EXISTS groups_settings_changed ON groups;
+    DROP FUNCTION IF EXISTS group_stats_row_changed();
+
+    CREATE TRIGGER group_members_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, user_id ON group_members
+      FOR EACH ROW EXECUTE FUNCTION group_stats_member_changed();
+    CREATE TRIGGER investments_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, symbol, type, shares, average_cost ON investments
+      FOR EACH ROW EXECUTE FUNCTION group_stats_investment_changed();
+    CREATE TRIGGER groups_settings_changed
+      AFTER UPDATE OF name, investment_strategy, settings ON groups
+      FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name
+                         OR OLD.investment_strategy IS DISTINCT FROM NEW.investment_strategy
+                         OR OLD.settings IS DISTINCT FROM NEW.settings)
+      EXECUTE FUNCTION group_settings_changed();
+  `);
+
+  // Seed the running sums for existing groups
+  await knex.raw('SELECT refresh_group_stats(id) FROM groups');
+};
+
+exports.down = async function(knex) {
+  await knex.raw(`
+    DROP TRIGGER IF EXISTS group_members_stats ON group_members;
+    DROP TRIGGER IF EXISTS investments_stats ON investments;
+    DROP TRIGGER IF EXISTS groups_settings_changed ON groups;
+    DROP FUNCTION IF EXISTS group_stats_member_changed();
+    DROP FUNCTION IF EXISTS group_stats_investment_changed();
+    DROP FUNCTION IF EXISTS group_stats_apply_member(uuid, uuid, integer);
+    DROP FUNCTION IF EXISTS group_stats_apply_holding(uuid, varchar, text, numeric, numeric, integer);
+  `);
+
+  // Restore 002's recompute-per-row triggers
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_row_changed() RETURNS trigger AS $$
+    BEGIN
+      IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM refresh_group_stats(OLD.group_id);
+      END IF;
+      IF TG_OP IN ('INSERT', 'UPDATE') AND (TG_OP = 'INSERT' OR NEW.group_id IS DISTINCT FROM OLD.group_id) THEN
+        PERFORM refresh_group_stats(NEW.group_id);
+      END IF;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION group_stats_user_changed() RETURNS trigger AS $$
+    BEGIN
+      PERFORM refresh_group_stats(gm.group_id) FROM group_members gm WHERE gm.user_id = NEW.id;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+  await knex.raw(`
+    CREATE TRIGGER group_members_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, user_id ON group_members
+      FOR EACH ROW EXECUTE FUNCTION group_stats_row_changed();
+    CREATE TRIGGER investments_stats
+      AFTER INSERT OR DELETE OR UPDATE OF group_id, symbol, type, shares, average_cost ON investments
+      FOR EACH ROW EXECUTE FUNCTION group_stats_row_changed();
+    CREATE TRIGGER groups_settings_changed AFTER UPDATE ON groups
+      FOR EACH ROW EXECUTE FUNCTION group_settings_changed();
+  `);
+  await knex.schema.dropTableIfExists('group_holdings');
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION refresh_group_stats(target_group uuid) RETURNS void AS $$
+    BEGIN
+      IF target_group IS NULL OR NOT EXISTS (SELECT 1 FROM groups WHERE id = target_group) THEN
+        RETURN;
+      END IF;
+
+      INSERT INTO group_stats (group_id, member_count, avg_member_investment, holdings, updated_at)
+      SELECT target_group,
+             (SELECT COUNT(DISTINCT gm.user_id) FROM group_members gm WHERE gm.group_id = target_group),
+             (SELECT AVG(u.lifetime_invested)
+                FROM group_members gm JOIN users u ON u.id = gm.user_id
+               WHERE gm.group_id = target_group),
+             COALESCE((SELECT jsonb_agg(jsonb_build_object(
+                          'symbol', h.symbol, 'type', h.type,
+                          'total_shares', h.total_shares, 'avg_cost', h.avg_cost))
+                         FROM (SELECT symbol, type, SUM(shares) AS total_shares,
+                                      AVG(average_cost) AS avg_cost
+                                 FROM investments
+                                WHERE group_id = target_group
+                                GROUP BY symbol, type) h), '[]'::jsonb),
+             NOW()
+      ON CONFLICT (group_id) DO UPDATE SET
+        member_count = EXCLUDED.member_count,
+        avg_member_investment = EXCLUDED.avg_member_investment,
+        holdings = EXCLUDED.holdings,
+        updated_at = EXCLUDED.updated_at;
+
+      PERFORM pg_notify('group_stats_changed', target_group::text);
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+  await knex.schema.alterTable('group_stats', table => {
+    table.dropColumn('invested_count');
+    table.dropColumn('invested_sum');
+  });
+};
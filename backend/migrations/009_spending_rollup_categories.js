@@ -0,0 +1,127 @@
+// backend/migrations/009_spending_rollup_categories.js
+// Keep spending_daily exact when a bill is re-categorised or a range is backfilled:
+// - moving a bill's merchant_category moves its split payments to the new category
+// - writers hold a shared advisory lock that SpendingRollups.backfill takes exclusively
+//   while it rebuilds a chunk (one key, so lock order can't deadlock)
+
+const addFunction = `
+  CREATE OR REPLACE FUNCTION spending_rollup_add(
+    target_user uuid, target_day date, target_category varchar, delta_total numeric,
+    delta_count integer, delta_squares numeric
+  ) RETURNS void AS $$
+  BEGIN
+    PERFORM pg_advisory_xact_lock_shared(hashtext('spending_daily'));
+
+    INSERT INTO spending_daily AS s (user_id, day, category, total, txn_count, sum_squares, updated_at)
+    VALUES (target_user, target_day, target_category, delta_total, delta_count, delta_squares, NOW())
+    ON CONFLICT (user_id, day, category) DO UPDATE SET
+      total = s.total + EXCLUDED.total,
+      txn_count = s.txn_count + EXCLUDED.txn_count,
+      sum_squares = s.sum_squares + EXCLUDED.sum_squares,
+      updated_at = EXCLUDED.updated_at;
+
+    DELETE FROM spending_daily
+     WHERE user_id = target_user AND day = target_day
+       AND category = target_category AND txn_count <= 0;
+
+    -- Delivered at commit; repeats within one transaction are collapsed by Postgres
+    PERFORM pg_notify('spending_changed', target_user::text);
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+// FOR SHARE waits out a concurrent re-categorisation of the bill, so the row is
+// counted under the category that the move below will also see
+const applyFunction = `
+  CREATE OR REPLACE FUNCTION spending_rollup_apply(
+    target_user uuid, target_day date, target_bill uuid, delta numeric, sign integer
+  ) RETURNS void AS $$
+  DECLARE
+    target_category varchar(100);
+  BEGIN
+    SELECT b.merchant_category INTO target_category
+      FROM bills b WHERE b.id = target_bill FOR SHARE;
+
+    PERFORM spending_rollup_add(target_user, target_day, COALESCE(target_category, 'other'),
+                                sign * delta, sign, sign * delta * delta);
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+// 007's version, restored by down()
+const previousApplyFunction = `
+  CREATE OR REPLACE FUNCTION spending_rollup_apply(
+    target_user uuid, target_day date, target_bill uuid, delta numeric, sign integer
+  ) RETURNS void AS $$
+  DECLARE
+    target_category varchar(100);
+  BEGIN
+    SELECT COALESCE(b.merchant_category, 'other') INTO target_category
+      FROM bills b WHERE b.id = target_bill;
+
+    INSERT INTO spending_daily AS s (user_id, day, category, total, txn_count, sum_squares, updated_at)
+    VALUES (target_user, target_day, COALESCE(target_category, 'other'),
+            sign * delta, sign, sign * delta * delta, NOW())
+    ON CONFLICT (user_id, day, category) DO UPDATE SET
+      total = s.total + EXCLUDED.total,
+      txn_count = s.txn_count + EXCLUDED.txn_count,
+      sum_squares = s.sum_squares + EXCLUDED.sum_squares,
+      updated_at = EXCLUDED.updated_at;
+
+    DELETE FROM spending_daily
+     WHERE user_id = target_user AND day = target_day
+       AND category = COALESCE(target_category, 'other') AND txn_count <= 0;
+
+    -- Delivered at commit; repeats within one transaction are collapsed by Postgres
+    PERFORM pg_notify('spending_changed', target_user::text);
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+exports.up = async function(knex) {
+  // The re-categorisation trigger looks payments up by bill
+  await knex.raw('CREATE INDEX IF NOT EXISTS transactions_bill_id_index ON transactions (bill_id)');
+
+  await knex.raw(addFunction);
+  await knex.raw(applyFunction);
+
+  // Same row selection as spending_rollup_changed, per user and day
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION spending_rollup_bill_recategorised() RETURNS trigger AS $$
+    DECLARE
+      moved record;
+    BEGIN
+      FOR moved IN
+        SELECT t.user_id, DATE(t.created_at) AS day, SUM(t.amount) AS total,
+               COUNT(*)::int AS txn_count, SUM(t.amount * t.amount) AS sum_squares
+          FROM transactions t
+         WHERE t.bill_id = NEW.id AND t.type = 'split_payment' AND t.user_id IS NOT NULL
+         GROUP BY 1, 2
+         ORDER BY 2, 1
+      LOOP
+        PERFORM spending_rollup_add(moved.user_id, moved.day, COALESCE(OLD.merchant_category, 'other'),
+                                    -moved.total, -moved.txn_count, -moved.sum_squares);
+        PERFORM spending_rollup_add(moved.user_id, moved.day, COALESCE(NEW.merchant_category, 'other'),
+                                    moved.total, moved.txn_count, moved.sum_squares);
+      END LOOP;
+      RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE TRIGGER bills_spending_category
+      AFTER UPDATE OF merchant_category ON bills
+      FOR EACH ROW
+      WHEN (COALESCE(OLD.merchant_category, 'other') IS DISTINCT FROM COALESCE(NEW.merchant_category, 'other'))
+      EXECUTE FUNCTION spending_rollup_bill_recategorised();
+  `);
+};
+
+exports.down = async function(knex) {
+  await knex.raw('DROP TRIGGER IF EXISTS bills_spending_category ON bills');
+  await knex.raw('DROP FUNCTION IF EXISTS spending_rollup_bill_recategorised()');
+  await knex.raw(previousApplyFunction);
+  await knex.raw('DROP FUNCTION IF EXISTS spending_rollup_add(uuid, date, varchar, numeric, integer, numeric)');
+  await knex.raw('DROP INDEX IF EXISTS transactions_bill_id_index');
+};
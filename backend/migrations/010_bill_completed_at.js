@@ -0,0 +1,43 @@
+// backend/migrations/010_bill_completed_at.js
+// bills.completed_at: when the bill became completed, stamped by the database. The AI
+// service's split models learn bills by this time; COALESCE(paid_at, created_at) fell back
+// to the creation time for bills completed without paid_at
+
+exports.up = async function(knex) {
+  await knex.schema.alterTable('bills', table => {
+    table.timestamp('completed_at');
+    table.index(['group_id', 'completed_at']);
+  });
+
+  await knex.raw(`
+    UPDATE bills SET completed_at = COALESCE(paid_at, updated_at, created_at)
+     WHERE status = 'completed'
+  `);
+
+  // clock_timestamp(), not NOW(): closer to the commit in a long transaction
+  await knex.raw(`
+    CREATE OR REPLACE FUNCTION stamp_bill_completed() RETURNS trigger AS $$
+    BEGIN
+      IF NEW.status = 'completed' AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed') THEN
+        NEW.completed_at := clock_timestamp();
+      END IF;
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+  `);
+
+  await knex.raw(`
+    CREATE TRIGGER bills_stamp_completed
+      BEFORE INSERT OR UPDATE OF status ON bills
+      FOR EACH ROW EXECUTE FUNCTION stamp_bill_completed();
+  `);
+};
+
+exports.down = async function(knex) {
+  await knex.raw('DROP TRIGGER IF EXISTS bills_stamp_completed ON bills');
+  await knex.raw('DROP FUNCTION IF EXISTS stamp_bill_completed()');
+  await knex.schema.alterTable('bills', table => {
+    table.dropIndex(['group_id', 'completed_at']);
+    table.dropColumn('completed_at');
+  });
+};
@@ -0,0 +1,39 @@
+// backend/migrations/011_bill_completed_payload.js
+// bill_completed payload: group_id:bill_id:completed_at (epoch). Every AI service process
+// receives each notification; the completion id lets exactly one of them bump the group's
+// split model version in Redis
+
+const notifyFunction = `
+  CREATE OR REPLACE FUNCTION notify_bill_completed() RETURNS trigger AS $$
+  BEGIN
+    IF NEW.status = 'completed' AND NEW.group_id IS NOT NULL
+       AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed') THEN
+      -- completed_at is stamped by 010's BEFORE trigger, so a re-completion gets a new id
+      PERFORM pg_notify('bill_completed', NEW.group_id::text || ':' || NEW.id::text || ':'
+                        || EXTRACT(EPOCH FROM NEW.completed_at)::text);
+    END IF;
+    RETURN NULL;
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+// 005's version, restored by down()
+const previousNotifyFunction = `
+  CREATE OR REPLACE FUNCTION notify_bill_completed() RETURNS trigger AS $$
+  BEGIN
+    IF NEW.status = 'completed' AND NEW.group_id IS NOT NULL
+       AND (TG_OP = 'INSERT' OR OLD.status IS DISTINCT FROM 'completed') THEN
+      PERFORM pg_notify('bill_completed', NEW.group_id::text);
+    END IF;
+    RETURN NULL;
+  END;
+  $$ LANGUAGE plpgsql;
+`;
+
+exports.up = async function(knex) {
+  await knex.raw(notifyFunction);
+};
+
+exports.down = async function(knex) {
+  await knex.raw(previousNotifyFunction);
+};
@@ -490,6 +490,7 @@ app.post('/api/bills/create', authenticateToken, upload.single('receipt'), async
     const { group_id, merchant_name, items, tax_amount, tip_amount, participants } = req.body;
     
     let receiptUrl = null;
+    let receiptData = {};
     let scannedItems = JSON.parse(items || '[]');
 
     // Process receipt if uploaded
@@ -507,6 +508,7 @@ app.post('/api/bills/create', authenticateToken, upload.single('receipt'), async
             headers: formData.getHeaders(),
             timeout: 20000
           });
+          receiptData = aiResponse.data || {}; // Includes image_key of the AI service's archived copy
           if (aiResponse.data && Array.isArray(aiResponse.data.items)) {
             scannedItems = aiResponse.data.items.map((it, idx) => ({
               id: it.id || idx + 1,
@@ -551,6 +553,7 @@ app.post('/api/bills/create', authenticateToken, upload.single('receipt'), async
       tax_amount: tax_amount || 0,
       tip_amount: tip_amount || 0,
       receipt_url: receiptUrl,
+      receipt_data: JSON.stringify(receiptData),
       items: JSON.stringify(scannedItems),
       status: 'pending'
     }).returning('*');